@@ -1,22 +1,80 @@
 import logging
-from flask import Flask, request, jsonify
+import base64
+import math
+import threading
+import time
+import uuid
+from flask import Flask, request, jsonify, g, Response, stream_with_context, has_request_context
+from flask.json.provider import DefaultJSONProvider
 from models import Database, User
+from auth import TokenVerifier, require_auth, issue_token, token_expiry
+from revocation import RevocationList
+import config
+from hashing import HashingBusy
+from log_pipeline import setup_logging, elapsed_ms, logging_stats
+import metrics
+from ratelimit import RateLimiter, create_backend
+from pool import PoolTimeout
+from storage import DatabaseError, DisconnectError
+from response_cache import ResponseCache
+from outbox import create_dispatcher
+import fastjson
 import jwt
-from datetime import datetime, timedelta, timezone
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+
+
+def request_log_context():
+    # Поля текущего запроса для структурированных записей лога
+    if not has_request_context():
+        return None
+    return {
+        'request_id': g.get('request_id'),
+        'ip': request.remote_addr,
+        'route': request.url_rule.rule if request.url_rule else request.path,
+        'method': request.method
+    }
+
+
+# Настройка логирования: запись в лог не блокирует поток запроса
+setup_logging(request_log_context)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    jsonify через fastjson: orjson, если установлен, компактный вывод без
+    сортировки ключей. Нестандартные типы преобразуются так же, как во Flask.
+    """
+    def dumps(self, obj, **kwargs):
+        return fastjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(fastjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
-db = Database()
+# Подключение к базе откладывается до init_worker(): при импорте процесс ещё
+# не создан сервером (fork), а база может быть недоступна
+db = Database(connect=False)
+verifier = TokenVerifier(app.config['SECRET_KEY'])
+response_cache = ResponseCache(config.RESPONSE_CACHE_SIZE)
+# Владелец персонажа не меняется, поэтому запись кэша, как и тело ответа, не устаревает
+owner_cache = ResponseCache(config.OWNER_CACHE_SIZE)
+revocation = RevocationList(
+    db,
+    capacity=config.REVOCATION_CAPACITY,
+    error_rate=config.REVOCATION_ERROR_RATE,
+    refresh_interval=config.REVOCATION_REFRESH_INTERVAL,
+    overlap=config.REVOCATION_REFRESH_OVERLAP,
+    reconcile_interval=config.REVOCATION_RECONCILE_INTERVAL
+)
+
+# Ограничители проверяются до любых обращений к базе и хэширования
+rate_backend = create_backend(config.RATE_LIMIT_BACKEND, config.RATE_LIMIT_MAX_KEYS, config.RATE_LIMIT_REDIS_URL)
+login_ip_limiter = RateLimiter(rate_backend, 'login_ip', *config.LOGIN_IP_LIMIT)
+login_user_limiter = RateLimiter(rate_backend, 'login_user', *config.LOGIN_USER_LIMIT)
+login_failures = RateLimiter(rate_backend, 'login_failures', *config.LOGIN_LOCKOUT)
+register_ip_limiter = RateLimiter(rate_backend, 'register_ip', *config.REGISTER_IP_LIMIT)
 
 
 def log_with_ip(message, level=logging.INFO):
@@ -25,14 +83,197 @@ def log_with_ip(message, level=logging.INFO):
     logging.log(level, log_message)
 
 
+# Метрики компонентов, которые сами ведут свою статистику
+metrics.registry.add_collector("db_pool", db.pool_stats, counters={
+    "checkouts", "hits", "misses", "waits", "wait_time", "timeouts", "reconnects"})
+metrics.registry.add_collector("db_replicas", db.replica_stats, counters={
+    "replica_reads", "primary_reads", "pinned_reads", "failovers"})
+metrics.registry.add_collector("db_shards", db.shard_stats, counters={"scatters", "scatter_shards"})
+metrics.registry.add_collector("outbox", lambda: outbox_dispatcher.stats() if outbox_dispatcher else None,
+                               counters={"delivered", "batches", "failures", "send_time"})
+metrics.registry.add_collector("character_write_behind", db.write_behind_stats, counters={
+    "added", "flushes", "flushed_rows", "failures", "flush_time"})
+metrics.registry.add_collector("password_hashing", db.hasher.stats, counters={
+    "hashed", "rejected", "failed", "latency_total"})
+metrics.registry.add_collector("token_cache", verifier.cache.stats, counters={"hits", "misses", "evictions"})
+metrics.registry.add_collector("token_revocation", revocation.stats, counters={
+    "checks", "filter_positives", "revoked", "refreshes", "rebuilds", "late_rows"})
+metrics.registry.add_collector("item_catalog", db.catalog.stats, counters={
+    "hits", "misses", "loads", "evictions", "invalidations"})
+metrics.registry.add_collector("response_cache", response_cache.stats, counters={"hits", "misses", "evictions"})
+metrics.registry.add_collector("owner_cache", owner_cache.stats, counters={"hits", "misses", "evictions"})
+metrics.registry.add_collector("rate_limit", lambda: {"keys": rate_backend.size(), "evictions": getattr(rate_backend, "evictions", None)}, counters={"evictions"})
+metrics.registry.add_collector("logging", logging_stats, counters={"dropped", "sampled_out", "written", "batches"})
+
+
+def too_many_requests(retry_after, message='Too many requests'):
+    response = jsonify({'error': message})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def check_rate_limit(limiter, key):
+    """
+    Учитывает попытку и возвращает ответ 429, если лимит превышен, иначе None.
+    При недоступности общего хранилища запрос пропускается.
+    """
+    try:
+        allowed, retry_after = limiter.hit(key)
+    except Exception as err:
+        logging.error(f"Rate limiter {limiter.name} unavailable: {err}")
+        return None
+    if allowed:
+        return None
+    log_with_ip(f"Rate limit {limiter.name} exceeded for {key}", logging.WARNING)
+    return too_many_requests(retry_after)
+
+
+@app.before_request
+def start_request():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_started = time.monotonic()
+    metrics.http_in_flight.inc()
+
+
+# Процесс подключён к базе и прогрет; draining — процесс останавливается
+ready = threading.Event()
+draining = threading.Event()
+_init_lock = threading.Lock()
+# Диспетчер outbox в процессе сервера (OUTBOX_DISPATCH=1, только при одном процессе)
+outbox_dispatcher = None
+
+
+def init_worker():
+    """
+    Подключается к базе и прогревает кэши рабочего процесса. Вызывается после
+    fork (gunicorn.conf.py), а при другом способе запуска — первым запросом.
+    Если база недоступна, процесс продолжает работать и повторяет попытку
+    при следующем запросе.
+    :return: True, если процесс готов принимать запросы.
+    """
+    global outbox_dispatcher
+    if ready.is_set():
+        return True
+    with _init_lock:
+        if ready.is_set():
+            return True
+        try:
+            db.open()
+            # Соединений нужно столько, сколько потоков обслуживает запросы
+            db.warmup(connections=config.SERVER_THREADS)
+        except DatabaseError + (PoolTimeout,) as err:
+            logging.error(f"Worker initialization failed, will retry: {err}")
+            return False
+        if config.OUTBOX_DISPATCH and outbox_dispatcher is None:
+            outbox_dispatcher = create_dispatcher(db).start()
+        ready.set()
+        logging.info("Worker ready")
+        return True
+
+
+def shutdown_worker():
+    """
+    Останавливает рабочий процесс: /readyz отвечает 503, отложенные записи
+    сбрасываются, соединения и пул хэширования закрываются.
+    """
+    draining.set()
+    if outbox_dispatcher is not None:
+        outbox_dispatcher.close()
+    db.close()
+    db.hasher.shutdown()
+
+
+# Проверки состояния без базы и авторизации
+HEALTH_ENDPOINTS = {'liveness', 'readiness'}
+
+
+@app.before_request
+def ensure_ready():
+    if ready.is_set() or request.endpoint in HEALTH_ENDPOINTS:
+        return None
+    if not init_worker():
+        return jsonify({'error': 'Service temporarily unavailable'}), 503, {'Retry-After': '1'}
+    return None
+
+
+# Время последней записи клиента для read-your-writes между рабочими процессами
+LAST_WRITE_COOKIE = 'last_write'
+LAST_WRITE_HEADER = 'X-Last-Write'
+
+
+@app.before_request
+def pin_recent_writer():
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        wrote_at = float(value) if value else None
+    except ValueError:
+        wrote_at = None
+    db.pin_reads(wrote_at)
+
+
+@app.after_request
+def remember_last_write(response):
+    wrote_at = db.last_write()
+    if wrote_at is not None:
+        value = f"{wrote_at:.3f}"
+        response.headers[LAST_WRITE_HEADER] = value
+        response.set_cookie(LAST_WRITE_COOKIE, value, max_age=math.ceil(config.REPLICA_PIN_WINDOW),
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@app.after_request
+def log_request(response):
+    response.headers['X-Request-ID'] = g.request_id
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.http_latency.observe(time.monotonic() - g.request_started, route, request.method)
+    metrics.http_requests.inc(route, request.method, str(response.status_code))
+    logging.info(
+        f"{request.method} {request.path} {response.status_code}",
+        extra={'status': response.status_code, 'latency_ms': elapsed_ms(g.request_started)}
+    )
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    if 'request_started' in g:
+        metrics.http_in_flight.dec()
+
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    # Возвращаем соединение запроса в пул; сломанное соединение закрываем
+    broken = isinstance(exc, DisconnectError)
+    db.release(discard=broken)
+
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(err):
+    log_with_ip(f"Database pool exhausted: {err}", logging.ERROR)
+    return jsonify({'error': 'Service temporarily unavailable'}), 503
+
+
+@app.errorhandler(HashingBusy)
+def handle_hashing_busy(err):
+    # Очередь хэширования заполнена — отвечаем сразу, не занимая поток
+    log_with_ip(f"Password hashing saturated: {err}", logging.WARNING)
+    return jsonify({'error': 'Service temporarily unavailable'}), 503, {'Retry-After': '1'}
+
+
 # Регистрация пользователя
 @app.route('/register', methods=['POST'])
 def register():
+    limited = check_rate_limit(register_ip_limiter, request.remote_addr)
+    if limited:
+        return limited
+
     data = request.json
     username = data.get('username')
     password = data.get('password')
 
-    if not username or not password:
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
         log_with_ip("Registration attempt without username/password", logging.WARNING)
         return jsonify({'error': 'Username and password required'}), 400
 
@@ -51,28 +292,133 @@ def login():
     username = data.get('username')
     password = data.get('password')
 
-    if not username or not password:
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
         log_with_ip("Login attempt without credentials", logging.WARNING)
         return jsonify({'error': 'Credentials required'}), 400
 
+    user_key = username.lower()
+    limited = check_rate_limit(login_ip_limiter, request.remote_addr) or check_rate_limit(login_user_limiter, user_key)
+    if limited:
+        return limited
+    try:
+        locked, retry_after = login_failures.exceeded(user_key)
+    except Exception as err:
+        logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
+        locked = False
+    if locked:
+        log_with_ip(f"Login for locked account {username}", logging.WARNING)
+        return too_many_requests(retry_after, 'Account temporarily locked')
+
     user_data = db.get_user(username)
     if user_data and User(user_data['username'], user_data['password_hash']).check_password(password):
-        token = jwt.encode({
-            'username': username,
-            'exp': datetime.now(timezone.utc) + timedelta(hours=1)
-        }, app.config['SECRET_KEY'])
+        try:
+            login_failures.reset(user_key)
+        except Exception as err:
+            logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
+        token = issue_token(app.config['SECRET_KEY'], user_data['id'], username, 'access')
+        refresh_token = issue_token(app.config['SECRET_KEY'], user_data['id'], username, 'refresh')
         log_with_ip(f"User {username} logged in")
-        return jsonify({'token': token}), 200
+        return jsonify({'token': token, 'refresh_token': refresh_token}), 200
 
+    try:
+        # Неудачная попытка приближает блокировку учётной записи
+        login_failures.hit(user_key)
+    except Exception as err:
+        logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
     log_with_ip(f"Failed login for {username}", logging.WARNING)
     return jsonify({'error': 'Invalid credentials'}), 401
 
 
+# Обновление пары токенов по refresh-токену
+@app.route('/refresh', methods=['POST'])
+def refresh():
+    data = request.json or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return jsonify({'error': 'Refresh token required'}), 400
+
+    try:
+        payload = verifier.verify(refresh_token, token_type='refresh')
+    except jwt.InvalidTokenError as err:
+        log_with_ip(f"Invalid refresh token: {err}", logging.WARNING)
+        return jsonify({'error': 'Invalid refresh token'}), 401
+    if revocation.is_revoked(payload['jti']):
+        log_with_ip(f"Revoked refresh token used by {payload['username']}", logging.WARNING)
+        return jsonify({'error': 'Invalid refresh token'}), 401
+
+    # Ротация: старый refresh-токен больше не действует
+    if not revocation.revoke(payload['jti'], token_expiry(payload)):
+        return jsonify({'error': 'Refresh failed'}), 500
+    token = issue_token(app.config['SECRET_KEY'], payload['user_id'], payload['username'], 'access')
+    new_refresh_token = issue_token(app.config['SECRET_KEY'], payload['user_id'], payload['username'], 'refresh')
+    log_with_ip(f"Tokens refreshed for {payload['username']}")
+    return jsonify({'token': token, 'refresh_token': new_refresh_token}), 200
+
+
+# Выход: отзыв access-токена и, если передан, refresh-токена
+@app.route('/logout', methods=['POST'])
+@require_auth(verifier, revocation)
+def logout():
+    revoked = revocation.revoke(g.token['jti'], token_expiry(g.token))
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            payload = verifier.verify(refresh_token, token_type='refresh')
+            if payload['user_id'] == g.token['user_id']:
+                revoked = revocation.revoke(payload['jti'], token_expiry(payload)) and revoked
+        except jwt.InvalidTokenError:
+            pass
+
+    if not revoked:
+        log_with_ip(f"Logout failed for {g.token['username']}", logging.ERROR)
+        return jsonify({'error': 'Logout failed'}), 500
+    log_with_ip(f"User {g.token['username']} logged out")
+    return jsonify({'message': 'Logged out'}), 200
+
+
+# Проверка авторизации
+@app.route('/check_auth', methods=['GET'])
+@require_auth(verifier, revocation)
+def check_auth():
+    return jsonify({'user_id': g.token['user_id'], 'username': g.token['username']}), 200
+
+
+def forbid_foreign_characters(*character_ids):
+    """
+    Проверяет, что персонажи принадлежат владельцу токена (g.token['user_id']).
+    Несуществующие персонажи пропускаются: на них маршрут отвечает как раньше.
+    :return: None, если доступ разрешён, иначе ответ с ошибкой (400, 403 или 500).
+    """
+    user_id = g.token['user_id']
+    for character_id in dict.fromkeys(character_ids):
+        if not isinstance(character_id, int) or isinstance(character_id, bool):
+            return jsonify({'error': 'character_id must be an integer'}), 400
+        owner = owner_cache.get(character_id)
+        if owner is None:
+            try:
+                owner = db.get_character_owner(character_id)
+            except DatabaseError as err:
+                logging.error(f"Ошибка при проверке владельца персонажа {character_id}: {err}")
+                return jsonify({'error': 'Authorization check failed'}), 500
+            if owner is None:
+                continue
+            owner_cache.put(character_id, owner)
+        if owner != user_id:
+            log_with_ip(f"User {user_id} tried to access character {character_id}", logging.WARNING)
+            return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+
 # Создание персонажа
 @app.route('/character', methods=['POST'])
+@require_auth(verifier, revocation)
 def create_character():
     data = request.json
-    user_id = data.get('user_id')
+    # Владелец персонажа берётся из токена, а не из тела запроса
+    user_id = g.token.get('user_id')
+    if data.get('user_id') is not None and data.get('user_id') != user_id:
+        log_with_ip(f"User {user_id} tried to create character for {data.get('user_id')}", logging.WARNING)
+        return jsonify({'error': 'Forbidden'}), 403
     name = data.get('name')
     class_name = data.get('class')
     race = data.get('race')
@@ -89,19 +435,102 @@ def create_character():
         return jsonify({'error': 'Invalid name or exists'}), 400
 
 
+def versioned_response(kind, character_id, load):
+    """
+    Ответ на чтение данных персонажа с сильным ETag по его версии.
+
+    Если клиент прислал совпадающий If-None-Match, отвечаем 304, не читая
+    экипировку и предметы. Иначе тело берётся из кэша ответов по
+    (kind, character_id, версия) или строится через load() — JSON в bytes или None.
+    :return: Response или None, если персонажа нет или версию прочитать не удалось
+        (тогда маршрут отвечает как раньше).
+    """
+    try:
+        version = db.get_character_version(character_id)
+    except DatabaseError as err:
+        logging.error(f"Ошибка при чтении версии персонажа {character_id}: {err}")
+        return None
+    if version is None:
+        return None
+    etag = f"{kind}-{character_id}-{version}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        key = (kind, character_id, version)
+        body = response_cache.get(key)
+        if body is None:
+            body = load()
+            if body is None:
+                return None
+            response_cache.put(key, body)
+        response = Response(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    # Ответ зависит от владельца токена; кэш клиента обязан перепроверять его по ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# Характеристики персонажа с учётом экипировки
+@app.route('/character/<int:character_id>', methods=['GET'])
+@require_auth(verifier, revocation)
+def get_character(character_id):
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
+
+    def load():
+        character = db.get_character_with_equipment(character_id)
+        return fastjson.dumps(character) if character is not None else None
+
+    response = versioned_response('character', character_id, load)
+    if response is not None:
+        return response
+    character = db.get_character_with_equipment(character_id)
+    if character is not None:
+        return jsonify(character), 200
+    log_with_ip(f"Character {character_id} not found", logging.WARNING)
+    return jsonify({'error': 'Character not found'}), 404
+
+
+# Характеристики списка персонажей (ростер, таблица лидеров)
+@app.route('/characters/stats', methods=['POST'])
+@require_auth(verifier, revocation)
+def get_characters_stats():
+    data = request.json or {}
+    character_ids = data.get('character_ids')
+    # bool — подкласс int: true не должен читаться как персонаж 1
+    if not isinstance(character_ids, list) or not all(
+            isinstance(i, int) and not isinstance(i, bool) for i in character_ids):
+        log_with_ip("Invalid character stats request", logging.WARNING)
+        return jsonify({'error': 'character_ids must be a list of integers'}), 400
+    if len(character_ids) > 1000:
+        return jsonify({'error': 'Too many character_ids'}), 400
+
+    characters = db.get_characters_with_equipment(character_ids)
+    if characters is None:
+        return jsonify({'error': 'Stats lookup failed'}), 500
+    return jsonify([characters[i] for i in character_ids if i in characters]), 200
+
+
 # Управление экипировкой
 @app.route('/equip', methods=['POST'])
+@require_auth(verifier, revocation)
 def equip_item():
     data = request.json
     character_id = data.get('character_id')
     item_id = data.get('item_id')
     slot = data.get('slot')
+    # swap: заменить предмет, уже надетый в слот
+    swap = bool(data.get('swap', False))
 
     if not all([character_id, item_id, slot]):
         log_with_ip("Invalid equip request", logging.WARNING)
         return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
 
-    success, message = db.equip_item(character_id, item_id, slot)
+    success, message = db.equip_item(character_id, item_id, slot, swap=swap)
 
     if success:
         log_with_ip(f"Item {item_id} equipped to {slot}")
@@ -111,9 +540,41 @@ def equip_item():
         return jsonify({'error': message}), 400
 
 
+@app.route('/unequip', methods=['POST'])
+@require_auth(verifier, revocation)
+def unequip_item():
+    data = request.json
+    character_id = data.get('character_id')
+    slot = data.get('slot')
+
+    if not all([character_id, slot]):
+        log_with_ip("Invalid unequip request", logging.WARNING)
+        return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
+
+    success, message = db.unequip_item(character_id, slot)
+
+    if success:
+        log_with_ip(f"Slot {slot} unequipped for {character_id}")
+        return jsonify({'message': message}), 200
+    else:
+        log_with_ip(f"Unequip failed: {message}", logging.WARNING)
+        return jsonify({'error': message}), 400
+
+
 # Получение экипировки
 @app.route('/equipment/<int:character_id>', methods=['GET'])
+@require_auth(verifier, revocation)
 def get_equipment(character_id):
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
+    response = versioned_response('equipment', character_id, lambda: db.get_equipment_json(character_id))
+    if response is not None:
+        log_with_ip(f"Equipment fetched for {character_id} ({response.status_code})")
+        return response
     equipment = db.get_equipment(character_id)
     if equipment is not None:
         log_with_ip(f"Equipment fetched for {character_id}")
@@ -125,6 +586,7 @@ def get_equipment(character_id):
 
 # Управление инвентарём
 @app.route('/inventory/add', methods=['POST'])
+@require_auth(verifier, revocation)
 def add_to_inventory():
     data = request.json
     character_id = data.get('character_id')
@@ -134,6 +596,9 @@ def add_to_inventory():
     if not all([character_id, item_id]):
         log_with_ip("Invalid inventory add request", logging.WARNING)
         return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
 
     if db.add_item_to_inventory(character_id, item_id, quantity):
         log_with_ip(f"Added {quantity}x{item_id} to inventory")
@@ -143,6 +608,122 @@ def add_to_inventory():
         return jsonify({'error': 'Add failed'}), 400
 
 
+
+# Пакетное начисление и списание предметов (добыча, награды за задания)
+@app.route('/inventory/bulk', methods=['POST'])
+@require_auth(verifier, revocation)
+def bulk_inventory():
+    data = request.json or {}
+    changes = data.get('changes')
+
+    if not isinstance(changes, list) or not changes:
+        log_with_ip("Invalid bulk inventory request", logging.WARNING)
+        return jsonify({'error': 'changes must be a non-empty list'}), 400
+    if len(changes) > config.INVENTORY_BULK_MAX:
+        return jsonify({'error': f'Too many changes (max {config.INVENTORY_BULK_MAX})'}), 400
+    # Некорректные изменения отклоняет сама база, каждое со своим статусом
+    forbidden = forbid_foreign_characters(*(
+        change['character_id'] for change in changes
+        if isinstance(change, dict) and isinstance(change.get('character_id'), int)
+    ))
+    if forbidden is not None:
+        return forbidden
+
+    success, results = db.bulk_update_inventory(changes)
+    applied = sum(1 for r in results if r['status'] == 'ok')
+    if success:
+        log_with_ip(f"Bulk inventory update: {applied}/{len(results)} applied")
+        return jsonify({'results': results}), 200
+    else:
+        log_with_ip(f"Bulk inventory update failed ({len(results)} changes)", logging.ERROR)
+        return jsonify({'error': 'Bulk update failed', 'results': results}), 500
+
+
+def encode_cursor(character_id, item_id):
+    return base64.urlsafe_b64encode(f"{character_id}:{item_id}".encode()).decode()
+
+
+def decode_cursor(cursor, character_id):
+    """
+    Разбирает курсор страницы; курсор другого персонажа считается невалидным.
+    :return: item_id или None, если курсор некорректен.
+    """
+    try:
+        cursor_character_id, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if int(cursor_character_id) != character_id:
+            return None
+        return int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+# Инвентарь персонажа: постранично (?limit=&cursor=) или потоком (?stream=1)
+@app.route('/inventory/<int:character_id>', methods=['GET'])
+@require_auth(verifier, revocation)
+def get_inventory(character_id):
+    forbidden = forbid_foreign_characters(character_id)
+    if forbidden is not None:
+        return forbidden
+    if request.args.get('stream') in ('1', 'true'):
+        def generate():
+            yield b'['
+            try:
+                for index, item in enumerate(db.iter_inventory(character_id)):
+                    # Те же байты, что и в постраничном ответе (fastjson)
+                    yield (b',' if index else b'') + fastjson.dumps(item)
+            except DatabaseError as err:
+                # Статус уже отправлен; обрываем массив и пишем в лог
+                logging.error(f"Inventory stream failed for {character_id}: {err}")
+            yield b']'
+
+        log_with_ip(f"Inventory stream for {character_id}")
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    limit = request.args.get('limit', 100, type=int)
+    if limit < 1 or limit > config.INVENTORY_PAGE_MAX:
+        return jsonify({'error': f'limit must be between 1 and {config.INVENTORY_PAGE_MAX}'}), 400
+    after_item_id = None
+    if request.args.get('cursor'):
+        after_item_id = decode_cursor(request.args['cursor'], character_id)
+        if after_item_id is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    items, next_item_id = db.get_inventory_page_json(character_id, after_item_id, limit)
+    if items is None:
+        log_with_ip(f"Inventory error for {character_id}", logging.ERROR)
+        return jsonify({'error': 'Inventory not available'}), 500
+    next_cursor = encode_cursor(character_id, next_item_id) if next_item_id is not None else None
+    # Массив предметов уже закодирован; дописываем к нему курсор
+    body = b'{"items":' + items + b',"next_cursor":' + fastjson.dumps(next_cursor) + b'}'
+    return Response(body, status=200, mimetype='application/json')
+
+
+# Процесс жив (перезапускать не нужно), даже если база недоступна
+@app.route('/healthz', methods=['GET'])
+def liveness():
+    return jsonify({'status': 'ok'}), 200
+
+
+# Процесс готов принимать запросы: прогрет, не останавливается и база отвечает
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    if draining.is_set():
+        return jsonify({'status': 'draining'}), 503
+    if not init_worker():
+        return jsonify({'status': 'starting'}), 503
+    if not db.ping():
+        return jsonify({'status': 'database unavailable'}), 503
+    return jsonify({'status': 'ready'}), 200
+
+
+# Метрики в текстовом формате Prometheus
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+
 if __name__ == '__main__':
+    # Сервер разработки; рабочий запуск — gunicorn -c gunicorn.conf.py app:app
     logging.info("Starting server")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    init_worker()
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
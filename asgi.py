@@ -0,0 +1,407 @@
+import logging
+import time
+from functools import wraps
+
+import aiomysql
+import jwt
+from quart import Quart, request, jsonify, g, has_request_context, Response
+
+from async_models import AsyncDatabase
+from auth import TokenVerifier, TokenRevoked, bearer_token, issue_token, token_expiry
+import config
+from hashing import HashingBusy
+from log_pipeline import setup_logging
+import metrics
+from ratelimit import RateLimiter, create_backend
+from response_cache import ResponseCache
+from revocation import AsyncRevocationList
+
+# Те же маршруты, что и в app.py, но для ASGI-сервера:
+#     hypercorn asgi:app --bind 0.0.0.0:5000
+# или
+#     uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+
+def request_log_context():
+    if not has_request_context():
+        return None
+    return {'ip': request.remote_addr, 'route': request.path, 'method': request.method}
+
+
+setup_logging(request_log_context)
+
+app = Quart(__name__)
+app.config['SECRET_KEY'] = 'your_secret_key_here'
+db = AsyncDatabase()
+verifier = TokenVerifier(app.config['SECRET_KEY'])
+owner_cache = ResponseCache(config.OWNER_CACHE_SIZE)
+revocation = AsyncRevocationList(
+    db,
+    capacity=config.REVOCATION_CAPACITY,
+    error_rate=config.REVOCATION_ERROR_RATE,
+    refresh_interval=config.REVOCATION_REFRESH_INTERVAL,
+    overlap=config.REVOCATION_REFRESH_OVERLAP,
+    reconcile_interval=config.REVOCATION_RECONCILE_INTERVAL
+)
+
+# Те же ограничители, что и в app.py; при RATE_LIMIT_BACKEND=redis счётчики
+# общие с Flask-процессами
+rate_backend = create_backend(config.RATE_LIMIT_BACKEND, config.RATE_LIMIT_MAX_KEYS, config.RATE_LIMIT_REDIS_URL)
+login_ip_limiter = RateLimiter(rate_backend, 'login_ip', *config.LOGIN_IP_LIMIT)
+login_user_limiter = RateLimiter(rate_backend, 'login_user', *config.LOGIN_USER_LIMIT)
+login_failures = RateLimiter(rate_backend, 'login_failures', *config.LOGIN_LOCKOUT)
+register_ip_limiter = RateLimiter(rate_backend, 'register_ip', *config.REGISTER_IP_LIMIT)
+
+metrics.registry.add_collector("password_hashing", db.hasher.stats, counters={
+    "hashed", "rejected", "failed", "latency_total"})
+metrics.registry.add_collector("token_cache", verifier.cache.stats, counters={"hits", "misses", "evictions"})
+metrics.registry.add_collector("token_revocation", revocation.stats, counters={
+    "checks", "filter_positives", "revoked", "refreshes", "rebuilds", "late_rows"})
+metrics.registry.add_collector("owner_cache", owner_cache.stats, counters={"hits", "misses", "evictions"})
+metrics.registry.add_collector("rate_limit", lambda: {"keys": rate_backend.size(), "evictions": getattr(rate_backend, "evictions", None)}, counters={"evictions"})
+
+
+def log_with_ip(message, level=logging.INFO):
+    ip_address = request.remote_addr
+    log_message = f"{message} [IP: {ip_address}]"
+    logging.log(level, log_message)
+
+
+def too_many_requests(retry_after, message='Too many requests'):
+    return jsonify({'error': message}), 429, {'Retry-After': str(retry_after)}
+
+
+def check_rate_limit(limiter, key):
+    """
+    Учитывает попытку и возвращает ответ 429, если лимит превышен, иначе None.
+    При недоступности общего хранилища запрос пропускается.
+    """
+    try:
+        allowed, retry_after = limiter.hit(key)
+    except Exception as err:
+        logging.error(f"Rate limiter {limiter.name} unavailable: {err}")
+        return None
+    if allowed:
+        return None
+    log_with_ip(f"Rate limit {limiter.name} exceeded for {key}", logging.WARNING)
+    return too_many_requests(retry_after)
+
+
+def require_auth(view):
+    """
+    Асинхронный аналог auth.require_auth(verifier, revocation): проверяет
+    Bearer-токен и отклоняет отозванные.
+    """
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        token = bearer_token(request.headers.get("Authorization"))
+        if token is None:
+            return jsonify({'error': 'Authorization required'}), 401
+        try:
+            g.token = verifier.verify(token)
+            if await revocation.is_revoked(g.token["jti"]):
+                raise TokenRevoked("Token revoked")
+        except jwt.ExpiredSignatureError:
+            return jsonify({'error': 'Token expired'}), 401
+        except jwt.InvalidTokenError as err:
+            log_with_ip(f"Invalid token: {err}", logging.WARNING)
+            return jsonify({'error': 'Invalid token'}), 401
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+async def forbid_foreign_character(character_id):
+    """
+    Асинхронный аналог app.forbid_foreign_characters для одного персонажа.
+    :return: None, если доступ разрешён, иначе ответ с ошибкой.
+    """
+    if not isinstance(character_id, int) or isinstance(character_id, bool):
+        return jsonify({'error': 'character_id must be an integer'}), 400
+    owner = owner_cache.get(character_id)
+    if owner is None:
+        try:
+            owner = await db.get_character_owner(character_id)
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при проверке владельца персонажа {character_id}: {err}")
+            return jsonify({'error': 'Authorization check failed'}), 500
+        if owner is None:
+            return None
+        owner_cache.put(character_id, owner)
+    if owner != g.token['user_id']:
+        log_with_ip(f"User {g.token['user_id']} tried to access character {character_id}", logging.WARNING)
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+
+@app.before_request
+async def start_request():
+    g.request_started = time.monotonic()
+    metrics.http_in_flight.inc()
+
+
+@app.after_request
+async def record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.http_latency.observe(time.monotonic() - g.request_started, route, request.method)
+    metrics.http_requests.inc(route, request.method, str(response.status_code))
+    return response
+
+
+@app.teardown_request
+async def finish_request(exc):
+    if 'request_started' in g:
+        metrics.http_in_flight.dec()
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.before_serving
+async def open_database():
+    await db.connect()
+
+
+@app.after_serving
+async def close_database():
+    await db.close()
+    db.hasher.shutdown()
+
+
+@app.errorhandler(HashingBusy)
+async def handle_hashing_busy(err):
+    log_with_ip(f"Password hashing saturated: {err}", logging.WARNING)
+    return jsonify({'error': 'Service temporarily unavailable'}), 503, {'Retry-After': '1'}
+
+
+# Регистрация пользователя
+@app.route('/register', methods=['POST'])
+async def register():
+    limited = check_rate_limit(register_ip_limiter, request.remote_addr)
+    if limited:
+        return limited
+
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        log_with_ip("Registration attempt without username/password", logging.WARNING)
+        return jsonify({'error': 'Username and password required'}), 400
+
+    if await db.add_user(username, password):
+        log_with_ip(f"User {username} registered")
+        return jsonify({'message': 'User created'}), 201
+    else:
+        log_with_ip(f"Registration failed for {username}", logging.ERROR)
+        return jsonify({'error': 'Username exists'}), 400
+
+
+# Авторизация
+@app.route('/login', methods=['POST'])
+async def login():
+    data = await request.get_json()
+    username = data.get('username')
+    password = data.get('password')
+
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        log_with_ip("Login attempt without credentials", logging.WARNING)
+        return jsonify({'error': 'Credentials required'}), 400
+
+    user_key = username.lower()
+    limited = check_rate_limit(login_ip_limiter, request.remote_addr) or check_rate_limit(login_user_limiter, user_key)
+    if limited:
+        return limited
+    try:
+        locked, retry_after = login_failures.exceeded(user_key)
+    except Exception as err:
+        logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
+        locked = False
+    if locked:
+        log_with_ip(f"Login for locked account {username}", logging.WARNING)
+        return too_many_requests(retry_after, 'Account temporarily locked')
+
+    user_data = await db.get_user(username)
+    if user_data:
+        # Проверка хэша выполняется в пуле процессов и не блокирует цикл событий
+        if await db.hasher.check_password_async(user_data['password_hash'], password):
+            try:
+                login_failures.reset(user_key)
+            except Exception as err:
+                logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
+            token = issue_token(app.config['SECRET_KEY'], user_data['id'], username, 'access')
+            refresh_token = issue_token(app.config['SECRET_KEY'], user_data['id'], username, 'refresh')
+            log_with_ip(f"User {username} logged in")
+            return jsonify({'token': token, 'refresh_token': refresh_token}), 200
+
+    try:
+        # Неудачная попытка приближает блокировку учётной записи
+        login_failures.hit(user_key)
+    except Exception as err:
+        logging.error(f"Rate limiter {login_failures.name} unavailable: {err}")
+    log_with_ip(f"Failed login for {username}", logging.WARNING)
+    return jsonify({'error': 'Invalid credentials'}), 401
+
+
+# Обновление пары токенов по refresh-токену
+@app.route('/refresh', methods=['POST'])
+async def refresh():
+    data = await request.get_json() or {}
+    refresh_token = data.get('refresh_token')
+    if not refresh_token:
+        return jsonify({'error': 'Refresh token required'}), 400
+
+    try:
+        payload = verifier.verify(refresh_token, token_type='refresh')
+    except jwt.InvalidTokenError as err:
+        log_with_ip(f"Invalid refresh token: {err}", logging.WARNING)
+        return jsonify({'error': 'Invalid refresh token'}), 401
+    if await revocation.is_revoked(payload['jti']):
+        log_with_ip(f"Revoked refresh token used by {payload['username']}", logging.WARNING)
+        return jsonify({'error': 'Invalid refresh token'}), 401
+
+    # Ротация: старый refresh-токен больше не действует
+    if not await revocation.revoke(payload['jti'], token_expiry(payload)):
+        return jsonify({'error': 'Refresh failed'}), 500
+    token = issue_token(app.config['SECRET_KEY'], payload['user_id'], payload['username'], 'access')
+    new_refresh_token = issue_token(app.config['SECRET_KEY'], payload['user_id'], payload['username'], 'refresh')
+    log_with_ip(f"Tokens refreshed for {payload['username']}")
+    return jsonify({'token': token, 'refresh_token': new_refresh_token}), 200
+
+
+# Выход: отзыв access-токена и, если передан, refresh-токена
+@app.route('/logout', methods=['POST'])
+@require_auth
+async def logout():
+    revoked = await revocation.revoke(g.token['jti'], token_expiry(g.token))
+    refresh_token = (await request.get_json(silent=True) or {}).get('refresh_token')
+    if refresh_token:
+        try:
+            payload = verifier.verify(refresh_token, token_type='refresh')
+            if payload['user_id'] == g.token['user_id']:
+                revoked = await revocation.revoke(payload['jti'], token_expiry(payload)) and revoked
+        except jwt.InvalidTokenError:
+            pass
+
+    if not revoked:
+        log_with_ip(f"Logout failed for {g.token['username']}", logging.ERROR)
+        return jsonify({'error': 'Logout failed'}), 500
+    log_with_ip(f"User {g.token['username']} logged out")
+    return jsonify({'message': 'Logged out'}), 200
+
+
+# Создание персонажа
+@app.route('/character', methods=['POST'])
+@require_auth
+async def create_character():
+    data = await request.get_json()
+    user_id = g.token.get('user_id')
+    if data.get('user_id') is not None and data.get('user_id') != user_id:
+        log_with_ip(f"User {user_id} tried to create character for {data.get('user_id')}", logging.WARNING)
+        return jsonify({'error': 'Forbidden'}), 403
+    name = data.get('name')
+    class_name = data.get('class')
+    race = data.get('race')
+
+    if not all([user_id, name, class_name, race]):
+        log_with_ip("Invalid character creation request", logging.WARNING)
+        return jsonify({'error': 'Missing parameters'}), 400
+
+    if await db.create_character(user_id, name, class_name, race):
+        log_with_ip(f"Character {name} created for user {user_id}")
+        return jsonify({'message': 'Character created'}), 201
+    else:
+        log_with_ip(f"Character creation failed for {name}", logging.ERROR)
+        return jsonify({'error': 'Invalid name or exists'}), 400
+
+
+# Управление экипировкой
+@app.route('/equip', methods=['POST'])
+@require_auth
+async def equip_item():
+    data = await request.get_json()
+    character_id = data.get('character_id')
+    item_id = data.get('item_id')
+    slot = data.get('slot')
+    swap = bool(data.get('swap', False))
+
+    if not all([character_id, item_id, slot]):
+        log_with_ip("Invalid equip request", logging.WARNING)
+        return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = await forbid_foreign_character(character_id)
+    if forbidden is not None:
+        return forbidden
+
+    success, message = await db.equip_item(character_id, item_id, slot, swap=swap)
+
+    if success:
+        log_with_ip(f"Item {item_id} equipped to {slot}")
+        return jsonify({'message': message}), 200
+    else:
+        log_with_ip(f"Equip failed: {message}", logging.WARNING)
+        return jsonify({'error': message}), 400
+
+
+@app.route('/unequip', methods=['POST'])
+@require_auth
+async def unequip_item():
+    data = await request.get_json()
+    character_id = data.get('character_id')
+    slot = data.get('slot')
+
+    if not all([character_id, slot]):
+        log_with_ip("Invalid unequip request", logging.WARNING)
+        return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = await forbid_foreign_character(character_id)
+    if forbidden is not None:
+        return forbidden
+
+    success, message = await db.unequip_item(character_id, slot)
+
+    if success:
+        log_with_ip(f"Slot {slot} unequipped for {character_id}")
+        return jsonify({'message': message}), 200
+    else:
+        log_with_ip(f"Unequip failed: {message}", logging.WARNING)
+        return jsonify({'error': message}), 400
+
+
+# Получение экипировки
+@app.route('/equipment/<int:character_id>', methods=['GET'])
+@require_auth
+async def get_equipment(character_id):
+    forbidden = await forbid_foreign_character(character_id)
+    if forbidden is not None:
+        return forbidden
+    equipment = await db.get_equipment(character_id)
+    if equipment is not None:
+        log_with_ip(f"Equipment fetched for {character_id}")
+        return jsonify(equipment), 200
+    else:
+        log_with_ip(f"Equipment error for {character_id}", logging.ERROR)
+        return jsonify({'error': 'Equipment not found'}), 404
+
+
+# Управление инвентарём
+@app.route('/inventory/add', methods=['POST'])
+@require_auth
+async def add_to_inventory():
+    data = await request.get_json()
+    character_id = data.get('character_id')
+    item_id = data.get('item_id')
+    quantity = data.get('quantity', 1)
+
+    if not all([character_id, item_id]):
+        log_with_ip("Invalid inventory add request", logging.WARNING)
+        return jsonify({'error': 'Missing parameters'}), 400
+    forbidden = await forbid_foreign_character(character_id)
+    if forbidden is not None:
+        return forbidden
+
+    if await db.add_item_to_inventory(character_id, item_id, quantity):
+        log_with_ip(f"Added {quantity}x{item_id} to inventory")
+        return jsonify({'message': 'Items added'}), 200
+    else:
+        log_with_ip(f"Failed to add {item_id}", logging.ERROR)
+        return jsonify({'error': 'Add failed'}), 400
@@ -0,0 +1,532 @@
+import logging
+
+import aiomysql
+
+import config
+from hashing import default_hasher
+from metrics import instrument_methods
+from models import (
+    Database, validate_character_name, validate_slot, stats_delta_query, outbox_query, character_from_row,
+    CHARACTER_COLUMNS, STAT_NAMES, LOCK_CHARACTER_QUERY, BUMP_VERSION_QUERY, EQUIP_STATE_QUERY, SLOT_ITEM_QUERY
+)
+
+# Код ошибки MySQL ER_DUP_ENTRY
+_DUPLICATE_ENTRY = 1062
+
+
+class AsyncDatabase:
+    """
+    Асинхронный вариант Database поверх aiomysql со своим пулом соединений.
+    Методы повторяют Database, но являются корутинами; каждое обращение
+    берёт соединение из пула только на время операции.
+    """
+    def __init__(self, pool_size=None, hasher=None):
+        self.pool_size = pool_size if pool_size is not None else config.DB_ASYNC_POOL_SIZE
+        self.hasher = hasher or default_hasher()
+        self.outbox_enabled = config.OUTBOX_ENABLED
+        self.pool = None
+
+    async def connect(self):
+        if config.DB_SHARDS:
+            # Маршрутизация по шардам есть только в Database
+            raise ValueError("Асинхронный вариант не поддерживает шардирование (DB_SHARDS)")
+        try:
+            connect_args = config.db_connect_args()
+            self.pool = await aiomysql.create_pool(
+                host=connect_args["host"],
+                user=connect_args["user"],
+                password=connect_args["password"],
+                db=connect_args["database"],
+                minsize=1,
+                maxsize=self.pool_size,
+                pool_recycle=int(config.DB_POOL_PING_INTERVAL) or -1,
+                autocommit=False
+            )
+            logging.info(f"Асинхронный пул соединений с базой данных создан (размер: {self.pool_size}).")
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка подключения к базе данных: {err}")
+            raise
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            logging.info("Асинхронный пул соединений с базой данных закрыт.")
+
+    async def _fetchone(self, query, params):
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                result = await cursor.fetchone()
+            await connection.rollback()
+            return result
+
+    async def _fetchall(self, query, params):
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                result = await cursor.fetchall()
+            await connection.rollback()
+            return result
+
+    async def _execute(self, query, params, events=(), bump=None):
+        """
+        Выполняет запрос и добавляет события outbox одной транзакцией.
+        :param bump: ID персонажа, чью версию увеличить до запроса (блокирует
+            строку персонажа первой, как Database).
+        """
+        async with self.pool.acquire() as connection:
+            try:
+                async with connection.cursor() as cursor:
+                    if bump is not None:
+                        await cursor.execute(BUMP_VERSION_QUERY, (bump,))
+                    await cursor.execute(query, params)
+                    await self._append_events(cursor, events)
+                await connection.commit()
+            except aiomysql.Error:
+                await connection.rollback()
+                raise
+
+    async def _append_events(self, cursor, events):
+        """
+        Добавляет события в outbox текущей транзакции, как Database._append_events.
+        """
+        if not events or not self.outbox_enabled:
+            return
+        # Блокировка строки персонажа упорядочивает ID его событий по commit'ам
+        for character_id in sorted({event[0] for event in events}):
+            await cursor.execute(LOCK_CHARACTER_QUERY, (character_id,))
+            await cursor.fetchall()
+        await cursor.execute(*outbox_query(events))
+
+    async def add_user(self, username, password, ip_address=None):
+        password_hash = await self.hasher.hash_password_async(password)
+        try:
+            await self._execute(
+                "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+                (username, password_hash)
+            )
+            if ip_address:
+                logging.info(f"Пользователь {username} успешно зарегистрирован [IP: {ip_address}]")
+            else:
+                logging.info(f"Пользователь {username} успешно зарегистрирован")
+            return True
+        except aiomysql.Error as err:
+            if ip_address:
+                logging.error(f"Ошибка при регистрации пользователя {username} [IP: {ip_address}]: {err}")
+            else:
+                logging.error(f"Ошибка при регистрации пользователя {username}: {err}")
+            return False
+
+    async def get_user(self, username):
+        result = await self._fetchone(
+            "SELECT id, username, password_hash FROM users WHERE username = %s", (username,)
+        )
+        if result:
+            return {"id": result[0], "username": result[1], "password_hash": result[2]}
+        return None
+
+    async def revoke_token(self, jti, expires_at):
+        try:
+            await self._execute(
+                "INSERT INTO revoked_tokens (jti, expires_at) VALUES (%s, %s) ON DUPLICATE KEY UPDATE jti = jti",
+                (jti, expires_at)
+            )
+            return True
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при отзыве токена {jti}: {err}")
+            return False
+
+    async def is_token_revoked(self, jti):
+        return await self._fetchone("SELECT 1 FROM revoked_tokens WHERE jti = %s", (jti,)) is not None
+
+    async def get_revoked_tokens_since(self, last_id):
+        return await self._fetchall(
+            "SELECT id, jti FROM revoked_tokens WHERE id > %s AND expires_at > UTC_TIMESTAMP() ORDER BY id",
+            (last_id,)
+        )
+
+    async def purge_revoked_tokens(self):
+        try:
+            await self._execute("DELETE FROM revoked_tokens WHERE expires_at <= UTC_TIMESTAMP()", ())
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при очистке отозванных токенов: {err}")
+
+    async def is_character_name_unique(self, name):
+        result = await self._fetchone("SELECT id FROM characters WHERE name = %s", (name,))
+        return result is None
+
+    async def create_character(self, user_id, name, class_name, race, level=1, health=100, mana=50, strength=10, agility=10, intelligence=10, xp=0, gold=0):
+        if not validate_character_name(name):
+            logging.warning(f"Невалидное имя персонажа: {name}")
+            return False
+
+        # Уникальность имени проверяет уникальный индекс characters.name
+        try:
+            await self._execute(
+                "INSERT INTO characters (user_id, name, class, race, level, health, mana, strength, agility, intelligence, xp, gold) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                (user_id, name, class_name, race, level, health, mana, strength, agility, intelligence, xp, gold)
+            )
+            return True
+        except aiomysql.IntegrityError as err:
+            if err.args and err.args[0] == _DUPLICATE_ENTRY:
+                logging.warning(f"Имя персонажа уже занято: {name}")
+            else:
+                logging.error(f"Ошибка при создании персонажа {name}: {err}")
+            return False
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при создании персонажа {name}: {err}")
+            return False
+
+    async def get_character(self, user_id):
+        result = await self._fetchone("SELECT * FROM characters WHERE user_id = %s", (user_id,))
+        if result:
+            return {
+                "id": result[0],
+                "user_id": result[1],
+                "name": result[2],
+                "class": result[3],
+                "race": result[4],
+                "level": result[5],
+                "health": result[6],
+                "mana": result[7],
+                "strength": result[8],
+                "agility": result[9],
+                "intelligence": result[10],
+                "xp": result[11],
+                "gold": result[12]
+            }
+        return None
+
+    async def get_character_owner(self, character_id):
+        """
+        Возвращает user_id владельца персонажа или None, если персонажа нет.
+        """
+        result = await self._fetchone("SELECT user_id FROM characters WHERE id = %s", (character_id,))
+        return result[0] if result else None
+
+    async def update_character(self, character_id, name=None, class_name=None, race=None, level=None, health=None, mana=None, strength=None, agility=None, intelligence=None, xp=None, gold=None):
+        if name is not None:
+            if not validate_character_name(name):
+                logging.warning(f"Невалидное имя персонажа: {name}")
+                return False
+
+        fields = {
+            "name": name, "class": class_name, "race": race, "level": level,
+            "health": health, "mana": mana, "strength": strength, "agility": agility,
+            "intelligence": intelligence, "xp": xp, "gold": gold
+        }
+        updates = [f"{column} = %s" for column, value in fields.items() if value is not None]
+        if not updates:
+            return False
+        params = [value for value in fields.values() if value is not None]
+        updates.append("version = version + 1")
+        params.append(character_id)
+        try:
+            await self._execute(f"UPDATE characters SET {', '.join(updates)} WHERE id = %s", tuple(params))
+            return True
+        except aiomysql.IntegrityError as err:
+            if err.args and err.args[0] == _DUPLICATE_ENTRY:
+                logging.warning(f"Имя персонажа уже занято: {name}")
+            else:
+                logging.error(f"Ошибка при обновлении персонажа {character_id}: {err}")
+            return False
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при обновлении персонажа {character_id}: {err}")
+            return False
+
+    async def add_item(self, name, description, item_type, weight=0, value=0):
+        try:
+            await self._execute(
+                "INSERT INTO items (name, description, type, weight, value) VALUES (%s, %s, %s, %s, %s)",
+                (name, description, item_type, weight, value)
+            )
+            return True
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при добавлении предмета {name}: {err}")
+            return False
+
+    async def get_item(self, item_id):
+        result = await self._fetchone("SELECT * FROM items WHERE id = %s", (item_id,))
+        if result:
+            return {
+                "id": result[0],
+                "name": result[1],
+                "description": result[2],
+                "type": result[3],
+                "weight": result[4],
+                "value": result[5]
+            }
+        return None
+
+    async def add_item_to_inventory(self, character_id, item_id, quantity=1):
+        try:
+            await self._execute(
+                "INSERT INTO inventory (character_id, item_id, quantity) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE quantity = quantity + %s",
+                (character_id, item_id, quantity, quantity),
+                events=[(character_id, "inventory_add", {"item_id": item_id, "quantity": quantity})],
+                bump=character_id
+            )
+            return True
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при добавлении предмета {item_id} в инвентарь персонажа {character_id}: {err}")
+            return False
+
+    async def remove_item_from_inventory(self, character_id, item_id, quantity=1):
+        try:
+            async with self.pool.acquire() as connection:
+                try:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(BUMP_VERSION_QUERY, (character_id,))
+                        await cursor.execute(
+                            "UPDATE inventory SET quantity = quantity - %s WHERE character_id = %s AND item_id = %s",
+                            (quantity, character_id, item_id)
+                        )
+                        await cursor.execute(
+                            "DELETE FROM inventory WHERE character_id = %s AND item_id = %s AND quantity <= 0",
+                            (character_id, item_id)
+                        )
+                        await self._append_events(cursor, [
+                            (character_id, "inventory_remove", {"item_id": item_id, "quantity": quantity})])
+                    await connection.commit()
+                except aiomysql.Error:
+                    await connection.rollback()
+                    raise
+            return True
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при удалении предмета {item_id} из инвентаря персонажа {character_id}: {err}")
+            return False
+
+    async def get_inventory(self, character_id):
+        try:
+            result = await self._fetchall(
+                "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, inventory.quantity "
+                "FROM inventory "
+                "JOIN items ON inventory.item_id = items.id "
+                "WHERE inventory.character_id = %s",
+                (character_id,)
+            )
+            return [{
+                "id": row[0],
+                "name": row[1],
+                "description": row[2],
+                "type": row[3],
+                "weight": row[4],
+                "value": row[5],
+                "quantity": row[6]
+            } for row in result]
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при получении инвентаря персонажа {character_id}: {err}")
+            return None
+
+    async def get_equipment(self, character_id):
+        try:
+            result = await self._fetchall(
+                "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, equipment.slot "
+                "FROM equipment "
+                "JOIN items ON equipment.item_id = items.id "
+                "WHERE equipment.character_id = %s",
+                (character_id,)
+            )
+            return [{
+                "id": row[0],
+                "name": row[1],
+                "description": row[2],
+                "type": row[3],
+                "weight": row[4],
+                "value": row[5],
+                "slot": row[6]
+            } for row in result]
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при получении экипировки персонажа {character_id}: {err}")
+            return None
+
+    async def get_item_stats(self, item_id):
+        result = await self._fetchone("SELECT * FROM item_stats WHERE item_id = %s", (item_id,))
+        if result:
+            return {
+                "item_id": result[0],
+                "strength": result[1],
+                "agility": result[2],
+                "intelligence": result[3],
+                "health": result[4],
+                "mana": result[5]
+            }
+        return None
+
+    @staticmethod
+    async def _item_entries(cursor, item_ids):
+        """
+        Читает тип и характеристики предметов: item_id -> (type, stats).
+        """
+        await cursor.execute(
+            "SELECT items.id, items.type, item_stats.strength, item_stats.agility, item_stats.intelligence, "
+            "item_stats.health, item_stats.mana "
+            "FROM items LEFT JOIN item_stats ON item_stats.item_id = items.id "
+            f"WHERE items.id IN ({', '.join(['%s'] * len(item_ids))})",
+            tuple(item_ids)
+        )
+        entries = {}
+        for row in await cursor.fetchall():
+            stats = dict(zip(STAT_NAMES, row[2:7])) if row[2] is not None else None
+            entries[row[0]] = (row[1], stats)
+        return entries
+
+    async def apply_item_stats(self, character_id, item_id, operation="add"):
+        """
+        Применяет или снимает характеристики предмета.
+        :param operation: "add" для добавления, "subtract" для снятия.
+        """
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                entries = await self._item_entries(cursor, [item_id])
+                stats = entries.get(item_id, (None, None))[1]
+                if not stats:
+                    await connection.rollback()
+                    return False
+                if operation == "add":
+                    update = stats_delta_query(character_id, added=stats)
+                else:
+                    update = stats_delta_query(character_id, removed=stats)
+                if update:
+                    await cursor.execute(*update)
+                    await cursor.execute(BUMP_VERSION_QUERY, (character_id,))
+            await connection.commit()
+            return True
+
+    async def equip_item(self, character_id, item_id, slot, swap=False):
+        """
+        Экипирует предмет на персонажа и применяет его характеристики
+        одной транзакцией под блокировкой строки персонажа.
+        :return: Пара (успех, сообщение).
+        """
+        try:
+            async with self.pool.acquire() as connection:
+                try:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(LOCK_CHARACTER_QUERY, (character_id,))
+                        if await cursor.fetchone() is None:
+                            await connection.rollback()
+                            return False, "Character not found"
+
+                        await cursor.execute(
+                            EQUIP_STATE_QUERY,
+                            (character_id, item_id, character_id, item_id, character_id, slot)
+                        )
+                        quantity, equipped, current_item_id = await cursor.fetchone()
+                        entries = await self._item_entries(cursor, [i for i in (item_id, current_item_id) if i is not None])
+                        message = None
+                        if item_id not in entries:
+                            message = "Item not found"
+                        elif not validate_slot(entries[item_id][0], slot):
+                            message = f"Invalid slot {slot} for {entries[item_id][0]}"
+                        elif current_item_id == item_id:
+                            message = "Item already equipped"
+                        elif current_item_id is not None and not swap:
+                            message = "Slot already occupied"
+                        elif not quantity or quantity <= equipped:
+                            message = "Item not in inventory"
+                        if message:
+                            await connection.rollback()
+                            return False, message
+
+                        removed = entries.get(current_item_id, (None, None))[1]
+                        update = stats_delta_query(character_id, added=entries[item_id][1], removed=removed)
+                        if update:
+                            await cursor.execute(*update)
+                        await cursor.execute(
+                            "INSERT INTO equipment (character_id, item_id, slot) VALUES (%s, %s, %s) "
+                            "ON DUPLICATE KEY UPDATE item_id = VALUES(item_id)",
+                            (character_id, item_id, slot)
+                        )
+                        await cursor.execute(BUMP_VERSION_QUERY, (character_id,))
+                        await self._append_events(cursor, [(character_id, "equip", {
+                            "item_id": item_id, "slot": slot, "replaced_item_id": current_item_id})])
+                    await connection.commit()
+                except aiomysql.Error:
+                    await connection.rollback()
+                    raise
+            logging.info(f"Предмет {item_id} экипирован в слот {slot} для персонажа {character_id}")
+            return True, "Item equipped"
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при экипировке предмета {item_id} для персонажа {character_id}: {err}")
+            return False, "Database error"
+
+    async def unequip_item(self, character_id, slot):
+        """
+        Снимает предмет с персонажа и убирает его характеристики.
+        :return: Пара (успех, сообщение).
+        """
+        try:
+            async with self.pool.acquire() as connection:
+                try:
+                    async with connection.cursor() as cursor:
+                        await cursor.execute(LOCK_CHARACTER_QUERY, (character_id,))
+                        if await cursor.fetchone() is None:
+                            await connection.rollback()
+                            return False, "Character not found"
+
+                        await cursor.execute(SLOT_ITEM_QUERY, (character_id, slot))
+                        result = await cursor.fetchone()
+                        if not result:
+                            logging.warning(f"Слот {slot} пуст для персонажа {character_id}")
+                            await connection.rollback()
+                            return False, "Slot is empty"
+
+                        item_id = result[0]
+                        entries = await self._item_entries(cursor, [item_id])
+                        update = stats_delta_query(character_id, removed=entries.get(item_id, (None, None))[1])
+                        if update:
+                            await cursor.execute(*update)
+                        await cursor.execute(
+                            "DELETE FROM equipment WHERE character_id = %s AND slot = %s",
+                            (character_id, slot)
+                        )
+                        await cursor.execute(BUMP_VERSION_QUERY, (character_id,))
+                        await self._append_events(cursor, [(character_id, "unequip", {"item_id": item_id, "slot": slot})])
+                    await connection.commit()
+                except aiomysql.Error:
+                    await connection.rollback()
+                    raise
+            logging.info(f"Предмет {item_id} снят со слота {slot} для персонажа {character_id}")
+            return True, "Item unequipped"
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при снятии предмета со слота {slot} для персонажа {character_id}: {err}")
+            return False, "Database error"
+
+    async def get_characters_with_equipment(self, character_ids):
+        """
+        Возвращает характеристики нескольких персонажей с учётом экипировки
+        (бонусы предметов уже внесены в колонки characters при экипировке).
+        :return: Словарь ID персонажа -> характеристики.
+        """
+        ids = list(dict.fromkeys(character_ids))
+        characters = {}
+        try:
+            for start in range(0, len(ids), Database._BATCH_SIZE):
+                chunk = ids[start:start + Database._BATCH_SIZE]
+                rows = await self._fetchall(
+                    f"SELECT {CHARACTER_COLUMNS} FROM characters WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                    tuple(chunk)
+                )
+                for row in rows:
+                    characters[row[0]] = character_from_row(row)
+            return characters
+        except aiomysql.Error as err:
+            logging.error(f"Ошибка при получении характеристик персонажей {ids[:10]}: {err}")
+            return None
+
+    async def get_character_with_equipment(self, character_id):
+        """
+        Возвращает характеристики персонажа с учётом экипированных предметов.
+        """
+        characters = await self.get_characters_with_equipment([character_id])
+        if not characters:
+            return None
+        return characters.get(character_id)
+
+
+instrument_methods(AsyncDatabase, skip={"connect", "close"})
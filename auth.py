@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import jwt
+from flask import request, jsonify, g
+
+import config
+
+
+class TokenCache:
+    """
+    Ограниченный LRU-кэш уже проверенных токенов.
+
+    Ключ — SHA-256 от токена, значение — декодированный payload. Запись
+    живёт не дольше поля exp самого токена.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # хэш токена -> (payload, exp)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, exp = entry
+                if exp is None or exp > time.time():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return payload
+                del self._entries[key]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, payload):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (payload, payload.get("exp"))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Возвращает метрики кэша, включая долю попаданий.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["max_size"] = self.max_size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class TokenRevoked(jwt.InvalidTokenError):
+    """
+    Токен отозван (logout или ротация refresh-токена).
+    """
+
+
+def issue_token(secret_key, user_id, username, token_type="access", expires_in=None):
+    """
+    Выпускает access- или refresh-токен с уникальным jti.
+    :param token_type: "access" или "refresh".
+    :param expires_in: Время жизни в секундах; по умолчанию из config.
+    :return: JWT-токен.
+    """
+    if expires_in is None:
+        expires_in = config.ACCESS_TOKEN_TTL if token_type == "access" else config.REFRESH_TOKEN_TTL
+    payload = {
+        'user_id': user_id,
+        'username': username,
+        'type': token_type,
+        'jti': uuid.uuid4().hex,
+        'exp': datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    }
+    return jwt.encode(payload, secret_key, algorithm='HS256')
+
+
+def token_expiry(payload):
+    """
+    Возвращает время истечения токена в UTC без часового пояса (для DATETIME).
+    """
+    return datetime.fromtimestamp(payload["exp"], timezone.utc).replace(tzinfo=None)
+
+
+class TokenVerifier:
+    """
+    Проверяет JWT без обращения к базе данных.
+    """
+    def __init__(self, secret_key, algorithms=("HS256",), cache=None):
+        self.secret_key = secret_key
+        self.algorithms = list(algorithms)
+        self.cache = cache if cache is not None else TokenCache(config.TOKEN_CACHE_SIZE)
+
+    def verify(self, token, token_type="access"):
+        """
+        Проверяет подпись, срок действия и тип токена.
+        :param token: JWT-токен.
+        :param token_type: Ожидаемый тип: "access" или "refresh".
+        :return: Декодированный payload.
+        :raises jwt.InvalidTokenError: Если токен недействителен.
+        """
+        key = self.cache.key(token)
+        payload = self.cache.get(key)
+        if payload is None:
+            payload = jwt.decode(token, self.secret_key, algorithms=self.algorithms,
+                                 options={"require": ["exp", "jti", "type"]})
+            self.cache.put(key, payload)
+        if payload["type"] != token_type:
+            raise jwt.InvalidTokenError(f"Expected {token_type} token")
+        return payload
+
+
+def bearer_token(header):
+    """
+    Достаёт токен из заголовка "Authorization: Bearer <token>".
+    :return: Токен или None.
+    """
+    if not header:
+        return None
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+def require_auth(verifier, revocation=None):
+    """
+    Декоратор маршрута Flask: пропускает запрос только с действительным
+    Bearer-токеном и кладёт его payload в g.token.
+    :param revocation: RevocationList; если задан, отозванные токены отклоняются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            token = bearer_token(request.headers.get("Authorization"))
+            if token is None:
+                return jsonify({'error': 'Authorization required'}), 401
+            try:
+                g.token = verifier.verify(token)
+                if revocation is not None and revocation.is_revoked(g.token["jti"]):
+                    raise TokenRevoked("Token revoked")
+            except jwt.ExpiredSignatureError:
+                return jsonify({'error': 'Token expired'}), 401
+            except jwt.InvalidTokenError as err:
+                logging.warning(f"Invalid token [IP: {request.remote_addr}]: {err}")
+                return jsonify({'error': 'Invalid token'}), 401
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,318 @@
+"""
+Нагрузочный тест сервера по HTTP: смешанная нагрузка из нескольких сценариев,
+задержки p50/p95/p99 и RPS по маршрутам, сравнение с базовым прогоном.
+
+    python -m bench.seed --database auth_server_bench
+    DB_NAME=auth_server_bench LOGIN_IP_LIMIT=1000000 LOGIN_USER_LIMIT=1000000 REGISTER_IP_LIMIT=1000000 python app.py
+    python -m bench.loadtest --workload mixed --duration 60 --concurrency 32 --baseline bench/baseline.json
+
+Все запросы идут с одного адреса, поэтому ограничители /login и /register
+на время теста нужно ослабить (LOGIN_IP_LIMIT, LOGIN_USER_LIMIT, REGISTER_IP_LIMIT).
+Код возврата 1 — есть регрессия относительно базового прогона.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from bench.seed import BENCH_PASSWORD, connect
+from models import ITEM_SLOTS
+
+# Доли сценариев в нагрузке
+WORKLOADS = {
+    "mixed": {"login": 0.15, "equip": 0.25, "inventory": 0.5, "register": 0.1},
+    "login_storm": {"login": 1.0},
+    "equip_churn": {"equip": 1.0},
+    "inventory_reads": {"inventory": 1.0},
+    "registrations": {"register": 1.0},
+}
+PERCENTILES = (50, 95, 99)
+
+
+class Client:
+    """
+    HTTP-клиент одного потока нагрузки: держит соединение и переподключается при обрыве.
+    """
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, body=None, token=None):
+        """
+        :return: Тройка (статус, длительность в секундах, тело ответа); статус 0 — сетевая ошибка.
+        """
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+            if response.getheader("Connection", "").lower() == "close" or response.version == 10:
+                self.close()
+            return response.status, time.perf_counter() - started, data
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, time.perf_counter() - started, b""
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def load_fixtures(database, sample_users, rng):
+    """
+    Выбирает из наполненной базы пользователей, их персонажей и предметы инвентаря,
+    которые можно надеть.
+    :return: Список словарей {username, characters: [(character_id, [(item_id, slot), ...])]}.
+    """
+    connection = connect(database)
+    cursor = connection.cursor()
+    cursor.execute("SELECT id, username FROM users WHERE username LIKE 'bench\\_user\\_%'")
+    users = cursor.fetchall()
+    users = rng.sample(users, min(sample_users, len(users)))
+    fixtures = []
+    for user_id, username in users:
+        cursor.execute(
+            "SELECT c.id, i.id, i.type FROM characters c "
+            "LEFT JOIN inventory inv ON inv.character_id = c.id "
+            "LEFT JOIN items i ON i.id = inv.item_id "
+            "WHERE c.user_id = %s",
+            (user_id,)
+        )
+        characters = {}
+        for character_id, item_id, item_type in cursor.fetchall():
+            equippable = characters.setdefault(character_id, [])
+            if item_type in ITEM_SLOTS:
+                equippable.append((item_id, ITEM_SLOTS[item_type][0]))
+        if characters:
+            fixtures.append({"username": username, "characters": list(characters.items())})
+    cursor.close()
+    connection.close()
+    return fixtures
+
+
+def authenticate(base_url, fixtures):
+    """
+    Получает access-токен для каждого выбранного пользователя (вне замера).
+    """
+    client = Client(base_url)
+    for fixture in fixtures:
+        status, _, data = client.request("POST", "/login", {"username": fixture["username"], "password": BENCH_PASSWORD})
+        if status != 200:
+            raise RuntimeError(f"Login for {fixture['username']} failed with {status}: {data[:200]!r}")
+        fixture["token"] = json.loads(data)["token"]
+    client.close()
+
+
+class Workload:
+    """
+    Сценарии нагрузки. Каждый выполняет один или два запроса и возвращает
+    список замеров (маршрут, статус, длительность).
+    """
+    def __init__(self, fixtures, run_id):
+        self.fixtures = fixtures
+        self.run_id = run_id
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def login(self, client, rng):
+        fixture = rng.choice(self.fixtures)
+        status, elapsed, _ = client.request("POST", "/login", {"username": fixture["username"], "password": BENCH_PASSWORD})
+        return [("POST /login", status, elapsed)]
+
+    def equip(self, client, rng):
+        fixture = rng.choice(self.fixtures)
+        character_id, equippable = rng.choice(fixture["characters"])
+        if not equippable:
+            return self.inventory(client, rng)
+        item_id, slot = rng.choice(equippable)
+        status, elapsed, _ = client.request(
+            "POST", "/equip", {"character_id": character_id, "item_id": item_id, "slot": slot, "swap": True},
+            fixture["token"])
+        samples = [("POST /equip", status, elapsed)]
+        if rng.random() < 0.5:
+            status, elapsed, _ = client.request(
+                "POST", "/unequip", {"character_id": character_id, "slot": slot}, fixture["token"])
+            samples.append(("POST /unequip", status, elapsed))
+        return samples
+
+    def inventory(self, client, rng):
+        fixture = rng.choice(self.fixtures)
+        character_id, _ = rng.choice(fixture["characters"])
+        if rng.random() < 0.7:
+            status, elapsed, _ = client.request("GET", f"/inventory/{character_id}?limit=100", token=fixture["token"])
+            return [("GET /inventory/<id>", status, elapsed)]
+        status, elapsed, _ = client.request("GET", f"/equipment/{character_id}", token=fixture["token"])
+        return [("GET /equipment/<id>", status, elapsed)]
+
+    def register(self, client, rng):
+        with self._lock:
+            self._counter += 1
+            number = self._counter
+        username = f"bench_new_{self.run_id}_{number}"
+        status, elapsed, _ = client.request("POST", "/register", {"username": username, "password": BENCH_PASSWORD})
+        return [("POST /register", status, elapsed)]
+
+
+def run(base_url, workload, weights, duration, concurrency, seed):
+    """
+    Запускает concurrency потоков на duration секунд.
+    :return: Пара (замеры, фактическая длительность).
+    """
+    scenarios = [getattr(workload, name) for name in weights]
+    probabilities = list(weights.values())
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = Client(base_url)
+        samples = []
+        while time.monotonic() < deadline:
+            scenario = rng.choices(scenarios, probabilities)[0]
+            samples.extend(scenario(client, rng))
+        client.close()
+        return samples
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.monotonic() - started
+    return [sample for samples in results for sample in samples], elapsed
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples, elapsed):
+    """
+    :return: Словарь маршрут -> {requests, errors, rps, p50_ms, p95_ms, p99_ms, statuses}.
+    """
+    by_route = {}
+    for route, status, latency in samples:
+        by_route.setdefault(route, []).append((status, latency))
+    report = {}
+    for route, entries in sorted(by_route.items()):
+        latencies = sorted(latency for _, latency in entries)
+        statuses = {}
+        for status, _ in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary = {
+            "requests": len(entries),
+            "errors": sum(1 for status, _ in entries if status == 0 or status >= 500),
+            "rps": round(len(entries) / elapsed, 2),
+            "statuses": statuses,
+        }
+        for p in PERCENTILES:
+            summary[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 2)
+        report[route] = summary
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """
+    Сравнивает отчёт с базовым: регрессия — p95 выше или RPS ниже базового больше чем на tolerance.
+    :return: Список описаний регрессий.
+    """
+    regressions = []
+    for route, base in baseline.get("routes", {}).items():
+        current = report.get(route)
+        if current is None:
+            regressions.append(f"{route}: no requests in this run")
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: {current['rps']} rps vs baseline {base['rps']} rps")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{route}: {current['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def print_report(report):
+    header = f"{'route':<24}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for route, s in report.items():
+        print(f"{route:<24}{s['requests']:>10}{s['errors']:>8}{s['rps']:>10}"
+              f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервера")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--database", default="auth_server_bench", help="База, наполненная bench.seed")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sample-users", type=int, default=200, help="Сколько пользователей участвует в нагрузке")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", help="Куда записать отчёт в JSON")
+    parser.add_argument("--baseline", help="Базовый отчёт для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="Записать отчёт в --baseline вместо сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое ухудшение p95/RPS, доля")
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    fixtures = load_fixtures(args.database, args.sample_users, rng)
+    if not fixtures:
+        parser.error(f"В базе {args.database} нет пользователей bench_user_*; сначала запустите bench.seed")
+    authenticate(args.url, fixtures)
+
+    workload = Workload(fixtures, uuid.uuid4().hex[:8])
+    samples, elapsed = run(args.url, workload, WORKLOADS[args.workload], args.duration, args.concurrency,
+                           args.random_seed)
+    report = {
+        "workload": args.workload,
+        "duration": round(elapsed, 2),
+        "concurrency": args.concurrency,
+        "total_rps": round(len(samples) / elapsed, 2),
+        "routes": summarize(samples, elapsed),
+    }
+    print_report(report["routes"])
+    print(f"total: {len(samples)} requests, {report['total_rps']} rps")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as source:
+            baseline = json.load(source)
+        if baseline.get("workload") != args.workload:
+            print(f"Baseline workload is {baseline.get('workload')}, not {args.workload}; comparison skipped")
+            return
+        regressions = compare(report["routes"], baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
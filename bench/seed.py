@@ -0,0 +1,125 @@
+"""
+Наполнение отдельной базы данных для нагрузочного тестирования.
+
+    python -m bench.seed --database auth_server_bench --users 10000
+
+Схема берётся из data-dump.sql; таблицы базы пересоздаются, поэтому
+база по умолчанию — auth_server_bench, а не рабочая.
+"""
+import argparse
+import os
+import random
+import time
+
+import mysql.connector
+from werkzeug.security import generate_password_hash
+
+import config
+from migrations import migrate
+from models import ITEM_SLOTS, STAT_NAMES
+
+DUMP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data-dump.sql")
+
+BENCH_PASSWORD = "bench_password"
+ITEM_TYPES = tuple(ITEM_SLOTS) + ("potion",)
+BATCH = 1000
+
+
+def connect(database):
+    connect_args = config.db_connect_args()
+    connect_args["database"] = database
+    return mysql.connector.connect(**connect_args)
+
+
+def load_schema(connection, dump_path=DUMP_PATH):
+    """
+    Пересоздаёт таблицы по дампу и доводит схему миграциями.
+    """
+    with open(dump_path, encoding="utf-8") as dump:
+        sql = dump.read()
+    cursor = connection.cursor()
+    # Таблиц item_stats и schema_migrations в дампе нет: удаляем заранее, чтобы миграции прошли заново
+    cursor.execute("DROP TABLE IF EXISTS item_stats, schema_migrations")
+    for _ in cursor.execute(sql, multi=True):
+        pass
+    connection.commit()
+    cursor.close()
+    migrate(connection, "mysql")
+
+
+def _insert_many(cursor, query, rows):
+    for start in range(0, len(rows), BATCH):
+        cursor.executemany(query, rows[start:start + BATCH])
+
+
+def seed(connection, users=1000, characters_per_user=2, items=500, inventory_per_character=20, rng=None):
+    """
+    Заполняет базу пользователями, персонажами, предметами и инвентарём.
+    Все пользователи получают пароль BENCH_PASSWORD (хэш вычисляется один раз).
+    """
+    rng = rng or random.Random(42)
+    cursor = connection.cursor()
+    password_hash = generate_password_hash(BENCH_PASSWORD, config.HASH_METHOD, config.HASH_SALT_LENGTH)
+
+    _insert_many(cursor, "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
+                 [(f"bench_user_{i}", password_hash) for i in range(users)])
+    _insert_many(cursor, "INSERT INTO items (name, description, type, weight, value) VALUES (%s, %s, %s, %s, %s)",
+                 [(f"Bench item {i}", "Benchmark item", ITEM_TYPES[i % len(ITEM_TYPES)],
+                   round(rng.uniform(0.1, 20), 1), rng.randint(1, 1000)) for i in range(items)])
+    connection.commit()
+
+    cursor.execute("SELECT id FROM users WHERE username LIKE 'bench\\_user\\_%' ORDER BY id")
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT id, type FROM items ORDER BY id")
+    item_rows = cursor.fetchall()
+
+    _insert_many(cursor, f"INSERT INTO item_stats (item_id, {', '.join(STAT_NAMES)}) VALUES (%s, %s, %s, %s, %s, %s)",
+                 [(item_id, *(rng.randint(0, 10) for _ in STAT_NAMES))
+                  for item_id, item_type in item_rows if item_type in ITEM_SLOTS])
+    _insert_many(cursor, "INSERT INTO characters (user_id, name, class, race) VALUES (%s, %s, %s, %s)",
+                 [(user_id, f"Bench{user_id}x{n}", "Warrior", "Human")
+                  for user_id in user_ids for n in range(characters_per_user)])
+    connection.commit()
+
+    cursor.execute("SELECT id FROM characters ORDER BY id")
+    character_ids = [row[0] for row in cursor.fetchall()]
+    item_ids = [row[0] for row in item_rows]
+    per_character = min(inventory_per_character, len(item_ids))
+    inventory = []
+    for character_id in character_ids:
+        for item_id in rng.sample(item_ids, per_character):
+            inventory.append((character_id, item_id, rng.randint(1, 5)))
+        if len(inventory) >= BATCH * 10:
+            _insert_many(cursor, "INSERT INTO inventory (character_id, item_id, quantity) VALUES (%s, %s, %s)", inventory)
+            connection.commit()
+            inventory = []
+    _insert_many(cursor, "INSERT INTO inventory (character_id, item_id, quantity) VALUES (%s, %s, %s)", inventory)
+    connection.commit()
+    cursor.close()
+    return {"users": len(user_ids), "characters": len(character_ids), "items": len(item_ids)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Наполнение базы для нагрузочного тестирования")
+    parser.add_argument("--database", default="auth_server_bench")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--characters-per-user", type=int, default=2)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--inventory-per-character", type=int, default=20)
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database == config.DB_NAME:
+        parser.error(f"База {args.database} совпадает с рабочей (DB_NAME); укажите отдельную базу")
+
+    started = time.monotonic()
+    connection = connect(args.database)
+    load_schema(connection)
+    counts = seed(connection, args.users, args.characters_per_user, args.items,
+                  args.inventory_per_character, random.Random(args.random_seed))
+    connection.close()
+    print(f"Seeded {counts} into {args.database} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Микробенчмарк сборки ответов /inventory и /equipment: словари на каждую строку
+и json.dumps с сортировкой ключей (как jsonify Flask по умолчанию) против
+JSON-префиксов справочника (fastjson.encode_records) и fastjson.dumps.
+
+    python -m bench.serialization --rows 500 --number 2000
+
+База не нужна: справочник наполняется синтетическими предметами,
+строки инвентаря — кортежи (item_id, quantity), как их возвращает курсор.
+"""
+import argparse
+import json
+import random
+import time
+
+import fastjson
+from catalog import ItemCatalog
+
+ITEM_TYPES = ("weapon", "armor", "shield", "accessory", "consumable")
+
+
+def make_catalog(items, rng):
+    def loader(item_ids):
+        ids = range(1, items + 1) if item_ids is None else item_ids
+        return [({"id": item_id, "name": f"Bench item {item_id}", "description": "Benchmark item",
+                  "type": ITEM_TYPES[item_id % len(ITEM_TYPES)], "weight": round(rng.uniform(0.1, 20), 1),
+                  "value": rng.randint(1, 1000)}, None) for item_id in ids]
+
+    catalog = ItemCatalog(loader, max_size=items)
+    catalog.preload()
+    return catalog
+
+
+def dicts_path(catalog, rows):
+    # Прежний путь: копия словаря предмета на строку и jsonify с sort_keys
+    items = catalog.get_many([row[0] for row in rows])
+    inventory = [dict(items[item_id][0], quantity=quantity) for item_id, quantity in rows if item_id in items]
+    return json.dumps({"items": inventory, "next_cursor": None}, sort_keys=True).encode("utf-8")
+
+
+def prefixes_path(catalog, rows):
+    prefixes = catalog.get_prefixes([row[0] for row in rows])
+    rows = [row for row in rows if row[0] in prefixes]
+    items = fastjson.encode_records([prefixes[row[0]] for row in rows], "quantity", [row[1] for row in rows])
+    return b'{"items":' + items + b',"next_cursor":' + fastjson.dumps(None) + b'}'
+
+
+def measure(func, number, repeat=5):
+    """
+    :return: Лучшее среднее время одного вызова из repeat прогонов, микросекунды.
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = (time.perf_counter() - started) / number * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк сериализации ответов")
+    parser.add_argument("--items", type=int, default=5000, help="Размер справочника")
+    parser.add_argument("--rows", type=int, default=500, help="Строк инвентаря в ответе")
+    parser.add_argument("--number", type=int, default=1000, help="Вызовов в одном прогоне")
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    catalog = make_catalog(args.items, rng)
+    rows = [(item_id, rng.randint(1, 5)) for item_id in sorted(rng.sample(range(1, args.items + 1), args.rows))]
+    # Оба пути должны давать один и тот же JSON
+    if json.loads(dicts_path(catalog, rows)) != json.loads(prefixes_path(catalog, rows)):
+        raise SystemExit("Ответы двух путей не совпадают")
+
+    character = {"id": 1, "user_id": 1, "name": "Bench1x0", "class": "Warrior", "race": "Human", "level": 10,
+                 "health": 120, "mana": 60, "strength": 25, "agility": 14, "intelligence": 9, "xp": 12345, "gold": 678}
+    cases = (
+        (f"inventory ({args.rows} rows)", lambda: dicts_path(catalog, rows), lambda: prefixes_path(catalog, rows)),
+        ("character", lambda: json.dumps(character, sort_keys=True).encode("utf-8"), lambda: fastjson.dumps(character)),
+    )
+    print(f"JSON: {'orjson' if fastjson.orjson is not None else 'json'}")
+    print(f"{'case':<24} {'dicts, us':>12} {'fast, us':>12} {'speedup':>8}")
+    for name, old, new in cases:
+        old_time = measure(old, args.number)
+        new_time = measure(new, args.number)
+        print(f"{name:<24} {old_time:>12.1f} {new_time:>12.1f} {old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
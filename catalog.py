@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from fastjson import record_prefix
+
+
+class ItemCatalog:
+    """
+    Кэш справочника предметов (таблицы items и item_stats) в памяти процесса.
+
+    Справочник почти не меняется, поэтому экипировка и инвентарь собираются
+    из кэша, а в базу уходит только запрос за строками конкретного персонажа.
+    Размер ограничен max_size (вытесняются давно не использованные записи),
+    запись старше ttl секунд перечитывается. add_item пишет в кэш сразу
+    после записи в базу. Рядом с предметом хранится его JSON-префикс
+    (fastjson.record_prefix), чтобы ответы собирались без копирования словарей.
+    """
+    def __init__(self, loader, max_size=10000, ttl=300.0):
+        """
+        :param loader: Функция loader(item_ids) -> список пар (item, stats);
+            при item_ids=None возвращает весь справочник.
+        :param max_size: Максимум предметов в кэше.
+        :param ttl: Время жизни записи, секунды.
+        """
+        self._loader = loader
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # item_id -> (item, stats, время загрузки, JSON-префикс item)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "loads": 0, "evictions": 0, "invalidations": 0}
+
+    def preload(self):
+        """
+        Загружает справочник целиком (не больше max_size предметов).
+        """
+        rows = self._loader(None)
+        now = time.monotonic()
+        with self._lock:
+            for item, stats in rows[:self.max_size]:
+                self._store(item, stats, now)
+            self._stats["loads"] += 1
+        logging.info(f"Справочник предметов загружен в кэш: {min(len(rows), self.max_size)} записей")
+
+    def _store(self, item, stats, now):
+        entry = self._entries[item["id"]] = (item, stats, now, record_prefix(item))
+        self._entries.move_to_end(item["id"])
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+        return entry
+
+    def get_many(self, item_ids):
+        """
+        Возвращает записи для набора предметов, догружая недостающие одним запросом.
+        :param item_ids: Идентификаторы предметов.
+        :return: Словарь item_id -> (item, stats); отсутствующих в базе предметов в нём нет.
+        """
+        return {item_id: (entry[0], entry[1]) for item_id, entry in self._lookup(item_ids).items()}
+
+    def get_prefixes(self, item_ids):
+        """
+        Как get_many, но возвращает JSON-префиксы предметов.
+        :return: Словарь item_id -> префикс (bytes).
+        """
+        return {item_id: entry[3] for item_id, entry in self._lookup(item_ids).items()}
+
+    def _lookup(self, item_ids):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        with self._lock:
+            for item_id in item_ids:
+                entry = self._entries.get(item_id)
+                if entry is not None and now - entry[2] < self.ttl:
+                    self._entries.move_to_end(item_id)
+                    found[item_id] = entry
+                    self._stats["hits"] += 1
+                else:
+                    missing.append(item_id)
+                    self._stats["misses"] += 1
+        if missing:
+            rows = self._loader(list(dict.fromkeys(missing)))
+            with self._lock:
+                for item, stats in rows:
+                    found[item["id"]] = self._store(item, stats, now)
+                self._stats["loads"] += 1
+        return found
+
+    def get(self, item_id):
+        """
+        :return: Пара (item, stats) или None, если предмета нет.
+        """
+        return self.get_many([item_id]).get(item_id)
+
+    def put(self, item, stats=None):
+        """
+        Сквозная запись: кладёт только что сохранённый предмет в кэш.
+        """
+        with self._lock:
+            self._store(item, stats, time.monotonic())
+
+    def invalidate(self, item_id=None):
+        """
+        Сбрасывает запись о предмете или, без аргумента, весь кэш.
+        """
+        with self._lock:
+            if item_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(item_id, None)
+            self._stats["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["max_size"] = self.max_size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,218 @@
+"""
+Проверка маршрутизации по шардам на локальных базах SQLite: основная база и
+несколько шардов во временном каталоге, запросы — через тестовый клиент app.py.
+
+    python check_shards.py
+    python check_shards.py --shards 2 --users 20 --dir /tmp/shards --keep
+
+Проверяется, что:
+- ID персонажа хранит корзину владельца и по нему находится тот же шард, что и по user_id;
+- персонаж, его инвентарь и экипировка (POST /character, /inventory/add, /equip)
+  лежат только на шарде корзины, а GET /character, /inventory, /equipment читают их оттуда;
+- POST /characters/stats собирает персонажей со всех шардов (scatter-gather), а
+  бонусы надетых предметов учтены в характеристиках ровно один раз;
+- имена персонажей уникальны между шардами (реестр character_names на основной базе);
+- к чужому персонажу сервер отвечает 403.
+
+Код возврата 0 — все проверки прошли, 1 — есть ошибки.
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+
+def configure(directory, shards, buckets):
+    # config читает окружение при импорте, поэтому app и models импортируются после
+    os.environ.update(
+        DB_BACKEND="sqlite",
+        SQLITE_PATH=os.path.join(directory, "main.db"),
+        DB_SHARDS=",".join(os.path.join(directory, f"shard{n}.db") for n in range(shards)),
+        SHARD_BUCKETS=str(buckets),
+        SHARD_MAP_FILE="",
+        DB_REPLICAS="",
+        DB_MIGRATE_ON_START="1",
+        LOG_FILE=os.path.join(directory, "app.log"),
+        LOG_CONSOLE="0",
+    )
+    # Быстрое хэширование и лимиты, не мешающие регистрации десятков пользователей
+    os.environ.setdefault("HASH_WORKERS", "0")
+    os.environ.setdefault("HASH_METHOD", "pbkdf2:sha256:1000")
+    for name in ("REGISTER_IP_LIMIT", "LOGIN_IP_LIMIT", "LOGIN_USER_LIMIT"):
+        os.environ.setdefault(name, "1000000")
+
+
+class Checks:
+    def __init__(self):
+        self.failures = []
+        self.passed = 0
+
+    def check(self, condition, message):
+        if condition:
+            self.passed += 1
+        else:
+            self.failures.append(message)
+            logging.error(f"FAIL: {message}")
+
+
+def rows_on_shards(db, query, params):
+    """
+    Выполняет запрос на каждом шарде.
+    :return: Словарь имя шарда -> список строк.
+    """
+    result = {}
+    for shard in db.shards.shards:
+        with db.session():
+            with db._on_shard(shard):
+                db.cursor.execute(query, params)
+                result[shard.name] = db.cursor.fetchall()
+    return result
+
+
+def run(users, checks):
+    import app as server
+
+    client = server.app.test_client()
+    db = server.db
+    checks.check(server.init_worker(), "рабочий процесс подключился к базам")
+    shard_map = db.shards
+    checks.check(shard_map is not None and len(shard_map.shards) > 1, "шардов больше одного")
+
+    with db.session():
+        for name, item_type in (("Sword", "weapon"), ("Axe", "weapon"), ("Shield", "shield")):
+            db.add_item(name, "", item_type)
+        # Бонусы меча (+5 силы): персонаж носит два меча, итог — 10 + 2 * 5
+        db.cursor.execute(
+            "INSERT INTO item_stats (item_id, strength, agility, intelligence, health, mana) "
+            "VALUES (%s, %s, %s, %s, %s, %s)", (1, 5, 0, 0, 0, 0)
+        )
+        db.connection.commit()
+        db.catalog.invalidate()
+        sword = db.catalog.get(1)
+    checks.check(sword is not None and sword[0]["name"] == "Sword" and sword[1]["strength"] == 5,
+                 "справочник предметов на основной базе")
+    strength = 10 + 2 * 5
+
+    tokens = {}
+    characters = {}  # user_id -> ID персонажа
+    for n in range(users):
+        username = f"shard_user{n}"
+        client.post("/register", json={"username": username, "password": "Secret123!x"})
+        login = client.post("/login", json={"username": username, "password": "Secret123!x"})
+        if login.status_code != 200:
+            checks.check(False, f"вход {username}: {login.status_code}")
+            continue
+        headers = {"Authorization": f"Bearer {login.get_json()['token']}"}
+        user_id = client.get("/check_auth", headers=headers).get_json()["user_id"]
+        tokens[user_id] = headers
+        created = client.post("/character", json={"name": f"Hero{n}", "class": "Warrior", "race": "Human"},
+                              headers=headers)
+        checks.check(created.status_code == 201, f"создание персонажа пользователя {user_id}")
+        with db.session():
+            character = db.get_character(user_id)
+        if character is None:
+            checks.check(False, f"персонаж пользователя {user_id} не найден")
+            continue
+        character_id = characters[user_id] = character["id"]
+
+        # ID хранит корзину владельца
+        checks.check(character_id % shard_map.buckets == user_id % shard_map.buckets,
+                     f"корзина в ID {character_id} пользователя {user_id}")
+        checks.check(shard_map.for_character(character_id) is shard_map.for_user(user_id),
+                     f"шард по ID {character_id} совпадает с шардом пользователя {user_id}")
+
+        for body in ({"character_id": character_id, "item_id": 1, "quantity": 2},
+                     {"character_id": character_id, "item_id": 3}):
+            response = client.post("/inventory/add", json=body, headers=headers)
+            checks.check(response.status_code == 200, f"начисление предмета {body['item_id']} персонажу {character_id}")
+        for slot in ("weapon", "offhand"):
+            response = client.post("/equip", json={"character_id": character_id, "item_id": 1, "slot": slot},
+                                   headers=headers)
+            checks.check(response.status_code == 200, f"экипировка персонажа {character_id} в слот {slot}")
+
+        inventory = client.get(f"/inventory/{character_id}", headers=headers).get_json()
+        checks.check(inventory is not None and [(i["id"], i["quantity"]) for i in inventory["items"]] == [(1, 2), (3, 1)],
+                     f"инвентарь персонажа {character_id}: {inventory}")
+        equipment = client.get(f"/equipment/{character_id}", headers=headers).get_json()
+        checks.check(sorted((i["id"], i["slot"]) for i in equipment or []) == [(1, "offhand"), (1, "weapon")],
+                     f"экипировка персонажа {character_id}: {equipment}")
+        fetched = client.get(f"/character/{character_id}", headers=headers).get_json()
+        checks.check(fetched is not None and fetched["user_id"] == user_id, f"GET /character/{character_id}")
+        checks.check(fetched is not None and fetched["strength"] == strength,
+                     f"сила персонажа {character_id} с двумя мечами: {fetched and fetched['strength']}")
+
+    checks.check(len(set(characters.values())) == len(characters), "ID персонажей уникальны между шардами")
+    used = {shard_map.for_user(user_id).name for user_id in characters}
+    checks.check(len(used) > 1, f"персонажи попали на несколько шардов: {sorted(used)}")
+
+    # Строки лежат только на шарде корзины и не попадают на основную базу
+    for table, column in (("characters", "id"), ("inventory", "character_id"), ("equipment", "character_id")):
+        placed = rows_on_shards(db, f"SELECT DISTINCT {column} FROM {table}", ())
+        for user_id, character_id in characters.items():
+            holders = [name for name, rows in placed.items() if (character_id,) in rows]
+            checks.check(holders == [shard_map.for_user(user_id).name],
+                         f"{table} персонажа {character_id} на шардах {holders}")
+    with db.session():
+        db.cursor.execute("SELECT COUNT(*) FROM characters")
+        checks.check(db.cursor.fetchone()[0] == 0, "на основной базе нет персонажей")
+        db.cursor.execute("SELECT name FROM character_names")
+        registered = {row[0] for row in db.cursor.fetchall()}
+    db.release()
+    checks.check(registered == {f"Hero{n}" for n in range(users)}, "реестр имён на основной базе")
+
+    # Имя занято на другом шарде
+    user_ids = sorted(characters)
+    other = next((u for u in user_ids[1:] if shard_map.for_user(u) is not shard_map.for_user(user_ids[0])), None)
+    if other is not None:
+        with db.session():
+            duplicate = db.create_character(other, "Hero0", "Mage", "Elf")
+        db.release()
+        checks.check(not duplicate, "имя персонажа с другого шарда отклонено")
+        response = client.get(f"/inventory/{characters[user_ids[0]]}", headers=tokens[other])
+        checks.check(response.status_code == 403, "чужой персонаж с другого шарда: 403")
+
+    # Scatter-gather по всем шардам
+    before = db.shard_stats()
+    ids = list(characters.values()) + [10 ** 9 + 7]
+    response = client.post("/characters/stats", json={"character_ids": ids}, headers=tokens[user_ids[0]])
+    stats = response.get_json() if response.status_code == 200 else None
+    checks.check(stats is not None and sorted(c["id"] for c in stats) == sorted(characters.values()),
+                 "POST /characters/stats вернул персонажей всех шардов")
+    checks.check(db.shard_stats()["scatters"] > before["scatters"], "запрос характеристик разошёлся по шардам")
+    checks.check(all(c["strength"] == strength for c in stats or []), "бонусы экипировки учтены один раз")
+
+    server.shutdown_worker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка маршрутизации по шардам на SQLite")
+    parser.add_argument("--shards", type=int, default=3, help="Число шардов")
+    parser.add_argument("--buckets", type=int, default=16, help="Число корзин (SHARD_BUCKETS)")
+    parser.add_argument("--users", type=int, default=12, help="Число пользователей с персонажами")
+    parser.add_argument("--dir", help="Каталог для баз (по умолчанию временный; должен быть пустым)")
+    parser.add_argument("--keep", action="store_true", help="Не удалять временный каталог")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="shards-")
+    os.makedirs(directory, exist_ok=True)
+    if os.listdir(directory):
+        parser.error(f"Каталог {directory} не пуст")
+    configure(directory, args.shards, args.buckets)
+
+    checks = Checks()
+    try:
+        run(args.users, checks)
+    finally:
+        if args.dir is None and not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    # setup_logging в app.py забирает корневой логгер, поэтому итог — в stdout
+    print(f"Проверок: {checks.passed + len(checks.failures)}, ошибок: {len(checks.failures)}")
+    for failure in checks.failures:
+        print(f"  {failure}")
+    return 1 if checks.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
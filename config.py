@@ -0,0 +1,143 @@
+import os
+
+# Параметры подключения к базе данных
+DB_HOST = os.environ.get("DB_HOST", "localhost")
+DB_USER = os.environ.get("DB_USER", "app_user")
+DB_PASSWORD = os.environ.get("DB_PASSWORD", "secure_password")
+DB_NAME = os.environ.get("DB_NAME", "auth_server")
+
+# Хранилище: "mysql" (сервер), "sqlite" (встроенная база в файле SQLITE_PATH)
+# или "memory" (SQLite в памяти процесса, данные теряются при остановке)
+DB_BACKEND = os.environ.get("DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "auth_server.db")
+# Сколько секунд ждать блокировку записи SQLite
+SQLITE_BUSY_TIMEOUT = float(os.environ.get("SQLITE_BUSY_TIMEOUT", "5"))
+
+# Применять недостающие миграции схемы при запуске (иначе: python migrations.py)
+DB_MIGRATE_ON_START = os.environ.get("DB_MIGRATE_ON_START", "1") == "1"
+
+# Пул соединений. 0 — одно общее соединение на процесс (старое поведение)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+# Сколько секунд ждать свободное соединение, прежде чем вернуть 503
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "5"))
+# Соединение, простоявшее дольше этого времени, проверяется ping'ом перед выдачей
+DB_POOL_PING_INTERVAL = float(os.environ.get("DB_POOL_PING_INTERVAL", "30"))
+
+# Реплики для чтения: адреса "host" или "host:port" через запятую (пусто — читать с основного)
+DB_REPLICAS = [address.strip() for address in os.environ.get("DB_REPLICAS", "").split(",") if address.strip()]
+# Реплика, отстающая больше стольких секунд, исключается из чтения
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "5"))
+# Период проверки реплик, секунды
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", "2"))
+# Сколько секунд после записи читать данные персонажа/пользователя с основного сервера
+REPLICA_PIN_WINDOW = float(os.environ.get("REPLICA_PIN_WINDOW", "5"))
+# Сколько ждать свободное соединение реплики, прежде чем читать с основного
+REPLICA_ACQUIRE_TIMEOUT = float(os.environ.get("REPLICA_ACQUIRE_TIMEOUT", "0.05"))
+
+# Шарды персонажей, инвентаря и экипировки через запятую (пусто — всё на основной базе):
+# для mysql "host[:port][/database]", для sqlite пути к файлам. Хранилище — как DB_BACKEND
+DB_SHARDS = [address.strip() for address in os.environ.get("DB_SHARDS", "").split(",") if address.strip()]
+# Число виртуальных корзин пользователей; входит в ID персонажей, после запуска не меняется
+SHARD_BUCKETS = int(os.environ.get("SHARD_BUCKETS", "1024"))
+# JSON с перенесёнными корзинами {"корзина": "шард"}; остальные раскладываются по кругу
+SHARD_MAP_FILE = os.environ.get("SHARD_MAP_FILE", "")
+
+# Размер пула соединений асинхронного варианта (asgi.py)
+DB_ASYNC_POOL_SIZE = int(os.environ.get("DB_ASYNC_POOL_SIZE", "50"))
+
+# Хэширование паролей: число процессов (0 — в потоке запроса), предел очереди
+# и параметры стоимости в формате werkzeug ("scrypt:32768:8:1", "pbkdf2:sha256:600000")
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", "2"))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", "32"))
+HASH_METHOD = os.environ.get("HASH_METHOD", "pbkdf2")
+HASH_SALT_LENGTH = int(os.environ.get("HASH_SALT_LENGTH", "16"))
+
+# Сколько проверенных JWT держать в LRU-кэше (0 — не кэшировать)
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", "10000"))
+
+# Время жизни токенов, секунды
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", "900"))
+REFRESH_TOKEN_TTL = int(os.environ.get("REFRESH_TOKEN_TTL", str(30 * 24 * 3600)))
+# Фильтр отозванных токенов: ёмкость, доля ложных срабатываний, период дочитывания
+REVOCATION_CAPACITY = int(os.environ.get("REVOCATION_CAPACITY", "100000"))
+REVOCATION_ERROR_RATE = float(os.environ.get("REVOCATION_ERROR_RATE", "0.001"))
+REVOCATION_REFRESH_INTERVAL = float(os.environ.get("REVOCATION_REFRESH_INTERVAL", "1"))
+# Сколько последних id перечитывать при дочитывании (записи, закоммиченные не по порядку id)
+# и период полной сверки фильтра с таблицей, секунды (0 — без сверки)
+REVOCATION_REFRESH_OVERLAP = int(os.environ.get("REVOCATION_REFRESH_OVERLAP", "1000"))
+REVOCATION_RECONCILE_INTERVAL = float(os.environ.get("REVOCATION_RECONCILE_INTERVAL", "300"))
+
+# Кэш справочника предметов (items + item_stats): максимум записей и время жизни, секунды
+CATALOG_MAX_SIZE = int(os.environ.get("CATALOG_MAX_SIZE", "50000"))
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "300"))
+
+# Отложенная запись приращений персонажа (increment_character): включена ли,
+# период сброса в секундах и число персонажей, при котором сброс идёт сразу
+CHARACTER_WRITE_BEHIND = os.environ.get("CHARACTER_WRITE_BEHIND", "0") == "1"
+CHARACTER_FLUSH_INTERVAL = float(os.environ.get("CHARACTER_FLUSH_INTERVAL", "1"))
+CHARACTER_FLUSH_MAX_PENDING = int(os.environ.get("CHARACTER_FLUSH_MAX_PENDING", "1000"))
+
+# Outbox событий инвентаря и экипировки: записывать ли события, куда их доставлять
+# ("file:путь" — JSONL, "queue" — очередь в процессе), размер пачки и период опроса, секунды.
+# Диспетчер — один на все процессы: python outbox.py или OUTBOX_DISPATCH=1 у единственного сервера
+OUTBOX_ENABLED = os.environ.get("OUTBOX_ENABLED", "0") == "1"
+OUTBOX_SINK = os.environ.get("OUTBOX_SINK", "file:outbox-events.jsonl")
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "0.5"))
+OUTBOX_DISPATCH = os.environ.get("OUTBOX_DISPATCH", "0") == "1"
+
+# Рабочий сервер (gunicorn.conf.py): адрес, число процессов (0 — 2 * ядра + 1),
+# потоков в процессе (не больше DB_POOL_SIZE), таймаут запроса и время на
+# завершение начатых запросов при остановке и перезагрузке, секунды
+SERVER_BIND = os.environ.get("SERVER_BIND", "0.0.0.0:5000")
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "0"))
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", "1"))
+SERVER_TIMEOUT = int(os.environ.get("SERVER_TIMEOUT", "30"))
+SERVER_GRACEFUL_TIMEOUT = int(os.environ.get("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+# Кэш готовых ответов /character/<id> и /equipment/<id> по версии персонажа:
+# максимум записей (0 — выключен; ETag и ответы 304 работают и без него)
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "10000"))
+
+# Кэш владельцев персонажей для проверки доступа к ним: максимум записей
+# (0 — спрашивать базу на каждый запрос)
+OWNER_CACHE_SIZE = int(os.environ.get("OWNER_CACHE_SIZE", "100000"))
+
+# Максимум изменений в одном запросе /inventory/bulk
+INVENTORY_BULK_MAX = int(os.environ.get("INVENTORY_BULK_MAX", "500"))
+
+# Максимальный размер страницы инвентаря
+INVENTORY_PAGE_MAX = int(os.environ.get("INVENTORY_PAGE_MAX", "500"))
+
+# Логирование: файл ("" — не писать), вывод в консоль, уровень, очередь и пачки
+# фонового писателя, доля сохраняемых записей уровня INFO (1.0 — все)
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
+LOG_CONSOLE = os.environ.get("LOG_CONSOLE", "1") == "1"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_INFO_SAMPLE_RATE = float(os.environ.get("LOG_INFO_SAMPLE_RATE", "1.0"))
+
+# Ограничение частоты /login и /register: хранилище ("memory" или "redis"),
+# максимум ключей в памяти, лимиты в формате (событий, окно в секундах)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+LOGIN_IP_LIMIT = (int(os.environ.get("LOGIN_IP_LIMIT", "30")), 60)
+LOGIN_USER_LIMIT = (int(os.environ.get("LOGIN_USER_LIMIT", "10")), 60)
+REGISTER_IP_LIMIT = (int(os.environ.get("REGISTER_IP_LIMIT", "5")), 60)
+# Блокировка учётной записи после стольких неудачных входов за окно
+LOGIN_LOCKOUT = (int(os.environ.get("LOGIN_LOCKOUT_FAILURES", "5")), int(os.environ.get("LOGIN_LOCKOUT_WINDOW", "900")))
+
+
+def db_connect_args():
+    """
+    Возвращает параметры для mysql.connector.connect.
+    """
+    return {
+        "host": DB_HOST,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "database": DB_NAME,
+    }
@@ -128,6 +128,33 @@ LOCK TABLES `items` WRITE;
 /*!40000 ALTER TABLE `items` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `revoked_tokens`
+--
+
+DROP TABLE IF EXISTS `revoked_tokens`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `revoked_tokens` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `jti` char(32) NOT NULL,
+  `expires_at` datetime NOT NULL,
+  `revoked_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `jti` (`jti`),
+  KEY `expires_at` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `revoked_tokens`
+--
+
+LOCK TABLES `revoked_tokens` WRITE;
+/*!40000 ALTER TABLE `revoked_tokens` DISABLE KEYS */;
+/*!40000 ALTER TABLE `revoked_tokens` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `users`
 --
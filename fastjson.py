@@ -0,0 +1,57 @@
+import decimal
+import json
+
+try:
+    import orjson
+    # Даты отдаём через default, как и без orjson; ключи-числа допускаем, как json
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    # Типы, которые драйверы базы возвращают помимо JSON-совместимых
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value, default=_default):
+    """
+    Сериализует значение в компактный JSON (UTF-8, без сортировки ключей).
+    Использует orjson, если он установлен, иначе стандартный json.
+    :param default: Преобразование типов, которые JSON не поддерживает.
+    :return: bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=default, option=_ORJSON_OPTIONS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def record_prefix(record):
+    """
+    JSON-объект записи без закрывающей скобки: к нему дописываются поля строки
+    (quantity, slot), не копируя сам словарь. Справочник хранит префикс рядом
+    с предметом и кодирует его один раз.
+    """
+    return dumps(record)[:-1]
+
+
+def _scalar(value):
+    if type(value) is int:
+        return b"%d" % value
+    return dumps(value)
+
+
+def encode_records(prefixes, key, values):
+    """
+    Собирает JSON-массив записей из готовых префиксов и одного поля строки:
+    [{...префикс, "key": value}, ...].
+    :param prefixes: Префиксы от record_prefix.
+    :param values: Значения поля key, по одному на префикс.
+    :return: bytes.
+    """
+    field = b',"' + key.encode("utf-8") + b'":'
+    return b"[" + b",".join(prefix + field + _scalar(value) + b"}" for prefix, value in zip(prefixes, values)) + b"]"
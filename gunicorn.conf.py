@@ -0,0 +1,40 @@
+"""
+Настройки gunicorn для рабочего запуска:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Каждый рабочий процесс импортирует приложение сам, после fork: потоки журнала,
+пулы соединений и хэширования не переживают fork, поэтому в мастере их не
+создаём. До приёма запросов процесс подключается к базе и прогревается
+(app.init_worker).
+
+Перезагрузка без потери запросов: kill -HUP <pid мастера>. Мастер запускает
+новые процессы с новым кодом и настройками, старые дообслуживают начатые
+запросы (SERVER_GRACEFUL_TIMEOUT) и завершаются; сокет всё это время открыт.
+"""
+import multiprocessing
+
+# Модуль целиком не импортируем: имя config в этом файле gunicorn считает своей настройкой
+from config import SERVER_BIND, SERVER_GRACEFUL_TIMEOUT, SERVER_THREADS, SERVER_TIMEOUT, SERVER_WORKERS
+
+bind = SERVER_BIND
+workers = SERVER_WORKERS or multiprocessing.cpu_count() * 2 + 1
+# При threads = 1 — синхронные процессы: запрос, принятый процессом, всегда
+# дообслуживается при перезагрузке. При threads > 1 gunicorn берёт gthread
+# (keep-alive, меньше процессов), но тот при остановке процесса закрывает
+# принятые и ещё не прочитанные соединения.
+threads = SERVER_THREADS
+timeout = SERVER_TIMEOUT
+graceful_timeout = SERVER_GRACEFUL_TIMEOUT
+keepalive = 5
+preload_app = False
+
+
+def post_worker_init(worker):
+    from app import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from app import shutdown_worker
+    shutdown_worker()
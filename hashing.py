@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+import config
+import metrics
+
+
+class HashingBusy(Exception):
+    """
+    Очередь хэширования заполнена — запрос нужно отклонить (503).
+    """
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей в отдельном пуле процессов с ограниченной очередью.
+
+    Хэширование намеренно дорогое и держит GIL, поэтому выполняется вне
+    потоков, обслуживающих запросы. Если задач в работе и в очереди больше
+    max_pending, новая задача сразу отклоняется с HashingBusy.
+    """
+    def __init__(self, workers=2, max_pending=None, method="pbkdf2", salt_length=16):
+        """
+        :param workers: Число процессов. 0 — хэшировать прямо в вызывающем потоке
+            (async-варианты — в пуле потоков цикла событий).
+        :param max_pending: Максимум задач в работе и в очереди (по умолчанию workers * 4),
+            в том числе при workers=0.
+        :param method: Метод и параметры стоимости для werkzeug, например
+            "scrypt:32768:8:1" или "pbkdf2:sha256:600000".
+        :param salt_length: Длина соли.
+        """
+        self.workers = workers
+        self.max_pending = max_pending if max_pending is not None else max(workers, 1) * 4
+        self.method = method
+        self.salt_length = salt_length
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            "hashed": 0,  # выполнено операций (хэширование и проверка)
+            "rejected": 0,  # отклонено из-за переполненной очереди
+            "failed": 0,  # завершилось исключением
+            "latency_total": 0.0,  # суммарное время от постановки до результата, секунды
+            "latency_max": 0.0,
+        }
+
+    def _get_executor(self):
+        # Пул создаётся лениво: после fork у каждого воркера свои процессы
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HashingBusy(f"Очередь хэширования заполнена ({self.max_pending})")
+
+    def _submit(self, func, *args):
+        self._acquire_slot()
+        with self._lock:
+            self._pending += 1
+        started = time.monotonic()
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._finish(started, failed=True)
+            raise
+        future.add_done_callback(lambda f: self._finish(started, failed=f.exception() is not None))
+        return future
+
+    def _finish(self, started, failed=False):
+        self._record(started, failed)
+        self._slots.release()
+
+    def _record(self, started, failed):
+        elapsed = time.monotonic() - started
+        metrics.password_hash_latency.observe(elapsed)
+        with self._lock:
+            self._pending -= 1
+            self._stats["hashed"] += 1
+            self._stats["latency_total"] += elapsed
+            if elapsed > self._stats["latency_max"]:
+                self._stats["latency_max"] = elapsed
+            if failed:
+                self._stats["failed"] += 1
+
+    def _run_inline(self, func, *args):
+        # Без пула процессов очередь ограничивает число одновременных хэширований в потоках
+        self._acquire_slot()
+        with self._lock:
+            self._pending += 1
+        started = time.monotonic()
+        failed = True
+        try:
+            result = func(*args)
+            failed = False
+            return result
+        finally:
+            self._finish(started, failed)
+
+    def hash_password(self, password):
+        """
+        Возвращает хэш пароля.
+        :raises HashingBusy: Если очередь хэширования заполнена.
+        """
+        if self.workers == 0:
+            return self._run_inline(generate_password_hash, password, self.method, self.salt_length)
+        return self._submit(generate_password_hash, password, self.method, self.salt_length).result()
+
+    def check_password(self, password_hash, password):
+        """
+        Проверяет пароль по хэшу.
+        :raises HashingBusy: Если очередь хэширования заполнена.
+        """
+        if self.workers == 0:
+            return self._run_inline(check_password_hash, password_hash, password)
+        return self._submit(check_password_hash, password_hash, password).result()
+
+    def _submit_to_loop(self, func, *args):
+        # Без пула процессов: слот занимается в цикле событий (переполнение сразу
+        # даёт HashingBusy), а хэширование идёт в пуле потоков цикла
+        self._acquire_slot()
+        with self._lock:
+            self._pending += 1
+        started = time.monotonic()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+        except Exception:
+            self._finish(started, failed=True)
+            raise
+        future.add_done_callback(lambda f: self._finish(started, failed=f.cancelled() or f.exception() is not None))
+        return future
+
+    async def hash_password_async(self, password):
+        if self.workers == 0:
+            return await self._submit_to_loop(generate_password_hash, password, self.method, self.salt_length)
+        future = self._submit(generate_password_hash, password, self.method, self.salt_length)
+        return await asyncio.wrap_future(future)
+
+    async def check_password_async(self, password_hash, password):
+        if self.workers == 0:
+            return await self._submit_to_loop(check_password_hash, password_hash, password)
+        future = self._submit(check_password_hash, password_hash, password)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        """
+        Возвращает метрики: глубину очереди, число операций и задержки.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+            stats["max_pending"] = self.max_pending
+            stats["workers"] = self.workers
+            done = stats["hashed"]
+            stats["latency_avg"] = stats["latency_total"] / done if done else 0.0
+        return stats
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            logging.info("Пул хэширования паролей остановлен.")
+
+
+_default_hasher = None
+_default_lock = threading.Lock()
+
+
+def default_hasher():
+    """
+    Возвращает общий для процесса PasswordHasher с настройками из config.
+    """
+    global _default_hasher
+    if _default_hasher is None:
+        with _default_lock:
+            if _default_hasher is None:
+                _default_hasher = PasswordHasher(
+                    workers=config.HASH_WORKERS,
+                    max_pending=config.HASH_MAX_PENDING,
+                    method=config.HASH_METHOD,
+                    salt_length=config.HASH_SALT_LENGTH
+                )
+    return _default_hasher
@@ -0,0 +1,234 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import config
+
+# Поля записи, которые попадают в JSON, если заданы (через extra или фильтр контекста)
+CONTEXT_FIELDS = ("request_id", "ip", "route", "method", "status", "latency_ms")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись в одну строку JSON.
+    """
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Дописывает в запись поля текущего запроса (request_id, ip, route).
+    Работает в потоке, который пишет в лог, до постановки записи в очередь.
+    """
+    def __init__(self, provider):
+        """
+        :param provider: Функция без аргументов, возвращающая словарь полей
+            текущего запроса или None вне запроса.
+        """
+        super().__init__()
+        self.provider = provider
+
+    def filter(self, record):
+        context = self.provider()
+        if context:
+            for field, value in context.items():
+                if getattr(record, field, None) is None:
+                    setattr(record, field, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей уровня INFO и ниже; предупреждения и
+    ошибки проходят всегда. Запись с extra={"sample": False} не отбрасывается.
+    """
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if self.rate >= 1.0 or record.levelno > logging.INFO or not getattr(record, "sample", True):
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.Handler):
+    """
+    Кладёт запись в ограниченную очередь и сразу возвращает управление.
+    При переполнении запись отбрасывается и учитывается в dropped.
+    """
+    def __init__(self, log_queue):
+        super().__init__()
+        self.queue = log_queue
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            # Сообщение и исключение форматируем здесь: аргументы могут измениться позже
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class BatchWriter:
+    """
+    Фоновый поток: забирает записи из очереди пачками и пишет каждую пачку
+    одним вызовом write в файл и/или консоль.
+    """
+    def __init__(self, log_queue, streams, formatter, batch_size=256, flush_interval=0.5):
+        self.queue = log_queue
+        self.streams = streams
+        self.formatter = formatter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.batches = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _drain(self, block):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=self.flush_interval) if block else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.formatter.format(record))
+            except Exception:
+                lines.append(json.dumps({"level": "ERROR", "msg": f"Unformattable log record: {record.msg!r}"}))
+        payload = "\n".join(lines) + "\n"
+        for stream in self.streams:
+            try:
+                stream.write(payload)
+                stream.flush()
+            except Exception:
+                pass
+        self.written += len(batch)
+        self.batches += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(block=True)
+            if batch:
+                self._write(batch)
+        # Остановка: дописываем всё, что успело попасть в очередь
+        while True:
+            batch = self._drain(block=False)
+            if not batch:
+                break
+            self._write(batch)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        for stream in self.streams:
+            if stream not in (sys.stdout, sys.stderr):
+                stream.close()
+
+
+_pipeline = None
+
+
+def setup_logging(context_provider=None):
+    """
+    Настраивает корневой логгер: запись в лог только ставит её в очередь,
+    форматирование в JSON и запись на диск/в консоль выполняет фоновый поток.
+    Повторный вызов ничего не делает.
+    :param context_provider: Функция, возвращающая поля текущего запроса.
+    :return: Обработчик очереди (для метрик dropped).
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline[0]
+
+    streams = []
+    if config.LOG_FILE:
+        streams.append(open(config.LOG_FILE, "a", encoding="utf-8"))
+    if config.LOG_CONSOLE:
+        streams.append(sys.stderr)
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    # Сначала выборка: отброшенной записи контекст не нужен
+    handler.addFilter(SamplingFilter(config.LOG_INFO_SAMPLE_RATE))
+    if context_provider is not None:
+        handler.addFilter(ContextFilter(context_provider))
+
+    writer = BatchWriter(log_queue, streams, JsonFormatter(),
+                         batch_size=config.LOG_BATCH_SIZE, flush_interval=config.LOG_FLUSH_INTERVAL)
+    writer.start()
+    atexit.register(writer.stop)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL)
+    _pipeline = (handler, writer)
+    return handler
+
+
+def logging_stats():
+    """
+    Возвращает счётчики конвейера логирования или None, если он не настроен.
+    """
+    if _pipeline is None:
+        return None
+    handler, writer = _pipeline
+    sampled_out = sum(f.dropped for f in handler.filters if isinstance(f, SamplingFilter))
+    return {
+        "queued": handler.queue.qsize(),
+        "dropped": handler.dropped,
+        "sampled_out": sampled_out,
+        "written": writer.written,
+        "batches": writer.batches,
+    }
+
+
+def elapsed_ms(started):
+    """
+    Миллисекунды, прошедшие с момента started (time.monotonic()).
+    """
+    return round((time.monotonic() - started) * 1000, 3)
@@ -0,0 +1,242 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+
+# Границы корзин гистограмм задержки, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labelvalues -> [счётчики по корзинам + переполнение, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        for labelvalues, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик и сборщиков, отдаваемых в текстовом формате Prometheus.
+    """
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, prefix, stats, counters=()):
+        """
+        Подключает компонент со своим методом stats(): каждое числовое поле
+        словаря отдаётся как метрика {prefix}_{поле}.
+        :param stats: Функция без аргументов, возвращающая словарь или None.
+        :param counters: Поля, которые только растут (тип counter); остальные — gauge.
+        """
+        self._collectors.append((prefix, stats, frozenset(counters)))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats, counters in self._collectors:
+            values = stats()
+            if not values:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{key}"
+                kind = "counter" if key in counters else "gauge"
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+http_latency = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("route", "method"))
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.")
+db_calls = registry.counter(
+    "db_method_calls_total", "Database method calls.", ("method",))
+db_errors = registry.counter(
+    "db_method_errors_total", "Database method calls that raised.", ("method",))
+db_latency = registry.histogram(
+    "db_method_duration_seconds", "Database method duration.", ("method",))
+db_queries = registry.counter(
+    "db_queries_total", "SQL statements executed, by calling Database method.", ("method",))
+password_hash_latency = registry.histogram(
+    "password_hash_duration_seconds", "Password hash/check latency including queue wait.")
+
+# Метод Database, выполняющийся в текущем потоке или задаче (для счётчика запросов)
+_current_method = contextvars.ContextVar("db_method", default=None)
+
+
+class InstrumentedCursor:
+    """
+    Обёртка курсора: считает выполненные запросы по текущему методу Database.
+    """
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        db_queries.inc(_current_method.get() or "other")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        db_queries.inc(_current_method.get() or "other")
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+def instrument_methods(cls, skip=()):
+    """
+    Оборачивает публичные методы класса: число вызовов, ошибок и длительность.
+    Вложенные вызовы учитываются отдельно, запросы относятся к внешнему методу.
+    """
+    for name, func in list(vars(cls).items()):
+        if name.startswith("_") or name in skip or not inspect.isfunction(func):
+            continue
+        if inspect.isgeneratorfunction(func):
+            continue
+        setattr(cls, name, _instrument(name, func))
+    return cls
+
+
+def _instrument(name, func):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            token = _current_method.set(_current_method.get() or name)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                db_errors.inc(name)
+                raise
+            finally:
+                db_latency.observe(time.perf_counter() - started, name)
+                db_calls.inc(name)
+                _current_method.reset(token)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_method.set(_current_method.get() or name)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            db_errors.inc(name)
+            raise
+        finally:
+            db_latency.observe(time.perf_counter() - started, name)
+            db_calls.inc(name)
+            _current_method.reset(token)
+    return wrapper
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
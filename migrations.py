@@ -0,0 +1,367 @@
+"""
+Версионные миграции схемы, только вперёд.
+
+Применённые версии записываются в таблицу schema_migrations. Миграции
+выполняются при создании Database (config.DB_MIGRATE_ON_START) или вручную:
+
+    python migrations.py            # применить недостающие
+    python migrations.py --status   # показать применённые и ожидающие
+
+Каждая миграция проверяет, что уже есть в схеме, поэтому её можно
+безопасно применить к базе, восстановленной из data-dump.sql или
+созданной вручную. Изменять уже выпущенную миграцию нельзя — только
+добавлять новую с большим номером.
+"""
+import argparse
+import logging
+
+import config
+from shards import create_shard_backends
+from storage import create_backend
+
+# Список (версия, описание, функция(cursor, dialect)) в порядке применения
+MIGRATIONS = []
+
+# Имя блокировки MySQL, под которой миграции применяет только один процесс
+_MYSQL_LOCK = "auth_server_schema_migrations"
+# Сколько секунд ждать блокировку, пока миграции применяет другой процесс
+_MYSQL_LOCK_TIMEOUT = 60
+
+
+def migration(version, description):
+    def register(func):
+        if MIGRATIONS and MIGRATIONS[-1][0] >= version:
+            raise ValueError(f"Миграция {version} объявлена не по порядку")
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def _has_table(cursor, dialect, table):
+    if dialect == "mysql":
+        cursor.execute(
+            "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+            (table,)
+        )
+    else:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (table,))
+    return cursor.fetchone() is not None
+
+
+def _has_column(cursor, dialect, table, column):
+    if dialect == "mysql":
+        cursor.execute(
+            "SELECT 1 FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column)
+        )
+        return cursor.fetchone() is not None
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _has_index(cursor, dialect, table, index):
+    if dialect == "mysql":
+        cursor.execute(
+            "SELECT 1 FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            (table, index)
+        )
+    else:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s",
+                       (table, index))
+    return cursor.fetchone() is not None
+
+
+def _create_index(cursor, dialect, table, index, columns, unique=False):
+    if not _has_index(cursor, dialect, table, index):
+        cursor.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {index} ON {table} ({', '.join(columns)})")
+
+
+# Таблицы data-dump.sql; в SQLite AUTO_INCREMENT даёт INTEGER PRIMARY KEY
+_BASE_TABLES = {
+    "mysql": (
+        "CREATE TABLE IF NOT EXISTS users ("
+        "id int NOT NULL AUTO_INCREMENT, username varchar(50) NOT NULL, password_hash varchar(255) NOT NULL, "
+        "PRIMARY KEY (id), UNIQUE KEY username (username)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci",
+        "CREATE TABLE IF NOT EXISTS characters ("
+        "id int NOT NULL AUTO_INCREMENT, user_id int NOT NULL, name varchar(50) NOT NULL, "
+        "level int DEFAULT '1', health int DEFAULT '100', mana int DEFAULT '50', "
+        "strength int DEFAULT '10', agility int DEFAULT '10', intelligence int DEFAULT '10', "
+        "PRIMARY KEY (id), KEY user_id (user_id), "
+        "CONSTRAINT characters_ibfk_1 FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci",
+        "CREATE TABLE IF NOT EXISTS items ("
+        "id int NOT NULL AUTO_INCREMENT, name varchar(100) NOT NULL, description text, type varchar(50) NOT NULL, "
+        "weight float DEFAULT '0', value int DEFAULT '0', PRIMARY KEY (id)"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci",
+        "CREATE TABLE IF NOT EXISTS inventory ("
+        "character_id int NOT NULL, item_id int NOT NULL, quantity int DEFAULT '1', "
+        "PRIMARY KEY (character_id, item_id), KEY item_id (item_id), "
+        "CONSTRAINT inventory_ibfk_1 FOREIGN KEY (character_id) REFERENCES characters (id) ON DELETE CASCADE, "
+        "CONSTRAINT inventory_ibfk_2 FOREIGN KEY (item_id) REFERENCES items (id) ON DELETE CASCADE"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci",
+        "CREATE TABLE IF NOT EXISTS equipment ("
+        "character_id int NOT NULL, item_id int NOT NULL, slot varchar(50) NOT NULL, "
+        "PRIMARY KEY (character_id, slot), KEY item_id (item_id), "
+        "CONSTRAINT equipment_ibfk_1 FOREIGN KEY (character_id) REFERENCES characters (id) ON DELETE CASCADE, "
+        "CONSTRAINT equipment_ibfk_2 FOREIGN KEY (item_id) REFERENCES items (id) ON DELETE CASCADE"
+        ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci",
+    ),
+    "sqlite": (
+        "CREATE TABLE IF NOT EXISTS users ("
+        "id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL UNIQUE, password_hash VARCHAR(255) NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS characters ("
+        "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE, "
+        "name VARCHAR(50) NOT NULL, level INTEGER DEFAULT 1, health INTEGER DEFAULT 100, mana INTEGER DEFAULT 50, "
+        "strength INTEGER DEFAULT 10, agility INTEGER DEFAULT 10, intelligence INTEGER DEFAULT 10)",
+        "CREATE INDEX IF NOT EXISTS user_id ON characters (user_id)",
+        "CREATE TABLE IF NOT EXISTS items ("
+        "id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT, type VARCHAR(50) NOT NULL, "
+        "weight FLOAT DEFAULT 0, value INTEGER DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS inventory ("
+        "character_id INTEGER NOT NULL REFERENCES characters (id) ON DELETE CASCADE, "
+        "item_id INTEGER NOT NULL REFERENCES items (id) ON DELETE CASCADE, quantity INTEGER DEFAULT 1, "
+        "PRIMARY KEY (character_id, item_id))",
+        "CREATE TABLE IF NOT EXISTS equipment ("
+        "character_id INTEGER NOT NULL REFERENCES characters (id) ON DELETE CASCADE, "
+        "item_id INTEGER NOT NULL REFERENCES items (id) ON DELETE CASCADE, slot VARCHAR(50) NOT NULL, "
+        "PRIMARY KEY (character_id, slot))",
+    ),
+}
+
+
+@migration(1, "Таблицы из data-dump.sql")
+def _base_tables(cursor, dialect):
+    for statement in _BASE_TABLES[dialect]:
+        cursor.execute(statement)
+
+
+@migration(2, "Колонки class, race, xp, gold у characters")
+def _character_columns(cursor, dialect):
+    columns = (
+        ("class", "varchar(50) NOT NULL DEFAULT ''", "name"),
+        ("race", "varchar(50) NOT NULL DEFAULT ''", "class"),
+        ("xp", "int DEFAULT '0'", "intelligence"),
+        ("gold", "int DEFAULT '0'", "xp"),
+    )
+    for column, definition, after in columns:
+        if _has_column(cursor, dialect, "characters", column):
+            continue
+        # В SQLite колонки добавляются только в конец, поэтому запросы перечисляют колонки явно
+        position = f" AFTER {after}" if dialect == "mysql" else ""
+        cursor.execute(f"ALTER TABLE characters ADD COLUMN {column} {definition}{position}")
+
+
+@migration(3, "Таблица item_stats")
+def _item_stats(cursor, dialect):
+    if dialect == "mysql":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS item_stats ("
+            "item_id int NOT NULL, strength int DEFAULT '0', agility int DEFAULT '0', intelligence int DEFAULT '0', "
+            "health int DEFAULT '0', mana int DEFAULT '0', PRIMARY KEY (item_id), "
+            "CONSTRAINT item_stats_ibfk_1 FOREIGN KEY (item_id) REFERENCES items (id) ON DELETE CASCADE"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+    else:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS item_stats ("
+            "item_id INTEGER PRIMARY KEY REFERENCES items (id) ON DELETE CASCADE, strength INTEGER DEFAULT 0, "
+            "agility INTEGER DEFAULT 0, intelligence INTEGER DEFAULT 0, health INTEGER DEFAULT 0, mana INTEGER DEFAULT 0)"
+        )
+
+
+@migration(4, "Таблица revoked_tokens")
+def _revoked_tokens(cursor, dialect):
+    if dialect == "mysql":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+            "id bigint NOT NULL AUTO_INCREMENT, jti char(32) NOT NULL, expires_at datetime NOT NULL, "
+            "revoked_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "PRIMARY KEY (id), UNIQUE KEY jti (jti), KEY expires_at (expires_at)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+    else:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, jti CHAR(32) NOT NULL UNIQUE, expires_at DATETIME NOT NULL, "
+            "revoked_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS expires_at ON revoked_tokens (expires_at)")
+
+
+@migration(5, "Уникальный индекс по имени персонажа")
+def _character_name_unique(cursor, dialect):
+    # Упадёт, если в таблице уже есть одинаковые имена: их нужно переименовать вручную
+    _create_index(cursor, dialect, "characters", "name", ("name",), unique=True)
+
+
+@migration(6, "Покрывающие индексы инвентаря и экипировки")
+def _covering_indexes(cursor, dialect):
+    # Проверка экипировки: COUNT(*) по (character_id, item_id) без чтения строк
+    _create_index(cursor, dialect, "equipment", "character_item", ("character_id", "item_id"))
+    if dialect == "sqlite":
+        # В InnoDB первичный ключ кластерный и уже покрывает эти запросы;
+        # в SQLite строки лежат отдельно, и индекс должен содержать все колонки
+        _create_index(cursor, dialect, "inventory", "inventory_covering", ("character_id", "item_id", "quantity"))
+        _create_index(cursor, dialect, "equipment", "equipment_covering", ("character_id", "slot", "item_id"))
+
+
+@migration(7, "Счётчик версий персонажа для ETag")
+def _character_version(cursor, dialect):
+    if not _has_column(cursor, dialect, "characters", "version"):
+        # Растёт при каждом изменении персонажа, его инвентаря или экипировки
+        cursor.execute("ALTER TABLE characters ADD COLUMN version int NOT NULL DEFAULT 0")
+
+
+@migration(8, "Таблицы шардирования: счётчики ID и реестр имён персонажей")
+def _sharding_tables(cursor, dialect):
+    # id_sequences используется на шардах, character_names — на основной базе (см. shards.py)
+    if dialect == "mysql":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS id_sequences ("
+            "bucket int NOT NULL, last_value int NOT NULL, PRIMARY KEY (bucket)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS character_names ("
+            "name varchar(50) NOT NULL, character_id int NOT NULL, PRIMARY KEY (name)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+    else:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS id_sequences (bucket INTEGER PRIMARY KEY, last_value INTEGER NOT NULL)"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS character_names (name VARCHAR(50) PRIMARY KEY, character_id INTEGER NOT NULL)"
+        )
+
+
+@migration(9, "Таблица outbox событий инвентаря и экипировки")
+def _outbox(cursor, dialect):
+    # Строки удаляет диспетчер после доставки (см. outbox.py)
+    if dialect == "mysql":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id bigint NOT NULL AUTO_INCREMENT, character_id int NOT NULL, type varchar(32) NOT NULL, "
+            "payload varchar(1024) NOT NULL, created_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "PRIMARY KEY (id)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+    else:
+        # AUTOINCREMENT: ID удалённых (доставленных) событий не выдаются повторно
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, character_id INTEGER NOT NULL, type VARCHAR(32) NOT NULL, "
+            "payload VARCHAR(1024) NOT NULL, created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+
+
+def _ensure_version_table(cursor, dialect):
+    if dialect == "mysql":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version int NOT NULL, description varchar(255) NOT NULL, "
+            "applied_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (version)"
+            ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci"
+        )
+    else:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, "
+            "applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+
+
+def applied_versions(connection, dialect):
+    cursor = connection.cursor()
+    try:
+        if not _has_table(cursor, dialect, "schema_migrations"):
+            return set()
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+
+def migrate(connection, dialect):
+    """
+    Применяет недостающие миграции по порядку.
+    В MySQL DDL не транзакционен, поэтому версия записывается после каждой
+    миграции; в SQLite все миграции выполняются одной транзакцией.
+    :return: Список применённых версий.
+    """
+    cursor = connection.cursor()
+    applied = []
+    locked = False
+    try:
+        if dialect == "mysql":
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (_MYSQL_LOCK, _MYSQL_LOCK_TIMEOUT))
+            # 1 — получена, 0 — истёк таймаут (миграции идут в другом процессе), NULL — ошибка
+            locked = cursor.fetchone()[0] == 1
+            if not locked:
+                raise RuntimeError(
+                    f"Не удалось получить блокировку миграций {_MYSQL_LOCK} за {_MYSQL_LOCK_TIMEOUT} с: "
+                    "миграции уже применяет другой процесс"
+                )
+        else:
+            cursor.execute("BEGIN IMMEDIATE")
+        _ensure_version_table(cursor, dialect)
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+        for version, description, func in MIGRATIONS:
+            if version in done:
+                continue
+            logging.info(f"Применяется миграция {version}: {description}")
+            func(cursor, dialect)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            if dialect == "mysql":
+                connection.commit()
+            applied.append(version)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        # Освобождаем только блокировку, полученную этим соединением
+        if locked:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (_MYSQL_LOCK,))
+            cursor.fetchone()
+        cursor.close()
+    if applied:
+        logging.info(f"Схема обновлена до версии {applied[-1]}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument("--status", action="store_true", help="Только показать состояние")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Основная база и шарды персонажей (config.DB_SHARDS) мигрируют одинаково
+    targets = [("main", create_backend(config.DB_BACKEND))]
+    targets += create_shard_backends(config.DB_SHARDS, config.DB_BACKEND)
+    for name, backend in targets:
+        if len(targets) > 1:
+            print(f"[{name}]")
+        connection = backend.connect()
+        try:
+            if args.status:
+                done = applied_versions(connection, backend.dialect)
+                for version, description, _ in MIGRATIONS:
+                    print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {description}")
+            else:
+                applied = migrate(connection, backend.dialect)
+                print(f"Applied: {applied}" if applied else "Schema is up to date")
+        finally:
+            connection.close()
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
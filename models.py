@@ -1,19 +1,24 @@
-import mysql.connector
-from werkzeug.security import generate_password_hash, check_password_hash
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
 import re
 import logging
 import jwt
 from datetime import datetime, timedelta, timezone
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),  # Логи в файл
-        logging.StreamHandler()  # Логи в консоль
-    ]
-)
+import config
+from catalog import ItemCatalog
+from fastjson import dumps, encode_records
+from hashing import default_hasher
+from metrics import InstrumentedCursor, instrument_methods
+from pool import ConnectionPool, PoolTimeout
+from replicas import RecentWrites, create_replica_set
+from shards import create_shard_map
+from migrations import migrate
+from write_behind import WriteBehindBuffer
+from storage import DatabaseError, DisconnectError, IntegrityError, create_backend, is_duplicate_key
 
 def validate_character_name(name):
     """
@@ -29,6 +34,83 @@ def validate_character_name(name):
         return False  # Имя может содержать только буквы, цифры и пробелы
     return True
 
+# Слоты, в которые можно надеть предмет каждого типа
+ITEM_SLOTS = {
+    "weapon": ("weapon", "offhand"),
+    "shield": ("offhand",),
+    "armor": ("head", "chest", "hands", "legs", "feet"),
+    "accessory": ("neck", "ring"),
+}
+
+# Характеристики, которые дают предметы
+STAT_NAMES = ("strength", "agility", "intelligence", "health", "mana")
+
+# Поля персонажа, которые меняются приращениями (increment_character)
+CHARACTER_DELTA_FIELDS = STAT_NAMES + ("xp", "gold")
+
+# Блокировка строки персонажа: все операции с экипировкой персонажа выполняются по очереди
+LOCK_CHARACTER_QUERY = "SELECT id FROM characters WHERE id = %s FOR UPDATE"
+# Увеличивает версию персонажа (для ETag) и блокирует его строку
+BUMP_VERSION_QUERY = "UPDATE characters SET version = version + 1 WHERE id = %s"
+# Количество предмета в инвентаре, сколько его уже надето и что сейчас в слоте
+EQUIP_STATE_QUERY = (
+    "SELECT "
+    "(SELECT quantity FROM inventory WHERE character_id = %s AND item_id = %s FOR SHARE), "
+    "(SELECT COUNT(*) FROM equipment WHERE character_id = %s AND item_id = %s FOR SHARE), "
+    "(SELECT item_id FROM equipment WHERE character_id = %s AND slot = %s FOR SHARE)"
+)
+SLOT_ITEM_QUERY = "SELECT item_id FROM equipment WHERE character_id = %s AND slot = %s FOR SHARE"
+
+
+def validate_slot(item_type, slot):
+    """
+    Проверяет, можно ли надеть предмет данного типа в слот.
+    """
+    return slot in ITEM_SLOTS.get(item_type, ())
+
+
+def stats_delta_query(character_id, added=None, removed=None):
+    """
+    Строит один UPDATE, который прибавляет характеристики надетого предмета
+    и вычитает характеристики снятого.
+    :return: Пара (query, params) или None, если изменений нет.
+    """
+    updates = []
+    params = []
+    for stat in STAT_NAMES:
+        delta = (added or {}).get(stat, 0) - (removed or {}).get(stat, 0)
+        if delta != 0:
+            updates.append(f"{stat} = {stat} + %s")
+            params.append(delta)
+    if not updates:
+        return None
+    params.append(character_id)
+    return f"UPDATE characters SET {', '.join(updates)} WHERE id = %s", tuple(params)
+
+
+def character_deltas_query(deltas):
+    """
+    Строит один UPDATE, который прибавляет приращения сразу нескольким персонажам:
+    field = field + CASE id WHEN ... THEN ... ELSE 0 END.
+    :param deltas: Словарь character_id -> {поле: приращение}.
+    :return: Пара (query, params) или None, если изменений нет.
+    """
+    ids = sorted(deltas)
+    updates = []
+    params = []
+    for field in CHARACTER_DELTA_FIELDS:
+        cases = [(character_id, deltas[character_id][field]) for character_id in ids if deltas[character_id].get(field)]
+        if not cases:
+            continue
+        updates.append(f"{field} = {field} + CASE id {' '.join(['WHEN %s THEN %s'] * len(cases))} ELSE 0 END")
+        params.extend(value for case in cases for value in case)
+    if not updates:
+        return None
+    updates.append("version = version + 1")
+    params.extend(ids)
+    return f"UPDATE characters SET {', '.join(updates)} WHERE id IN ({', '.join(['%s'] * len(ids))})", tuple(params)
+
+
 class User:
     """
     Класс для работы с пользователями.
@@ -42,8 +124,9 @@ class User:
         Проверяет, совпадает ли пароль с хэшем.
         :param password: Пароль для проверки.
         :return: True, если пароль верный, иначе False.
+        :raises HashingBusy: Если очередь хэширования заполнена.
         """
-        return check_password_hash(self.password_hash, password)
+        return default_hasher().check_password(self.password_hash, password)
 
     def generate_token(self, secret_key, expires_in=3600):
         """
@@ -58,35 +141,496 @@ class User:
         }
         return jwt.encode(payload, secret_key, algorithm='HS256')
 
+# Колонки персонажа в порядке character_from_row
+CHARACTER_COLUMNS = "id, user_id, name, class, race, level, health, mana, strength, agility, intelligence, xp, gold"
+
+
+def character_from_row(row):
+    return {
+        "id": row[0],
+        "user_id": row[1],
+        "name": row[2],
+        "class": row[3],
+        "race": row[4],
+        "level": row[5],
+        "health": row[6],
+        "mana": row[7],
+        "strength": row[8],
+        "agility": row[9],
+        "intelligence": row[10],
+        "xp": row[11],
+        "gold": row[12]
+    }
+
+
+def outbox_query(events):
+    """
+    Строит многострочный INSERT событий в outbox.
+    :param events: Кортежи (character_id, тип события, данные — словарь).
+    :return: Пара (query, params) или None, если событий нет.
+    """
+    if not events:
+        return None
+    return (
+        f"INSERT INTO outbox (character_id, type, payload) VALUES {', '.join(['(%s, %s, %s)'] * len(events))}",
+        tuple(value for character_id, kind, data in events
+              for value in (character_id, kind, dumps(data).decode("utf-8")))
+    )
+
+
+def sharded(by):
+    """
+    Выполняет метод Database на шарде, которому принадлежит первый аргумент:
+    by="user" — user_id, by="character" — ID персонажа. Без шардов метод
+    работает с основной базой.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, key, *args, **kwargs):
+            if self.shards is None:
+                return method(self, key, *args, **kwargs)
+            shard = self.shards.for_user(key) if by == "user" else self.shards.for_character(key)
+            with self._on_shard(shard):
+                return method(self, key, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class Database:
-    def __init__(self):
+    def __init__(self, pool_size=None, hasher=None, backend=None, migrate_schema=None, connect=True):
+        """
+        :param pool_size: Размер пула соединений. 0 — одно общее соединение
+            на все потоки; None — значение из config.DB_POOL_SIZE.
+        :param hasher: PasswordHasher; по умолчанию общий для процесса.
+        :param backend: Хранилище из storage; по умолчанию config.DB_BACKEND.
+        :param migrate_schema: Применить недостающие миграции при создании;
+            None — значение из config.DB_MIGRATE_ON_START.
+        :param connect: False — не подключаться сразу; соединения, потоки
+            и реплики создаёт open() (в каждом рабочем процессе после fork).
+        """
+        if pool_size is None:
+            pool_size = config.DB_POOL_SIZE
+        self.backend = backend or create_backend(config.DB_BACKEND)
+        if pool_size > 0 and self.backend.max_connections:
+            pool_size = min(pool_size, self.backend.max_connections)
+        self.hasher = hasher or default_hasher()
+        self.catalog = ItemCatalog(self._load_catalog, max_size=config.CATALOG_MAX_SIZE, ttl=config.CATALOG_TTL)
+        self.pool = None
+        self.replicas = None
+        self.recent_writes = None
+        self.shards = None
+        self.write_behind = None
+        # События изменений инвентаря и экипировки в outbox (см. outbox.py)
+        self.outbox_enabled = config.OUTBOX_ENABLED
+        self.opened = False
+        self._pool_size = pool_size
+        self._migrate_schema = migrate_schema
+        self._open_lock = threading.Lock()
+        self._local = threading.local()
+        if connect:
+            self.open()
+
+    def open(self):
+        """
+        Подключается к базе, применяет миграции и запускает фоновые потоки
+        (отложенная запись, проверка реплик). Повторный вызов ничего не делает.
+        :raises DatabaseError: Если база недоступна; open() можно вызвать снова.
+        """
+        with self._open_lock:
+            if self.opened:
+                return
+            self._open()
+            self.opened = True
+
+    def _open(self):
+        pool_size = self._pool_size
+        migrate_schema = self._migrate_schema
         try:
-            self.connection = mysql.connector.connect(
-                host="localhost",
-                user="app_user",  # Имя пользователя
-                password="secure_password",  # Пароль пользователя
-                database="auth_server"  # Имя базы данных
-            )
-            self.cursor = self.connection.cursor()
-            logging.info("Подключение к базе данных успешно установлено.")
-        except mysql.connector.Error as err:
+            if pool_size > 0:
+                self.pool = ConnectionPool(
+                    pool_size,
+                    timeout=config.DB_POOL_TIMEOUT,
+                    ping_interval=config.DB_POOL_PING_INTERVAL,
+                    connect=self.backend.connect
+                )
+                # Сразу проверяем, что база доступна
+                self.pool.release(self.pool.acquire())
+                logging.info(f"Пул соединений с базой данных {self.backend.name} создан (размер: {pool_size}).")
+            else:
+                self._shared_connection = self.backend.connect()
+                self._shared_cursor = InstrumentedCursor(self._shared_connection.cursor())
+                logging.info(f"Подключение к базе данных {self.backend.name} успешно установлено.")
+            if config.DB_MIGRATE_ON_START if migrate_schema is None else migrate_schema:
+                with self.session():
+                    migrate(self.connection, self.backend.dialect)
+        except DatabaseError as err:
             logging.error(f"Ошибка подключения к базе данных: {err}")
+            if self.pool is not None:
+                self.pool.close_all()
+                self.pool = None
             raise
+        if config.CHARACTER_WRITE_BEHIND:
+            self.write_behind = WriteBehindBuffer(self._flush_character_deltas,
+                                                  interval=config.CHARACTER_FLUSH_INTERVAL,
+                                                  max_pending=config.CHARACTER_FLUSH_MAX_PENDING)
+        if config.DB_REPLICAS and self.backend.dialect == "mysql":
+            self.replicas = create_replica_set(config.DB_REPLICAS)
+            self.recent_writes = RecentWrites(config.REPLICA_PIN_WINDOW)
+            logging.info(f"Чтение с реплик: {', '.join(config.DB_REPLICAS)}")
+        if config.DB_SHARDS:
+            self.shards = create_shard_map(config.DB_SHARDS, config.DB_BACKEND, pool_size or None)
+            if config.DB_MIGRATE_ON_START if migrate_schema is None else migrate_schema:
+                for shard in self.shards.shards:
+                    connection = shard.pool.acquire()
+                    try:
+                        migrate(connection, shard.backend.dialect)
+                    finally:
+                        shard.pool.release(connection)
+
+    @property
+    def connection(self):
+        """
+        Соединение текущего потока. В режиме пула берётся из пула при первом
+        обращении и удерживается до вызова release(). Внутри _on_shard —
+        соединение с этим шардом.
+        """
+        shard = getattr(self._local, "shard", None)
+        if shard is not None:
+            return self._shard_connection(shard)[0]
+        if self.pool is None:
+            return self._shared_connection
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self.pool.acquire()
+            self._local.connection = connection
+            self._local.cursor = InstrumentedCursor(connection.cursor())
+        return connection
+
+    @property
+    def cursor(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is not None:
+            return self._shard_connection(shard)[1]
+        if self.pool is None:
+            return self._shared_cursor
+        self.connection
+        return self._local.cursor
+
+    def release(self, discard=False):
+        """
+        Возвращает соединение текущего потока в пул. Вызывается в конце запроса.
+        :param discard: True, если соединение нужно закрыть, а не вернуть в пул.
+        """
+        self._release_replica(discard)
+        self._release_shards(discard)
+        if self.pool is None:
+            return
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+        cursor = self._local.cursor
+        self._local.connection = None
+        self._local.cursor = None
+        try:
+            cursor.close()
+        except DatabaseError:
+            discard = True
+        self.pool.release(connection, discard=discard)
+
+    @contextmanager
+    def session(self):
+        """
+        Удерживает одно соединение на время блока (выдача на операцию).
+        Если соединение уже было взято потоком, блок его не освобождает.
+        """
+        owned = ((self.pool is not None or self.replicas is not None or self.shards is not None)
+                 and getattr(self._local, "connection", None) is None
+                 and getattr(self._local, "replica_connection", None) is None
+                 and not getattr(self._local, "shard_connections", None))
+        try:
+            yield self
+        except DisconnectError:
+            if owned:
+                self.release(discard=True)
+                owned = False
+            raise
+        finally:
+            if owned:
+                self.release()
+
+    def pool_stats(self):
+        """
+        Возвращает метрики пула соединений или None без пула.
+        """
+        return self.pool.stats() if self.pool is not None else None
+
+    def replica_stats(self):
+        """
+        Возвращает метрики чтения с реплик или None без реплик.
+        """
+        if self.replicas is None:
+            return None
+        stats = self.replicas.stats()
+        stats["pinned_keys"] = self.recent_writes.size()
+        return stats
+
+    def shard_stats(self):
+        """
+        Возвращает метрики шардирования или None без шардов.
+        """
+        return self.shards.stats() if self.shards is not None else None
+
+    @contextmanager
+    def _on_shard(self, shard):
+        """
+        Направляет запросы потока (connection, cursor, _read) на шард;
+        shard=None — на основную базу.
+        """
+        previous = getattr(self._local, "shard", None)
+        self._local.shard = shard
+        try:
+            yield shard
+        finally:
+            self._local.shard = previous
+
+    def _shard_connection(self, shard):
+        """
+        Соединение и курсор потока для шарда; удерживаются до release().
+        """
+        held = getattr(self._local, "shard_connections", None)
+        if held is None:
+            held = self._local.shard_connections = {}
+        entry = held.get(shard.name)
+        if entry is None:
+            connection = shard.pool.acquire()
+            entry = held[shard.name] = (connection, InstrumentedCursor(connection.cursor()), shard)
+        return entry
+
+    def _release_shards(self, discard=False):
+        held = getattr(self._local, "shard_connections", None)
+        if not held:
+            return
+        self._local.shard_connections = {}
+        for connection, cursor, shard in held.values():
+            broken = discard
+            try:
+                cursor.close()
+            except DatabaseError:
+                broken = True
+            shard.pool.release(connection, discard=broken)
+
+    def _replica_cursor(self, pins):
+        """
+        Курсор реплики текущего потока или None, если читать нужно с основного
+        сервера: реплик нет, все недоступны или данные недавно записывались.
+        Соединение реплики, как и основное, удерживается до release().
+        """
+        if self.replicas is None:
+            return None
+        if (pins and self.recent_writes.pinned(pins)) or getattr(self._local, "pinned_until", 0.0) > time.time():
+            self.replicas.count("pinned_reads")
+            return None
+        cursor = getattr(self._local, "replica_cursor", None)
+        if cursor is None:
+            acquired = self.replicas.acquire()
+            if acquired is None:
+                return None
+            self._local.replica, connection = acquired
+            self._local.replica_connection = connection
+            cursor = self._local.replica_cursor = InstrumentedCursor(connection.cursor())
+        return cursor
+
+    def _release_replica(self, discard=False):
+        connection = getattr(self._local, "replica_connection", None)
+        if connection is None:
+            return
+        cursor = self._local.replica_cursor
+        replica = self._local.replica
+        self._local.replica_connection = None
+        self._local.replica_cursor = None
+        self._local.replica = None
+        try:
+            cursor.close()
+        except DatabaseError:
+            discard = True
+        replica.pool.release(connection, discard=discard)
+
+    def _read(self, query, params=(), pins=(), one=False):
+        """
+        Выполняет читающий запрос на реплике, если можно, иначе на основном сервере.
+        При ошибке реплика исключается до следующей проверки, запрос повторяется на основном.
+        :param pins: Ключи читаемых данных для окна read-your-writes (см. _wrote).
+        :param one: Вернуть одну строку (fetchone) вместо списка.
+        """
+        if getattr(self._local, "shard", None) is not None:
+            # У шардов нет реплик
+            self.cursor.execute(query, params)
+            return self.cursor.fetchone() if one else self.cursor.fetchall()
+        cursor = self._replica_cursor(pins)
+        if cursor is not None:
+            try:
+                cursor.execute(query, params)
+                result = cursor.fetchone() if one else cursor.fetchall()
+                self.replicas.count("replica_reads")
+                return result
+            except DatabaseError as err:
+                replica = self._local.replica
+                logging.warning(f"Чтение с реплики {replica.name} не удалось, читаем с основного сервера: {err}")
+                replica.mark_failed(err)
+                self._release_replica(discard=True)
+        if self.replicas is not None:
+            self.replicas.count("primary_reads")
+        self.cursor.execute(query, params)
+        return self.cursor.fetchone() if one else self.cursor.fetchall()
+
+    def _bump_versions(self, character_ids):
+        """
+        Увеличивает версию персонажей в текущей транзакции (без commit).
+        Версия меняется при любом изменении персонажа, его инвентаря или экипировки.
+        UPDATE блокирует строки персонажей; если до этого персонаж не был
+        заблокирован, вызывать до записи в inventory и equipment.
+        """
+        ids = sorted(set(character_ids))
+        if ids:
+            self.cursor.execute(
+                f"UPDATE characters SET version = version + 1 WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                tuple(ids)
+            )
+
+    def _append_events(self, *events):
+        """
+        Добавляет события в outbox текущей транзакции (без commit). Вызывается
+        после _bump_versions: строка персонажа уже заблокирована, поэтому
+        события одного персонажа получают ID в порядке commit'ов.
+        :param events: Кортежи (character_id, тип события, данные).
+        """
+        if not self.outbox_enabled:
+            return
+        insert = outbox_query(events)
+        if insert:
+            self.cursor.execute(*insert)
+
+    def outbox_sources(self):
+        """
+        Базы с таблицей outbox: "main" или имена шардов.
+        """
+        if self.shards is None:
+            return ["main"]
+        return [shard.name for shard in self.shards.shards]
+
+    def _outbox_shard(self, source):
+        if self.shards is None:
+            return None
+        return next(shard for shard in self.shards.shards if shard.name == source)
+
+    def read_outbox(self, source, limit=500):
+        """
+        Возвращает самые старые события outbox базы source по возрастанию ID.
+        :return: Список словарей {"source", "id", "character_id", "type", "data", "created_at"}.
+        """
+        with self._on_shard(self._outbox_shard(source)):
+            try:
+                self.cursor.execute(
+                    "SELECT id, character_id, type, payload, created_at FROM outbox ORDER BY id LIMIT %s", (limit,)
+                )
+                rows = self.cursor.fetchall()
+            finally:
+                # Следующее чтение должно видеть события, закоммиченные после этого
+                self.connection.rollback()
+        return [{
+            "source": source,
+            "id": row[0],
+            "character_id": row[1],
+            "type": row[2],
+            "data": json.loads(row[3]),
+            "created_at": row[4].isoformat(" ") if hasattr(row[4], "isoformat") else row[4]
+        } for row in rows]
+
+    def ack_outbox(self, source, event_ids):
+        """
+        Удаляет доставленные события из outbox базы source.
+        """
+        if not event_ids:
+            return
+        with self._on_shard(self._outbox_shard(source)):
+            try:
+                self.cursor.execute(
+                    f"DELETE FROM outbox WHERE id IN ({', '.join(['%s'] * len(event_ids))})", tuple(event_ids)
+                )
+                self.connection.commit()
+            except DatabaseError:
+                self.connection.rollback()
+                raise
+
+    @sharded("character")
+    def get_character_version(self, character_id):
+        """
+        Возвращает версию персонажа (для ETag) или None, если персонажа нет.
+        Читает только строку characters, без экипировки и предметов.
+        """
+        result = self._read(
+            "SELECT version FROM characters WHERE id = %s",
+            (character_id,), pins=(("character", character_id),), one=True
+        )
+        return result[0] if result else None
+
+    @sharded("character")
+    def get_character_owner(self, character_id):
+        """
+        Возвращает user_id владельца персонажа или None, если персонажа нет.
+        """
+        result = self._read(
+            "SELECT user_id FROM characters WHERE id = %s",
+            (character_id,), pins=(("character", character_id),), one=True
+        )
+        return result[0] if result else None
+
+    def _wrote(self, *keys):
+        """
+        Отмечает записанные данные: их чтения какое-то время идут на основной сервер.
+        Ключи: ("user", username), ("owner", user_id), ("character", id), ("items",).
+        """
+        if self.recent_writes is not None:
+            self.recent_writes.mark(*keys)
+            self._local.wrote_at = time.time()
+
+    def pin_reads(self, wrote_at=None):
+        """
+        Начинает запрос в текущем потоке: если клиент сам писал (в любом
+        процессе) меньше REPLICA_PIN_WINDOW секунд назад, все чтения запроса
+        идут на основной сервер. Окно RecentWrites действует только внутри
+        процесса, поэтому время записи клиент приносит с собой (cookie или
+        заголовок, см. last_write).
+        :param wrote_at: Время последней записи клиента (time.time()) или None.
+        """
+        self._local.wrote_at = None
+        self._local.pinned_until = 0.0
+        if self.recent_writes is not None and wrote_at is not None:
+            # Время из будущего не продлевает окно дольше, чем запись «сейчас»
+            self._local.pinned_until = min(wrote_at, time.time()) + self.recent_writes.window
+
+    def last_write(self):
+        """
+        Время записи в текущем запросе (time.time()) или None, если запрос
+        ничего не писал или реплик нет.
+        """
+        return getattr(self._local, "wrote_at", None)
 
     def add_user(self, username, password, ip_address=None):
-        password_hash = generate_password_hash(password)
+        password_hash = self.hasher.hash_password(password)
         try:
             self.cursor.execute(
                 "INSERT INTO users (username, password_hash) VALUES (%s, %s)",
                 (username, password_hash)
             )
             self.connection.commit()
+            self._wrote(("user", username))
             if ip_address:
                 logging.info(f"Пользователь {username} успешно зарегистрирован [IP: {ip_address}]")
             else:
                 logging.info(f"Пользователь {username} успешно зарегистрирован")
             return True
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             if ip_address:
                 logging.error(f"Ошибка при регистрации пользователя {username} [IP: {ip_address}]: {err}")
             else:
@@ -94,19 +638,70 @@ class Database:
             return False
 
     def get_user(self, username):
-        self.cursor.execute("SELECT id, username, password_hash FROM users WHERE username = %s", (username,))
-        result = self.cursor.fetchone()
+        result = self._read(
+            "SELECT id, username, password_hash FROM users WHERE username = %s",
+            (username,), pins=(("user", username),), one=True
+        )
         if result:
             return {"id": result[0], "username": result[1], "password_hash": result[2]}
         return None
 
+    def revoke_token(self, jti, expires_at):
+        """
+        Заносит токен в список отозванных.
+        :param jti: Идентификатор токена.
+        :param expires_at: Время истечения токена (UTC, без часового пояса).
+        :return: True при успехе, иначе False.
+        """
+        try:
+            self.cursor.execute(
+                "INSERT INTO revoked_tokens (jti, expires_at) VALUES (%s, %s) "
+                f"{self.backend.on_conflict(('jti',))} jti = jti",
+                (jti, expires_at)
+            )
+            self.connection.commit()
+            return True
+        except DatabaseError as err:
+            logging.error(f"Ошибка при отзыве токена {jti}: {err}")
+            return False
+
+    def is_token_revoked(self, jti):
+        self.cursor.execute("SELECT 1 FROM revoked_tokens WHERE jti = %s", (jti,))
+        return self.cursor.fetchone() is not None
+
+    def get_revoked_tokens_since(self, last_id):
+        """
+        Возвращает отозванные токены, добавленные после записи last_id.
+        :return: Список пар (id, jti) по возрастанию id.
+        """
+        self.cursor.execute(
+            "SELECT id, jti FROM revoked_tokens WHERE id > %s AND expires_at > UTC_TIMESTAMP() ORDER BY id",
+            (last_id,)
+        )
+        return self.cursor.fetchall()
+
+    def purge_revoked_tokens(self):
+        """
+        Удаляет записи об отзыве уже истёкших токенов.
+        """
+        try:
+            self.cursor.execute("DELETE FROM revoked_tokens WHERE expires_at <= UTC_TIMESTAMP()")
+            self.connection.commit()
+            return self.cursor.rowcount
+        except DatabaseError as err:
+            logging.error(f"Ошибка при очистке отозванных токенов: {err}")
+            return 0
+
     def is_character_name_unique(self, name):
         """
         Проверяет, уникально ли имя персонажа.
         :param name: Имя персонажа.
         :return: True, если имя уникально, иначе False.
         """
-        self.cursor.execute("SELECT id FROM characters WHERE name = %s", (name,))
+        if self.shards is not None:
+            self.cursor.execute("SELECT character_id FROM character_names WHERE name = %s", (name,))
+        else:
+            self.cursor.execute("SELECT id FROM characters WHERE name = %s", (name,))
         result = self.cursor.fetchone()
         return result is None
 
@@ -114,44 +709,109 @@ class Database:
         if not validate_character_name(name):
             logging.warning(f"Невалидное имя персонажа: {name}")
             return False  # Имя не прошло валидацию
+        values = (class_name, race, level, health, mana, strength, agility, intelligence, xp, gold)
+        if self.shards is not None:
+            return self._create_sharded_character(user_id, name, values)
 
-        if not self.is_character_name_unique(name):
-            logging.warning(f"Имя персонажа уже занято: {name}")
-            return False  # Имя уже занято
-
+        # Уникальность имени проверяет уникальный индекс characters.name
         try:
             self.cursor.execute(
                 "INSERT INTO characters (user_id, name, class, race, level, health, mana, strength, agility, intelligence, xp, gold) "
                 "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
-                (user_id, name, class_name, race, level, health, mana, strength, agility, intelligence, xp, gold)
+                (user_id, name) + values
             )
             self.connection.commit()
+            self._wrote(("owner", user_id))
             return True
-        except mysql.connector.Error as err:
+        except IntegrityError as err:
+            self.connection.rollback()
+            if is_duplicate_key(err):
+                logging.warning(f"Имя персонажа уже занято: {name}")
+            else:
+                logging.error(f"Ошибка при создании персонажа {name}: {err}")
+            return False
+        except DatabaseError as err:
             logging.error(f"Ошибка при создании персонажа {name}: {err}")
             return False
 
+    def _create_sharded_character(self, user_id, name, values):
+        """
+        create_character при шардировании: персонаж пишется на шард владельца
+        с ID от ShardMap.next_character_id. Индекс characters.name видит только
+        имена своего шарда, поэтому имя сначала занимается в реестре
+        character_names на основной базе и освобождается, если запись не удалась.
+        """
+        shard = self.shards.for_user(user_id)
+        with self._on_shard(shard):
+            try:
+                character_id = self.shards.next_character_id(self.cursor, shard.backend, user_id)
+                if not self._claim_character_name(name, character_id):
+                    self.connection.rollback()
+                    return False
+            except DatabaseError as err:
+                self.connection.rollback()
+                logging.error(f"Ошибка при создании персонажа {name}: {err}")
+                return False
+            try:
+                self.cursor.execute(
+                    "INSERT INTO characters (id, user_id, name, class, race, level, health, mana, strength, agility, intelligence, xp, gold) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (character_id, user_id, name) + values
+                )
+                self.connection.commit()
+            except DatabaseError as err:
+                self.connection.rollback()
+                self._release_character_name(name, character_id)
+                logging.error(f"Ошибка при создании персонажа {name} на шарде {shard.name}: {err}")
+                return False
+        self._wrote(("owner", user_id))
+        return True
+
+    def _claim_character_name(self, name, character_id):
+        """
+        Занимает имя в реестре character_names на основной базе (commit сразу).
+        :return: True, если имя было свободно или уже принадлежит персонажу.
+        """
+        with self._on_shard(None):
+            try:
+                self.cursor.execute(
+                    "INSERT INTO character_names (name, character_id) VALUES (%s, %s)", (name, character_id)
+                )
+                self.connection.commit()
+                return True
+            except IntegrityError as err:
+                self.connection.rollback()
+                if not is_duplicate_key(err):
+                    raise
+            self.cursor.execute("SELECT character_id FROM character_names WHERE name = %s", (name,))
+            owner = self.cursor.fetchone()
+        if owner is not None and owner[0] == character_id:
+            return True
+        logging.warning(f"Имя персонажа уже занято: {name}")
+        return False
+
+    def _release_character_name(self, name, character_id):
+        with self._on_shard(None):
+            try:
+                self.cursor.execute(
+                    "DELETE FROM character_names WHERE name = %s AND character_id = %s", (name, character_id)
+                )
+                self.connection.commit()
+            except DatabaseError as err:
+                self.connection.rollback()
+                logging.error(f"Не удалось освободить имя персонажа {name}: {err}")
+
+    @sharded("user")
     def get_character(self, user_id):
-        self.cursor.execute("SELECT * FROM characters WHERE user_id = %s", (user_id,))
-        result = self.cursor.fetchone()
+        result = self._read(
+            f"SELECT {CHARACTER_COLUMNS} FROM characters WHERE user_id = %s",
+            (user_id,), pins=(("owner", user_id),), one=True
+        )
         if result:
-            return {
-                "id": result[0],
-                "user_id": result[1],
-                "name": result[2],
-                "class": result[3],
-                "race": result[4],
-                "level": result[5],
-                "health": result[6],
-                "mana": result[7],
-                "strength": result[8],
-                "agility": result[9],
-                "intelligence": result[10],
-                "xp": result[11],
-                "gold": result[12]
-            }
+            return character_from_row(result)
         return None
 
+    @sharded("character")
     def update_character(self, character_id, name=None, class_name=None, race=None, level=None, health=None, mana=None, strength=None, agility=None, intelligence=None, xp=None, gold=None):
         try:
             updates = []
@@ -160,9 +820,6 @@ class Database:
                 if not validate_character_name(name):
                     logging.warning(f"Невалидное имя персонажа: {name}")
                     return False  # Имя не прошло валидацию
-                if not self.is_character_name_unique(name):
-                    logging.warning(f"Имя персонажа уже занято: {name}")
-                    return False  # Имя уже занято
                 updates.append("name = %s")
                 params.append(name)
             if class_name is not None:
@@ -197,16 +854,143 @@ class Database:
                 params.append(gold)
 
             if updates:
+                updates.append("version = version + 1")
                 query = f"UPDATE characters SET {', '.join(updates)} WHERE id = %s"
                 params.append(character_id)
-                self.cursor.execute(query, tuple(params))
-                self.connection.commit()
+                # При шардировании новое имя занимается в общем реестре, старое освобождается
+                previous_name = None
+                if name is not None and self.shards is not None:
+                    row = self._read("SELECT name FROM characters WHERE id = %s", (character_id,), one=True)
+                    if row is None:
+                        return False
+                    if not self._claim_character_name(name, character_id):
+                        self.connection.rollback()
+                        return False
+                    previous_name = row[0] if row[0] != name else None
+                try:
+                    # Накопленные приращения записываются раньше: заданные здесь значения их перекрывают
+                    self._commit_with_pending(character_id, (query, tuple(params)))
+                except DatabaseError:
+                    if previous_name is not None:
+                        self._release_character_name(name, character_id)
+                    raise
+                if previous_name is not None:
+                    self._release_character_name(previous_name, character_id)
+                self._wrote(("character", character_id))
                 return True
             return False
-        except mysql.connector.Error as err:
+        except IntegrityError as err:
+            self.connection.rollback()
+            if is_duplicate_key(err):
+                logging.warning(f"Имя персонажа уже занято: {name}")
+            else:
+                logging.error(f"Ошибка при обновлении персонажа {character_id}: {err}")
+            return False
+        except DatabaseError as err:
             logging.error(f"Ошибка при обновлении персонажа {character_id}: {err}")
             return False
 
+    @sharded("character")
+    def increment_character(self, character_id, sync=False, **deltas):
+        """
+        Прибавляет к характеристикам персонажа приращения (xp=50, gold=-10, health=-5).
+        При отложенной записи (config.CHARACTER_WRITE_BEHIND) приращение копится
+        в памяти и попадает в базу с ближайшей пачкой.
+        :param sync: Записать сразу, вместе с накопленными приращениями персонажа
+            (для критичных изменений, например списания золота при покупке).
+        :return: True, если приращение принято (при sync — записано), иначе False.
+        """
+        unknown = set(deltas) - set(CHARACTER_DELTA_FIELDS)
+        if unknown:
+            logging.warning(f"Недопустимые поля приращения персонажа {character_id}: {sorted(unknown)}")
+            return False
+        if self.write_behind is not None and not sync:
+            self.write_behind.add(character_id, deltas)
+            return True
+        try:
+            self._commit_with_pending(character_id, character_deltas_query({character_id: deltas}))
+            self._wrote(("character", character_id))
+            return True
+        except DatabaseError as err:
+            logging.error(f"Ошибка при изменении характеристик персонажа {character_id}: {err}")
+            return False
+
+    def _commit_with_pending(self, character_id, statement=None):
+        """
+        Одной транзакцией записывает несброшенные приращения персонажа и statement.
+        Фоновый сброс на это время ждёт, поэтому изменения ложатся в базу по порядку.
+        :param statement: Пара (query, params) или None.
+        """
+        if self.write_behind is None:
+            if statement:
+                self.cursor.execute(*statement)
+            self.connection.commit()
+            return
+        with self.write_behind.hold():
+            pending = self.write_behind.take(character_id)
+            try:
+                if pending:
+                    self._write_character_deltas({character_id: pending})
+                if statement:
+                    self.cursor.execute(*statement)
+                self.connection.commit()
+            except DatabaseError:
+                self.connection.rollback()
+                if pending:
+                    self.write_behind.restore({character_id: pending})
+                raise
+
+    def _write_character_deltas(self, deltas):
+        """
+        Выполняет многострочные UPDATE приращений (по _BATCH_SIZE персонажей), без commit.
+        """
+        ids = sorted(deltas)
+        for start in range(0, len(ids), self._BATCH_SIZE):
+            update = character_deltas_query({character_id: deltas[character_id]
+                                             for character_id in ids[start:start + self._BATCH_SIZE]})
+            if update:
+                self.cursor.execute(*update)
+        self._wrote(*(("character", character_id) for character_id in ids))
+
+    def _flush_character_deltas(self, deltas):
+        # Вызывается фоновым потоком WriteBehindBuffer со своим соединением
+        if self.shards is None:
+            with self.session():
+                try:
+                    self._write_character_deltas(deltas)
+                    self.connection.commit()
+                except DatabaseError:
+                    self.connection.rollback()
+                    raise
+            return None
+        # Каждый шард — своей транзакцией; приращения упавших шардов вернутся в буфер
+        failed = {}
+        for shard, character_ids in self.shards.group_characters(deltas).items():
+            with self.session(), self._on_shard(shard):
+                try:
+                    self._write_character_deltas({character_id: deltas[character_id] for character_id in character_ids})
+                    self.connection.commit()
+                except DatabaseError as err:
+                    self.connection.rollback()
+                    logging.error(f"Отложенная запись на шард {shard.name} не удалась: {err}")
+                    failed.update((character_id, deltas[character_id]) for character_id in character_ids)
+        return failed
+
+    def flush_writes(self):
+        """
+        Сразу записывает все накопленные приращения персонажей.
+        :return: True, если запись прошла успешно или писать было нечего.
+        """
+        if self.write_behind is None:
+            return True
+        return self.write_behind.flush()
+
+    def write_behind_stats(self):
+        """
+        Возвращает метрики отложенной записи или None, если она выключена.
+        """
+        return self.write_behind.stats() if self.write_behind is not None else None
+
     def add_item(self, name, description, item_type, weight=0, value=0):
         try:
             self.cursor.execute(
@@ -214,40 +998,91 @@ class Database:
                 (name, description, item_type, weight, value)
             )
             self.connection.commit()
+            self._wrote(("items",))
+            # Сквозная запись в кэш справочника
+            self.catalog.put({
+                "id": self.cursor.lastrowid,
+                "name": name,
+                "description": description,
+                "type": item_type,
+                "weight": weight,
+                "value": value
+            })
             return True
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logging.error(f"Ошибка при добавлении предмета {name}: {err}")
             return False
 
-    def get_item(self, item_id):
-        self.cursor.execute("SELECT * FROM items WHERE id = %s", (item_id,))
-        result = self.cursor.fetchone()
-        if result:
-            return {
-                "id": result[0],
-                "name": result[1],
-                "description": result[2],
-                "type": result[3],
-                "weight": result[4],
-                "value": result[5]
+    def _load_catalog(self, item_ids):
+        """
+        Читает предметы вместе с их характеристиками для кэша справочника.
+        :param item_ids: Список ID или None для всего справочника.
+        :return: Список пар (item, stats); stats — None, если характеристик нет.
+        """
+        query = (
+            "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, "
+            "item_stats.item_id, item_stats.strength, item_stats.agility, item_stats.intelligence, "
+            "item_stats.health, item_stats.mana "
+            "FROM items LEFT JOIN item_stats ON item_stats.item_id = items.id"
+        )
+        params = ()
+        if item_ids is not None:
+            query += f" WHERE items.id IN ({', '.join(['%s'] * len(item_ids))})"
+            params = tuple(item_ids)
+        rows = []
+        # Справочник всегда на основной базе, даже если запрос пришёл из метода шарда
+        with self._on_shard(None):
+            result = self._read(query, params, pins=(("items",),))
+        for row in result:
+            item = {
+                "id": row[0],
+                "name": row[1],
+                "description": row[2],
+                "type": row[3],
+                "weight": row[4],
+                "value": row[5]
             }
+            stats = None
+            if row[6] is not None:
+                stats = {
+                    "item_id": row[6],
+                    "strength": row[7],
+                    "agility": row[8],
+                    "intelligence": row[9],
+                    "health": row[10],
+                    "mana": row[11]
+                }
+            rows.append((item, stats))
+        return rows
+
+    def get_item(self, item_id):
+        entry = self.catalog.get(item_id)
+        if entry:
+            return dict(entry[0])
         return None
 
+    @sharded("character")
     def add_item_to_inventory(self, character_id, item_id, quantity=1):
         try:
+            # Строка персонажа блокируется первой, как в equip_item и unequip_item
+            self._bump_versions([character_id])
             self.cursor.execute(
                 "INSERT INTO inventory (character_id, item_id, quantity) VALUES (%s, %s, %s) "
-                "ON DUPLICATE KEY UPDATE quantity = quantity + %s",
+                f"{self.backend.on_conflict(('character_id', 'item_id'))} quantity = quantity + %s",
                 (character_id, item_id, quantity, quantity)
             )
+            self._append_events((character_id, "inventory_add", {"item_id": item_id, "quantity": quantity}))
             self.connection.commit()
+            self._wrote(("character", character_id))
             return True
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logging.error(f"Ошибка при добавлении предмета {item_id} в инвентарь персонажа {character_id}: {err}")
             return False
 
+    @sharded("character")
     def remove_item_from_inventory(self, character_id, item_id, quantity=1):
         try:
+            self._bump_versions([character_id])
             self.cursor.execute(
                 "UPDATE inventory SET quantity = quantity - %s WHERE character_id = %s AND item_id = %s",
                 (quantity, character_id, item_id)
@@ -256,38 +1091,284 @@ class Database:
                 "DELETE FROM inventory WHERE character_id = %s AND item_id = %s AND quantity <= 0",
                 (character_id, item_id)
             )
+            self._append_events((character_id, "inventory_remove", {"item_id": item_id, "quantity": quantity}))
             self.connection.commit()
+            self._wrote(("character", character_id))
             return True
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logging.error(f"Ошибка при удалении предмета {item_id} из инвентаря персонажа {character_id}: {err}")
             return False
 
+    def bulk_update_inventory(self, changes):
+        """
+        Начисляет и списывает предметы нескольким персонажам одной транзакцией.
+        Все изменения записываются одним многострочным upsert'ом
+        (INSERT ... ON DUPLICATE KEY UPDATE), число запросов не зависит от размера пакета.
+        :param changes: Список словарей {"character_id", "item_id", "quantity"};
+            положительное quantity начисляет предметы, отрицательное — списывает.
+        :return: Пара (успех, результаты) — статус для каждого элемента changes
+            в том же порядке: "ok", "invalid", "unknown_item", "unknown_character",
+            "insufficient_quantity" или "error". Изменения одной пары
+            (персонаж, предмет) применяются по порядку, и статус каждого
+            учитывает предыдущие: после начисления +3 списание -3 проходит.
+
+        При шардировании изменения раскладываются по шардам персонажей и
+        пишутся отдельной транзакцией на каждом шарде: атомарность — только в
+        пределах шарда, успех — если прошли все транзакции.
+        """
+        if self.shards is None or getattr(self._local, "shard", None) is not None:
+            return self._update_inventory_batch(changes)
+        groups = {}
+        for index, change in enumerate(changes):
+            character_id = change.get("character_id") if isinstance(change, dict) else None
+            # Некорректные записи уходят на основную базу: там они только помечаются invalid
+            shard = None
+            if isinstance(character_id, int) and not isinstance(character_id, bool):
+                shard = self.shards.for_character(character_id)
+            groups.setdefault(shard, []).append(index)
+        success = True
+        results = [None] * len(changes)
+        for shard, indexes in groups.items():
+            with self._on_shard(shard):
+                ok, shard_results = self._update_inventory_batch([changes[index] for index in indexes])
+            success = success and ok
+            for index, result in zip(indexes, shard_results):
+                results[index] = result
+        return success, results
+
+    def _update_inventory_batch(self, changes):
+        # bulk_update_inventory на одной базе: основной или текущем шарде
+        results = []
+        for change in changes:
+            character_id = change.get("character_id") if isinstance(change, dict) else None
+            item_id = change.get("item_id") if isinstance(change, dict) else None
+            quantity = change.get("quantity", 1) if isinstance(change, dict) else None
+            valid = all(isinstance(v, int) and not isinstance(v, bool) for v in (character_id, item_id, quantity))
+            results.append({
+                "character_id": character_id,
+                "item_id": item_id,
+                "quantity": quantity,
+                "status": "ok" if valid and quantity != 0 else "invalid"
+            })
+
+        pending = [r for r in results if r["status"] == "ok"]
+        if not pending:
+            return True, results
+
+        # Предметы проверяем по кэшу справочника, без запроса к базе
+        known_items = self.catalog.get_many({r["item_id"] for r in pending})
+        for r in pending:
+            if r["item_id"] not in known_items:
+                r["status"] = "unknown_item"
+        pending = [r for r in pending if r["status"] == "ok"]
+
+        try:
+            character_ids = sorted({r["character_id"] for r in pending})
+            if character_ids:
+                # Строки персонажей блокируются до инвентаря, как в equip_item:
+                # единый порядок блокировок исключает взаимоблокировки
+                self.cursor.execute(
+                    f"SELECT id FROM characters WHERE id IN ({', '.join(['%s'] * len(character_ids))}) "
+                    "ORDER BY id FOR UPDATE",
+                    tuple(character_ids)
+                )
+                existing = {row[0] for row in self.cursor.fetchall()}
+                for r in pending:
+                    if r["character_id"] not in existing:
+                        r["status"] = "unknown_character"
+                pending = [r for r in pending if r["status"] == "ok"]
+
+            # Текущее количество нужно только для пар, у которых есть списания
+            removals = sorted({(r["character_id"], r["item_id"]) for r in pending if r["quantity"] < 0})
+            owned = {}
+            if removals:
+                self.cursor.execute(
+                    "SELECT character_id, item_id, quantity FROM inventory "
+                    f"WHERE (character_id, item_id) IN ({', '.join(['(%s, %s)'] * len(removals))}) FOR UPDATE",
+                    tuple(v for key in removals for v in key)
+                )
+                owned = {(row[0], row[1]): row[2] for row in self.cursor.fetchall()}
+
+            # Изменения одной пары (персонаж, предмет) применяются по порядку:
+            # списание, которому не хватает предметов с учётом предыдущих
+            # изменений пакета, отклоняется, остальные проходят
+            deltas = {}
+            for r in pending:
+                key = (r["character_id"], r["item_id"])
+                delta = deltas.get(key, 0)
+                if owned.get(key, 0) + delta + r["quantity"] < 0:
+                    r["status"] = "insufficient_quantity"
+                    continue
+                deltas[key] = delta + r["quantity"]
+            applied = [r for r in pending if r["status"] == "ok"]
+
+            if applied:
+                keys = sorted(key for key, delta in deltas.items() if delta != 0)
+                if keys:
+                    self.cursor.execute(
+                        "INSERT INTO inventory (character_id, item_id, quantity) "
+                        f"VALUES {', '.join(['(%s, %s, %s)'] * len(keys))} "
+                        f"{self.backend.on_conflict(('character_id', 'item_id'))} "
+                        f"quantity = quantity + {self.backend.inserted('quantity')}",
+                        tuple(v for key in keys for v in (key[0], key[1], deltas[key]))
+                    )
+                if removals:
+                    self.cursor.execute(
+                        "DELETE FROM inventory "
+                        f"WHERE (character_id, item_id) IN ({', '.join(['(%s, %s)'] * len(removals))}) "
+                        "AND quantity <= 0",
+                        tuple(v for key in removals for v in key)
+                    )
+                self._bump_versions(key[0] for key in deltas)
+                self._append_events(*((r["character_id"], "inventory_add" if r["quantity"] > 0 else "inventory_remove",
+                                       {"item_id": r["item_id"], "quantity": abs(r["quantity"])})
+                                      for r in applied))
+            self.connection.commit()
+            self._wrote(*{("character", key[0]) for key in deltas})
+            return True, results
+        except DatabaseError as err:
+            self.connection.rollback()
+            logging.error(f"Ошибка при пакетном изменении инвентаря ({len(changes)} записей): {err}")
+            for r in results:
+                if r["status"] == "ok":
+                    r["status"] = "error"
+            return False, results
+
+    @sharded("character")
     def get_inventory(self, character_id):
         try:
-            self.cursor.execute(
-                "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, inventory.quantity "
-                "FROM inventory "
-                "JOIN items ON inventory.item_id = items.id "
-                "WHERE inventory.character_id = %s",
-                (character_id,)
+            # Из базы берём только строки персонажа, описания предметов — из кэша
+            result = self._read(
+                "SELECT item_id, quantity FROM inventory WHERE character_id = %s",
+                (character_id,), pins=(("character", character_id),)
             )
-            result = self.cursor.fetchall()
+            items = self.catalog.get_many([row[0] for row in result])
             inventory = []
-            for row in result:
-                inventory.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "description": row[2],
-                    "type": row[3],
-                    "weight": row[4],
-                    "value": row[5],
-                    "quantity": row[6]
-                })
+            for item_id, quantity in result:
+                entry = items.get(item_id)
+                if entry:
+                    inventory.append(dict(entry[0], quantity=quantity))
             return inventory
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logging.error(f"Ошибка при получении инвентаря персонажа {character_id}: {err}")
             return None
 
+    @sharded("character")
+    def get_inventory_page(self, character_id, after_item_id=None, limit=100):
+        """
+        Возвращает страницу инвентаря по ключу (character_id, item_id):
+        запрос идёт диапазоном по первичному ключу без OFFSET.
+        :param after_item_id: item_id последней строки предыдущей страницы.
+        :param limit: Размер страницы.
+        :return: Пара (предметы, item_id для следующей страницы или None).
+        """
+        try:
+            result, next_item_id = self._inventory_page_rows(character_id, after_item_id, limit)
+            items = self.catalog.get_many([row[0] for row in result])
+            inventory = []
+            for item_id, quantity in result:
+                entry = items.get(item_id)
+                if entry:
+                    inventory.append(dict(entry[0], quantity=quantity))
+            return inventory, next_item_id
+        except DatabaseError as err:
+            logging.error(f"Ошибка при получении страницы инвентаря персонажа {character_id}: {err}")
+            return None, None
+
+    @sharded("character")
+    def get_inventory_page_json(self, character_id, after_item_id=None, limit=100):
+        """
+        То же, что get_inventory_page, но предметы сразу в виде JSON-массива:
+        строки базы остаются кортежами, а объекты собираются из JSON-префиксов
+        справочника без промежуточных словарей.
+        :return: Пара (JSON-массив bytes, item_id для следующей страницы или None).
+        """
+        try:
+            result, next_item_id = self._inventory_page_rows(character_id, after_item_id, limit)
+            return self._encode_rows(result, "quantity"), next_item_id
+        except DatabaseError as err:
+            logging.error(f"Ошибка при получении страницы инвентаря персонажа {character_id}: {err}")
+            return None, None
+
+    def _inventory_page_rows(self, character_id, after_item_id, limit):
+        result = self._read(
+            "SELECT item_id, quantity FROM inventory "
+            "WHERE character_id = %s AND item_id > %s "
+            "ORDER BY item_id LIMIT %s",
+            (character_id, after_item_id or 0, limit + 1),
+            pins=(("character", character_id),)
+        )
+        has_more = len(result) > limit
+        result = result[:limit]
+        return result, result[-1][0] if has_more else None
+
+    def _encode_rows(self, rows, key):
+        """
+        Кодирует строки (item_id, значение) в JSON-массив предметов с полем key;
+        предметы, которых нет в справочнике, пропускаются.
+        """
+        prefixes = self.catalog.get_prefixes([row[0] for row in rows])
+        rows = [row for row in rows if row[0] in prefixes]
+        return encode_records([prefixes[row[0]] for row in rows], key, [row[1] for row in rows])
+
+    def iter_inventory(self, character_id, batch_size=500):
+        """
+        Построчно отдаёт инвентарь через небуферизованный (серверный) курсор,
+        не загружая весь результат в память.
+        Пока генератор не исчерпан, соединение потока занято им.
+        :param batch_size: Сколько строк забирать с сервера за раз.
+        """
+        if self.shards is None:
+            connection = self.connection
+        else:
+            # Таблица items на основной базе: предметы шарда берутся из справочника
+            with self._on_shard(self.shards.for_character(character_id)):
+                connection = self.connection
+        cursor = InstrumentedCursor(connection.cursor(buffered=False))
+        try:
+            if self.shards is None:
+                cursor.execute(
+                    "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, inventory.quantity "
+                    "FROM inventory "
+                    "JOIN items ON inventory.item_id = items.id "
+                    "WHERE inventory.character_id = %s "
+                    "ORDER BY inventory.item_id",
+                    (character_id,)
+                )
+            else:
+                cursor.execute(
+                    "SELECT item_id, quantity FROM inventory WHERE character_id = %s ORDER BY item_id",
+                    (character_id,)
+                )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if self.shards is not None:
+                    items = self.catalog.get_many({row[0] for row in rows})
+                    rows = [tuple(items[item_id][0][column] for column in
+                                  ("id", "name", "description", "type", "weight", "value")) + (quantity,)
+                            for item_id, quantity in rows if item_id in items]
+                for row in rows:
+                    yield {
+                        "id": row[0],
+                        "name": row[1],
+                        "description": row[2],
+                        "type": row[3],
+                        "weight": row[4],
+                        "value": row[5],
+                        "quantity": row[6]
+                    }
+        finally:
+            try:
+                # Дочитываем остаток, иначе соединение нельзя вернуть в пул
+                if cursor.with_rows:
+                    cursor.fetchall()
+                cursor.close()
+            except DatabaseError as err:
+                logging.error(f"Ошибка при закрытии курсора инвентаря персонажа {character_id}: {err}")
+
+    @sharded("character")
     def get_equipment(self, character_id):
         """
         Возвращает экипировку персонажа.
@@ -295,35 +1376,105 @@ class Database:
         :return: Список экипированных предметов.
         """
         try:
-            self.cursor.execute(
-                "SELECT items.id, items.name, items.description, items.type, items.weight, items.value, equipment.slot "
-                "FROM equipment "
-                "JOIN items ON equipment.item_id = items.id "
-                "WHERE equipment.character_id = %s",
-                (character_id,)
+            result = self._read(
+                "SELECT item_id, slot FROM equipment WHERE character_id = %s",
+                (character_id,), pins=(("character", character_id),)
             )
-            result = self.cursor.fetchall()
+            items = self.catalog.get_many([row[0] for row in result])
             equipment = []
-            for row in result:
-                equipment.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "description": row[2],
-                    "type": row[3],
-                    "weight": row[4],
-                    "value": row[5],
-                    "slot": row[6]
-                })
+            for item_id, slot in result:
+                entry = items.get(item_id)
+                if entry:
+                    equipment.append(dict(entry[0], slot=slot))
             return equipment
-        except mysql.connector.Error as err:
+        except DatabaseError as err:
             logging.error(f"Ошибка при получении экипировки персонажа {character_id}: {err}")
             return None
 
+    @sharded("character")
+    def get_equipment_json(self, character_id):
+        """
+        Экипировка персонажа сразу в виде JSON-массива (см. get_inventory_page_json).
+        :return: bytes или None при ошибке.
+        """
+        try:
+            result = self._read(
+                "SELECT item_id, slot FROM equipment WHERE character_id = %s",
+                (character_id,), pins=(("character", character_id),)
+            )
+            return self._encode_rows(result, "slot")
+        except DatabaseError as err:
+            logging.error(f"Ошибка при получении экипировки персонажа {character_id}: {err}")
+            return None
+
+    def warmup(self, connections=None):
+        """
+        Готовит процесс к приёму запросов: открывает соединения пула,
+        загружает справочник предметов и по разу выполняет горячие запросы,
+        чтобы их разбор и планы (кэш перевода запросов, кэш выражений SQLite,
+        буферы сервера) были готовы до первого клиента.
+        :param connections: Сколько соединений открыть заранее (не больше
+            размера пула); None — весь пул.
+        """
+        started = time.monotonic()
+        if self.pool is not None:
+            count = self.pool.size if connections is None else min(connections, self.pool.size)
+            connections = []
+            try:
+                for _ in range(count):
+                    connections.append(self.pool.acquire())
+            finally:
+                for connection in connections:
+                    self.pool.release(connection)
+        with self.session():
+            self.catalog.preload()
+            self.get_user("")
+            self.get_character(0)
+            self.get_character_version(0)
+            self.get_characters_with_equipment([0])
+            self.get_equipment_json(0)
+            self.get_inventory_page_json(0, None, 1)
+            self.is_token_revoked("")
+        logging.info(f"Прогрев завершён за {time.monotonic() - started:.2f}s")
+
+    def ping(self):
+        """
+        Проверяет, что основной сервер базы отвечает (для проверки готовности).
+        :return: True или False.
+        """
+        if not self.opened:
+            return False
+        try:
+            with self.session():
+                self.cursor.execute("SELECT 1")
+                self.cursor.fetchall()
+            return True
+        except DatabaseError + (PoolTimeout,) as err:
+            logging.warning(f"База данных не отвечает: {err}")
+            return False
+
     def close(self):
-        if self.connection.is_connected():
+        if not self.opened:
+            self.backend.close()
+            return
+        self.opened = False
+        if self.write_behind is not None:
+            self.write_behind.close()
+        if self.replicas is not None:
+            self._release_replica()
+            self.replicas.close()
+        if self.shards is not None:
+            self._release_shards()
+            self.shards.close()
+        if self.pool is not None:
+            self.release()
+            self.pool.close_all()
+            logging.info("Пул соединений с базой данных закрыт.")
+        elif self.connection.is_connected():
             self.cursor.close()
             self.connection.close()
             logging.info("Подключение к базе данных закрыто.")
+        self.backend.close()
 
     def get_item_stats(self, item_id):
         """
@@ -331,19 +1482,12 @@ class Database:
         :param item_id: ID предмета.
         :return: Словарь с характеристиками или None, если предмет не найден.
         """
-        self.cursor.execute("SELECT * FROM item_stats WHERE item_id = %s", (item_id,))
-        result = self.cursor.fetchone()
-        if result:
-            return {
-                "item_id": result[0],
-                "strength": result[1],
-                "agility": result[2],
-                "intelligence": result[3],
-                "health": result[4],
-                "mana": result[5]
-            }
+        entry = self.catalog.get(item_id)
+        if entry and entry[1]:
+            return dict(entry[1])
         return None
 
+    @sharded("character")
     def apply_item_stats(self, character_id, item_id, operation="add"):
         """
         Применяет или снимает характеристики предмета.
@@ -368,96 +1512,180 @@ class Database:
                 params.append(value)
 
         if updates:
+            updates.append("version = version + 1")
             query = f"UPDATE characters SET {', '.join(updates)} WHERE id = %s"
             params.append(character_id)
             self.cursor.execute(query, tuple(params))
             self.connection.commit()
+            self._wrote(("character", character_id))
         return True
 
-    def equip_item(self, character_id, item_id, slot):
+    @sharded("character")
+    def equip_item(self, character_id, item_id, slot, swap=False):
         """
         Экипирует предмет на персонажа и применяет его характеристики.
+        Всё выполняется в одной транзакции под блокировкой строки персонажа.
+        :param swap: True — заменить предмет, уже надетый в слот, сняв его характеристики.
+        :return: Пара (успех, сообщение).
         """
+        entry = self.catalog.get(item_id)
+        if not entry:
+            return False, "Item not found"
+        item, stats = entry
+        if not validate_slot(item["type"], slot):
+            return False, f"Invalid slot {slot} for {item['type']}"
+
         try:
-            # Проверяем, есть ли предмет в инвентаре
+            self.cursor.execute(LOCK_CHARACTER_QUERY, (character_id,))
+            if self.cursor.fetchone() is None:
+                self.connection.rollback()
+                return False, "Character not found"
+
             self.cursor.execute(
-                "SELECT quantity FROM inventory WHERE character_id = %s AND item_id = %s",
-                (character_id, item_id)
+                EQUIP_STATE_QUERY,
+                (character_id, item_id, character_id, item_id, character_id, slot)
             )
-            result = self.cursor.fetchone()
-            if not result or result[0] < 1:
+            quantity, equipped, current_item_id = self.cursor.fetchone()
+            if current_item_id == item_id:
+                self.connection.rollback()
+                return False, "Item already equipped"
+            if current_item_id is not None and not swap:
+                self.connection.rollback()
+                return False, "Slot already occupied"
+            if not quantity or quantity <= equipped:
                 logging.warning(f"Предмет {item_id} отсутствует в инвентаре персонажа {character_id}")
-                return False
+                self.connection.rollback()
+                return False, "Item not in inventory"
 
-            # Применяем характеристики предмета
-            if not self.apply_item_stats(character_id, item_id, operation="add"):
-                logging.warning(f"Не удалось применить характеристики предмета {item_id}")
-                return False
-
-            # Экипируем предмет
+            removed = None
+            if current_item_id is not None:
+                current = self.catalog.get(current_item_id)
+                removed = current[1] if current else None
+            update = stats_delta_query(character_id, added=stats, removed=removed)
+            if update:
+                self.cursor.execute(*update)
             self.cursor.execute(
                 "INSERT INTO equipment (character_id, item_id, slot) VALUES (%s, %s, %s) "
-                "ON DUPLICATE KEY UPDATE item_id = %s",
-                (character_id, item_id, slot, item_id)
+                f"{self.backend.on_conflict(('character_id', 'slot'))} item_id = {self.backend.inserted('item_id')}",
+                (character_id, item_id, slot)
             )
+            self._bump_versions([character_id])
+            self._append_events((character_id, "equip",
+                                 {"item_id": item_id, "slot": slot, "replaced_item_id": current_item_id}))
             self.connection.commit()
+            self._wrote(("character", character_id))
             logging.info(f"Предмет {item_id} экипирован в слот {slot} для персонажа {character_id}")
-            return True
-        except mysql.connector.Error as err:
+            return True, "Item equipped"
+        except DatabaseError as err:
+            self.connection.rollback()
             logging.error(f"Ошибка при экипировке предмета {item_id} для персонажа {character_id}: {err}")
-            return False
+            return False, "Database error"
 
+    def swap_item(self, character_id, item_id, slot):
+        """
+        Заменяет предмет в слоте (или надевает в пустой слот) одной транзакцией.
+        """
+        return self.equip_item(character_id, item_id, slot, swap=True)
+
+    @sharded("character")
     def unequip_item(self, character_id, slot):
         """
         Снимает предмет с персонажа и убирает его характеристики.
+        :return: Пара (успех, сообщение).
         """
         try:
-            # Получаем ID предмета, который нужно снять
-            self.cursor.execute(
-                "SELECT item_id FROM equipment WHERE character_id = %s AND slot = %s",
-                (character_id, slot)
-            )
+            self.cursor.execute(LOCK_CHARACTER_QUERY, (character_id,))
+            if self.cursor.fetchone() is None:
+                self.connection.rollback()
+                return False, "Character not found"
+
+            self.cursor.execute(SLOT_ITEM_QUERY, (character_id, slot))
             result = self.cursor.fetchone()
             if not result:
                 logging.warning(f"Слот {slot} пуст для персонажа {character_id}")
-                return False
+                self.connection.rollback()
+                return False, "Slot is empty"
 
             item_id = result[0]
-
-            # Убираем характеристики предмета
-            if not self.apply_item_stats(character_id, item_id, operation="subtract"):
-                logging.warning(f"Не удалось убрать характеристики предмета {item_id}")
-                return False
-
-            # Снимаем предмет
+            entry = self.catalog.get(item_id)
+            update = stats_delta_query(character_id, removed=entry[1] if entry else None)
+            if update:
+                self.cursor.execute(*update)
             self.cursor.execute(
                 "DELETE FROM equipment WHERE character_id = %s AND slot = %s",
                 (character_id, slot)
             )
+            self._bump_versions([character_id])
+            self._append_events((character_id, "unequip", {"item_id": item_id, "slot": slot}))
             self.connection.commit()
+            self._wrote(("character", character_id))
             logging.info(f"Предмет {item_id} снят со слота {slot} для персонажа {character_id}")
-            return True
-        except mysql.connector.Error as err:
+            return True, "Item unequipped"
+        except DatabaseError as err:
+            self.connection.rollback()
             logging.error(f"Ошибка при снятии предмета со слота {slot} для персонажа {character_id}: {err}")
-            return False
+            return False, "Database error"
+
+    # Сколько ID передавать в один запрос пакетного варианта
+    _BATCH_SIZE = 500
+
+    def get_characters_with_equipment(self, character_ids):
+        """
+        Возвращает характеристики нескольких персонажей с учётом экипировки.
+        equip_item и unequip_item сразу прибавляют и вычитают бонусы предметов
+        в колонках characters, поэтому сохранённые значения уже итоговые:
+        один запрос на каждые _BATCH_SIZE персонажей, без item_stats.
+        :param character_ids: Список ID персонажей.
+        :return: Словарь ID персонажа -> характеристики; отсутствующих персонажей в нём нет.
+        """
+        ids = list(dict.fromkeys(character_ids))
+        characters = {}
+        try:
+            if self.shards is not None:
+                for part in self._scatter(self.shards.group_characters(ids), self._characters_batch):
+                    characters.update(part)
+                return characters
+            return self._characters_batch(ids)
+        except DatabaseError as err:
+            logging.error(f"Ошибка при получении характеристик персонажей {ids[:10]}: {err}")
+            return None
+
+    def _characters_batch(self, character_ids):
+        # get_characters_with_equipment на одной базе: основной или текущем шарде
+        characters = {}
+        for start in range(0, len(character_ids), self._BATCH_SIZE):
+            chunk = character_ids[start:start + self._BATCH_SIZE]
+            rows = self._read(
+                f"SELECT {CHARACTER_COLUMNS} FROM characters WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                tuple(chunk), pins=tuple(("character", character_id) for character_id in chunk)
+            )
+            for row in rows:
+                characters[row[0]] = character_from_row(row)
+        return characters
+
+    def _scatter(self, groups, func):
+        """
+        Выполняет func(keys) на каждом шарде из groups (см. ShardMap.scatter);
+        каждый шард — со своими соединениями, которые освобождаются после.
+        :return: Список результатов.
+        """
+        def run(shard, keys):
+            with self.session():
+                with self._on_shard(shard):
+                    return func(keys)
+        return self.shards.scatter(groups, run)
 
     def get_character_with_equipment(self, character_id):
         """
-        Возвращает характеристики персонажа с учётом экипированных предметов.
+        Возвращает характеристики персонажа с учётом экипированных предметов
+        одним запросом.
         """
-        character = self.get_character(character_id)
-        if not character:
+        characters = self.get_characters_with_equipment([character_id])
+        if not characters:
             return None
+        return characters.get(character_id)
+
 
-        equipment = self.get_equipment(character_id)
-        if equipment:
-            for item in equipment:
-                stats = self.get_item_stats(item["id"])
-                if stats:
-                    character["strength"] += stats.get("strength", 0)
-                    character["agility"] += stats.get("agility", 0)
-                    character["intelligence"] += stats.get("intelligence", 0)
-                    character["health"] += stats.get("health", 0)
-                    character["mana"] += stats.get("mana", 0)
-
-        return character
+# Число вызовов, ошибок, длительность и число запросов для каждого публичного метода
+instrument_methods(Database, skip={"release", "session", "close", "pool_stats", "replica_stats",
+                                      "write_behind_stats", "shard_stats", "outbox_sources", "open", "warmup", "ping"})
@@ -0,0 +1,192 @@
+"""
+Доставка событий изменений инвентаря и экипировки из таблицы outbox.
+
+Database пишет событие в outbox в той же транзакции, что и само изменение
+(config.OUTBOX_ENABLED), а OutboxDispatcher читает outbox пачками по
+возрастанию ID, отдаёт пачку приёмнику и удаляет доставленные строки.
+Доставка «хотя бы один раз»: если процесс упал между отправкой и удалением,
+пачка придёт повторно. ID событий одного персонажа растут в порядке
+commit'ов, поэтому потребитель отбрасывает повторы по (source, id) — всё,
+что не новее последнего увиденного ID персонажа.
+
+Диспетчер должен быть один на все процессы, иначе пачки одного персонажа
+могут прийти не по порядку:
+
+    OUTBOX_ENABLED=1 OUTBOX_SINK=file:/var/lib/auth_server/events.jsonl python outbox.py
+"""
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+
+import config
+import fastjson
+from models import Database
+
+
+class FileSink:
+    """
+    Дописывает события в JSONL-файл, по строке на событие. Файл
+    синхронизируется на диск до того, как события удаляются из outbox.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "ab")
+
+    def send(self, events):
+        self._file.write(b"".join(fastjson.dumps(event) + b"\n" for event in events))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class QueueSink:
+    """
+    Очередь в памяти процесса — замена брокеру для потребителей в том же
+    процессе и для проверок. Заполненная очередь задерживает доставку.
+    """
+    def __init__(self, max_size=10000, timeout=1.0):
+        self.queue = queue.Queue(max_size)
+        self.timeout = timeout
+
+    def send(self, events):
+        for event in events:
+            self.queue.put(event, timeout=self.timeout)
+
+    def close(self):
+        pass
+
+
+# Виды приёмников для config.OUTBOX_SINK ("вид" или "вид:аргумент").
+# Приёмник — объект с методами send(events) (ошибка — исключение) и close()
+SINKS = {"file": FileSink, "queue": QueueSink}
+
+
+def create_sink(spec):
+    kind, _, argument = spec.partition(":")
+    if kind not in SINKS:
+        raise ValueError(f"Неизвестный приёмник событий: {kind}")
+    return SINKS[kind](argument) if argument else SINKS[kind]()
+
+
+class OutboxDispatcher:
+    """
+    Фоновый поток, доставляющий события outbox основной базы или всех
+    шардов. Пока в какой-нибудь базе остаются полные пачки, опрос идёт без
+    паузы, иначе — раз в interval секунд. Ошибка доставки или базы не
+    теряет событий: пачка остаётся в outbox и повторяется на следующем круге.
+    """
+    def __init__(self, db, sink, batch_size=500, interval=0.5):
+        """
+        :param db: Открытая Database.
+        :param sink: Приёмник событий (см. SINKS).
+        """
+        self.db = db
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"delivered": 0, "batches": 0, "failures": 0, "send_time": 0.0}
+
+    def dispatch_once(self):
+        """
+        Доставляет по одной пачке из каждой базы.
+        :return: True, если хотя бы одна пачка была полной (остались события).
+        """
+        more = False
+        for source in self.db.outbox_sources():
+            with self.db.session():
+                events = self.db.read_outbox(source, self.batch_size)
+                if not events:
+                    continue
+                started = time.perf_counter()
+                try:
+                    self.sink.send(events)
+                except Exception as err:
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    logging.error(f"Доставка {len(events)} событий из {source} не удалась, повторим позже: {err}")
+                    continue
+                elapsed = time.perf_counter() - started
+                self.db.ack_outbox(source, [event["id"] for event in events])
+            with self._lock:
+                self._stats["delivered"] += len(events)
+                self._stats["batches"] += 1
+                self._stats["send_time"] += elapsed
+            more = more or len(events) == self.batch_size
+        return more
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                more = self.dispatch_once()
+            except Exception as err:
+                more = False
+                with self._lock:
+                    self._stats["failures"] += 1
+                logging.error(f"Ошибка диспетчера outbox: {err}")
+            if not more:
+                self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        """
+        Останавливает поток после текущего круга и закрывает приёмник.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.sink.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def create_dispatcher(db):
+    """
+    Диспетчер с приёмником и параметрами из config.
+    """
+    return OutboxDispatcher(db, create_sink(config.OUTBOX_SINK), batch_size=config.OUTBOX_BATCH_SIZE,
+                            interval=config.OUTBOX_POLL_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Доставка событий outbox")
+    parser.add_argument("--once", action="store_true", help="Доставить всё накопленное и выйти")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    db = Database(pool_size=1)
+    dispatcher = create_dispatcher(db)
+    try:
+        if args.once:
+            while dispatcher.dispatch_once():
+                pass
+        else:
+            dispatcher.start()
+            while True:
+                time.sleep(60)
+                logging.info(f"Outbox: {dispatcher.stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.close()
+        db.close()
+        logging.info(f"Outbox: {dispatcher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
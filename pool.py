@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+
+from storage import DatabaseError
+
+
+class PoolTimeout(Exception):
+    """
+    Свободное соединение не появилось за отведённое время.
+    """
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с базой данных (MySQL или SQLite из storage).
+
+    Соединения создаются лениво, пока не достигнут размер пула. Соединение,
+    простоявшее без дела дольше ping_interval, перед выдачей проверяется
+    ping'ом и при необходимости пересоздаётся.
+    """
+    def __init__(self, size, timeout=5.0, ping_interval=30.0, connect=None, **connect_args):
+        if size < 1:
+            raise ValueError("Размер пула должен быть больше нуля")
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._connect_args = connect_args
+        self._connect_func = connect or mysql.connector.connect
+        self._idle = deque()  # (соединение, время возврата в пул)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._stats = {
+            "checkouts": 0,  # всего выдано соединений
+            "hits": 0,  # выдано готовое соединение из пула
+            "misses": 0,  # пришлось открыть новое соединение
+            "waits": 0,  # сколько раз ждали освобождения соединения
+            "wait_time": 0.0,  # суммарное время ожидания, секунды
+            "timeouts": 0,  # так и не дождались соединения
+            "reconnects": 0,  # пересоздано после неудачного ping'а
+        }
+
+    def _connect(self):
+        return self._connect_func(**self._connect_args)
+
+    def acquire(self):
+        """
+        Выдаёт соединение из пула, при необходимости дожидаясь освобождения.
+        :return: Соединение с базой данных.
+        :raises PoolTimeout: Если соединение не освободилось за timeout секунд.
+        """
+        started = None
+        with self._available:
+            while True:
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    self._stats["hits"] += 1
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    connection, returned_at = None, None
+                    self._stats["misses"] += 1
+                    break
+                now = time.monotonic()
+                if started is None:
+                    started = now
+                    self._stats["waits"] += 1
+                remaining = self.timeout - (now - started)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    self._stats["wait_time"] += now - started
+                    raise PoolTimeout(f"Нет свободных соединений в пуле (размер {self.size})")
+                self._available.wait(remaining)
+            self._stats["checkouts"] += 1
+            if started is not None:
+                self._stats["wait_time"] += time.monotonic() - started
+
+        # Сетевые операции выполняем вне блокировки
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif time.monotonic() - returned_at > self.ping_interval:
+                connection = self._revive(connection)
+        except Exception:
+            self._forget()
+            raise
+        return connection
+
+    def _revive(self, connection):
+        """
+        Проверяет, живо ли соединение, и заменяет его новым, если нет.
+        """
+        try:
+            connection.ping(reconnect=False)
+            return connection
+        except DatabaseError as err:
+            logging.warning(f"Соединение с базой данных потеряно, переподключаемся: {err}")
+            self._close_quietly(connection)
+            with self._lock:
+                self._stats["reconnects"] += 1
+            return self._connect()
+
+    def release(self, connection, discard=False):
+        """
+        Возвращает соединение в пул.
+        :param connection: Ранее выданное соединение.
+        :param discard: True, если соединение сломано и его нужно закрыть.
+        """
+        if not discard:
+            try:
+                # Не оставляем открытую транзакцию (и её снимок данных) следующему владельцу
+                if connection.in_transaction:
+                    connection.rollback()
+            except DatabaseError:
+                discard = True
+        if discard:
+            self._close_quietly(connection)
+            self._forget()
+            return
+        with self._available:
+            self._idle.append((connection, time.monotonic()))
+            self._available.notify()
+
+    def _forget(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """
+        Закрывает все свободные соединения пула.
+        """
+        with self._available:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._created -= len(idle)
+        for connection, _ in idle:
+            self._close_quietly(connection)
+
+    def stats(self):
+        """
+        Возвращает метрики пула: выдачи, попадания, ожидания, переподключения.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._created
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._created - len(self._idle)
+        return stats
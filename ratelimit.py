@@ -0,0 +1,158 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+rate_limit_rejections = metrics.registry.counter(
+    "rate_limit_rejections_total", "Requests rejected by a rate limiter.", ("limiter",))
+
+
+class MemoryBackend:
+    """
+    Счётчики скользящих окон в памяти процесса.
+
+    На каждый ключ хранится три числа: номер текущего окна, счётчик текущего
+    и счётчик предыдущего окна. Ключей не больше max_keys: при переполнении
+    вытесняются те, к которым дольше всего не обращались.
+    """
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # ключ -> [номер окна, текущий счётчик, предыдущий счётчик]
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _entry(self, key, window_index):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [window_index, 0, 0]
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        elif entry[0] != window_index:
+            # Окно сменилось: текущий счётчик становится предыдущим (или обнуляется, если ключ простаивал)
+            entry[2] = entry[1] if entry[0] == window_index - 1 else 0
+            entry[1] = 0
+            entry[0] = window_index
+        self._entries.move_to_end(key)
+        return entry
+
+    def increment(self, key, window_index, window):
+        with self._lock:
+            entry = self._entry(key, window_index)
+            entry[1] += 1
+            return entry[2], entry[1]
+
+    def peek(self, key, window_index, window):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0, 0
+            if entry[0] == window_index:
+                return entry[2], entry[1]
+            if entry[0] == window_index - 1:
+                return entry[1], 0
+            return 0, 0
+
+    def reset(self, key, window_index):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Общие для всех процессов счётчики в Redis (ключи с истечением через два окна).
+    Требует пакет redis.
+    """
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Для RATE_LIMIT_BACKEND=redis нужен пакет redis") from None
+        self.client = redis.Redis.from_url(url)
+
+    def increment(self, key, window_index, window):
+        current_key = f"rl:{key}:{window_index}"
+        pipe = self.client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, int(window * 2) + 1)
+        pipe.get(f"rl:{key}:{window_index - 1}")
+        current, _, previous = pipe.execute()
+        return int(previous or 0), int(current)
+
+    def peek(self, key, window_index, window):
+        previous, current = self.client.mget(f"rl:{key}:{window_index - 1}", f"rl:{key}:{window_index}")
+        return int(previous or 0), int(current or 0)
+
+    def reset(self, key, window_index):
+        self.client.delete(f"rl:{key}:{window_index}", f"rl:{key}:{window_index - 1}")
+
+    def size(self):
+        return None
+
+
+class RateLimiter:
+    """
+    Ограничение частоты по скользящему окну: оценка числа событий за
+    последние window секунд = предыдущее окно * (непрошедшая доля) + текущее.
+    """
+    def __init__(self, backend, name, limit, window):
+        self.backend = backend
+        self.name = name
+        self.limit = limit
+        self.window = window
+
+    def _estimate(self, previous, current, now):
+        elapsed = (now % self.window) / self.window
+        return previous * (1 - elapsed) + current
+
+    def _retry_after(self, previous, current, now):
+        # Через сколько секунд оценка опустится ниже лимита (не дольше одного окна)
+        elapsed = now % self.window
+        if previous:
+            needed = (previous + current - self.limit) / previous * self.window
+            if 0 < needed - elapsed <= self.window - elapsed:
+                return max(1, math.ceil(needed - elapsed))
+        return max(1, math.ceil(self.window - elapsed))
+
+    def hit(self, key):
+        """
+        Учитывает событие для ключа.
+        :return: Пара (разрешено, через сколько секунд повторить).
+        """
+        now = time.time()
+        previous, current = self.backend.increment(f"{self.name}:{key}", int(now // self.window), self.window)
+        if self._estimate(previous, current, now) <= self.limit:
+            return True, 0
+        rate_limit_rejections.inc(self.name)
+        return False, self._retry_after(previous, current, now)
+
+    def exceeded(self, key):
+        """
+        Проверяет лимит, не учитывая новое событие.
+        :return: Пара (превышен, через сколько секунд повторить).
+        """
+        now = time.time()
+        previous, current = self.backend.peek(f"{self.name}:{key}", int(now // self.window), self.window)
+        if self._estimate(previous, current, now) < self.limit:
+            return False, 0
+        rate_limit_rejections.inc(self.name)
+        return True, self._retry_after(previous, current, now)
+
+    def reset(self, key):
+        self.backend.reset(f"{self.name}:{key}", int(time.time() // self.window))
+
+
+def create_backend(kind, max_keys=100000, redis_url=None):
+    """
+    Создаёт хранилище счётчиков: "memory" (в процессе) или "redis" (общее).
+    """
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    if kind == "memory":
+        return MemoryBackend(max_keys)
+    raise ValueError(f"Неизвестное хранилище ограничителя: {kind}")
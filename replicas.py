@@ -0,0 +1,217 @@
+import itertools
+import logging
+import threading
+import time
+
+import config
+from pool import ConnectionPool, PoolTimeout
+from storage import DatabaseError, MySQLBackend
+
+
+class RecentWrites:
+    """
+    Ключи (персонаж, пользователь, справочник), в которые недавно писали.
+
+    Пока ключ в окне window секунд после записи, его чтения идут на основной
+    сервер: реплика могла ещё не получить изменение (read-your-writes).
+    Окно действует в пределах процесса; между рабочими процессами его
+    переносит сам клиент (Database.pin_reads и last_write).
+    """
+    def __init__(self, window=5.0, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self._until = {}  # ключ -> время (monotonic), до которого чтения идут на основной сервер
+        self._lock = threading.Lock()
+
+    def mark(self, *keys):
+        until = time.monotonic() + self.window
+        with self._lock:
+            for key in keys:
+                self._until[key] = until
+            if len(self._until) > self.max_keys:
+                self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, until in self._until.items() if until <= now]:
+            del self._until[key]
+        # Если и живых ключей слишком много, забываем самые старые записи
+        while len(self._until) > self.max_keys:
+            del self._until[next(iter(self._until))]
+
+    def pinned(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return any(self._until.get(key, 0) > now for key in keys)
+
+    def size(self):
+        return len(self._until)
+
+
+class Replica:
+    """
+    Реплика для чтения: пул соединений и состояние по последней проверке.
+    """
+    def __init__(self, name, backend, pool_size):
+        self.name = name
+        self.backend = backend
+        self.pool = ConnectionPool(pool_size, timeout=config.REPLICA_ACQUIRE_TIMEOUT,
+                                   ping_interval=config.DB_POOL_PING_INTERVAL, connect=backend.connect)
+        self.healthy = False
+        self.lag = None
+        self.last_error = None
+        self._check_connection = None
+
+    def check(self, max_lag):
+        """
+        Проверяет, что реплика отвечает и отстаёт не больше max_lag секунд.
+        """
+        try:
+            if self._check_connection is None:
+                self._check_connection = self.backend.connect()
+            cursor = self._check_connection.cursor()
+            try:
+                self.lag = self._measure_lag(cursor)
+            finally:
+                cursor.close()
+        except DatabaseError as err:
+            self._drop_check_connection()
+            self._set_health(False, f"{err}")
+            return
+        if self.lag is None:
+            self._set_health(False, "replication is not running")
+        elif self.lag > max_lag:
+            self._set_health(False, f"lag {self.lag}s exceeds {max_lag}s")
+        else:
+            self._set_health(True, None)
+
+    def _measure_lag(self, cursor):
+        if self.backend.dialect != "mysql":
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            return 0
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+            column = "Seconds_Behind_Source"
+        except DatabaseError:
+            # MySQL до 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+            column = "Seconds_Behind_Master"
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        names = [description[0] for description in cursor.description]
+        return row[names.index(column)]
+
+    def _set_health(self, healthy, error):
+        if healthy != self.healthy:
+            if healthy:
+                logging.info(f"Реплика {self.name} доступна (отставание {self.lag}s)")
+            else:
+                logging.warning(f"Реплика {self.name} исключена из чтения: {error}")
+        self.healthy = healthy
+        self.last_error = error
+
+    def mark_failed(self, err):
+        self._set_health(False, f"{err}")
+
+    def _drop_check_connection(self):
+        if self._check_connection is not None:
+            try:
+                self._check_connection.close()
+            except Exception:
+                pass
+            self._check_connection = None
+
+    def close(self):
+        self._drop_check_connection()
+        self.pool.close_all()
+
+
+class ReplicaSet:
+    """
+    Набор реплик для чтения с фоновой проверкой состояния.
+
+    Фоновый поток раз в check_interval секунд проверяет каждую реплику и
+    исключает недоступные и отстающие больше max_lag. Чтения распределяются
+    по доступным репликам по кругу; если доступных нет или у реплики нет
+    свободного соединения, чтение выполняется на основном сервере.
+    """
+    def __init__(self, replicas, max_lag=5.0, check_interval=2.0):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+        self._stats = {"replica_reads": 0, "primary_reads": 0, "pinned_reads": 0, "failovers": 0}
+        self._stats_lock = threading.Lock()
+        self.check()
+        self._thread.start()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def acquire(self):
+        """
+        Берёт соединение с доступной реплики.
+        :return: Пара (реплика, соединение) или None — читать с основного сервера.
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if healthy:
+            start = next(self._next)
+            for offset in range(len(healthy)):
+                replica = healthy[(start + offset) % len(healthy)]
+                try:
+                    return replica, replica.pool.acquire()
+                except PoolTimeout:
+                    continue
+                except DatabaseError as err:
+                    replica.mark_failed(err)
+        self.count("failovers")
+        return None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["replicas"] = len(self.replicas)
+        stats["healthy"] = sum(1 for replica in self.replicas if replica.healthy)
+        lags = [replica.lag for replica in self.replicas if replica.healthy and replica.lag is not None]
+        stats["max_lag"] = max(lags) if lags else 0
+        return stats
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        for replica in self.replicas:
+            replica.close()
+
+
+def create_replica_set(addresses, pool_size=None):
+    """
+    Создаёт набор реплик MySQL по списку адресов "host" или "host:port";
+    остальные параметры подключения — как у основного сервера.
+    :return: ReplicaSet или None, если список пуст.
+    """
+    if not addresses:
+        return None
+    replicas = []
+    for address in addresses:
+        connect_args = config.db_connect_args()
+        host, _, port = address.partition(":")
+        connect_args["host"] = host
+        if port:
+            connect_args["port"] = int(port)
+        # Каждое чтение видит свежие данные, а не снимок открытой транзакции
+        connect_args["autocommit"] = True
+        replicas.append(Replica(address, MySQLBackend(connect_args), pool_size or config.DB_POOL_SIZE))
+    return ReplicaSet(replicas, max_lag=config.REPLICA_MAX_LAG, check_interval=config.REPLICA_CHECK_INTERVAL)
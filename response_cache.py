@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    LRU-кэш готовых тел ответов, ключ — (вид ответа, character_id, версия).
+
+    Версия персонажа растёт при каждом изменении, поэтому запись никогда не
+    устаревает: ответ для новой версии просто ищется по новому ключу, а
+    старые записи вытесняются. max_size = 0 выключает кэш.
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (вид, character_id, версия) -> тело ответа
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return body
+
+    def put(self, key, body):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
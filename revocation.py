@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    Компактное вероятностное множество: ложные срабатывания возможны,
+    ложные пропуски — нет.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.bits = max(int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.bits / self.capacity * math.log(2))), 1)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, value):
+        # Повторное добавление (все биты уже стоят) не увеличивает count,
+        # иначе фильтр считался бы заполненным раньше времени
+        added = False
+        for position in self._positions(value):
+            mask = 1 << (position & 7)
+            if not self._array[position >> 3] & mask:
+                self._array[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, value):
+        array = self._array
+        for position in self._positions(value):
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    Список отозванных токенов (jti) в памяти процесса.
+
+    Перед таблицей revoked_tokens стоит фильтр Блума: для почти всех
+    токенов ответ «не отозван» получается без запроса к базе. Только при
+    срабатывании фильтра jti сверяется с таблицей. Фильтр дочитывает новые
+    записи инкрементально (по возрастанию id) не чаще раза в refresh_interval
+    секунд, а при переполнении перестраивается целиком.
+
+    AUTO_INCREMENT выдаёт id до commit'а, поэтому запись с меньшим id может
+    появиться уже после того, как прочитана запись с большим. Каждое
+    дочитывание заново просматривает последние overlap id (уже загруженные
+    пропускаются), а раз в reconcile_interval секунд фильтр перестраивается
+    по всей таблице — на случай транзакций, задержавшихся дольше окна.
+    """
+    def __init__(self, db, capacity=100000, error_rate=0.001, refresh_interval=1.0, overlap=1000,
+                 reconcile_interval=300.0):
+        """
+        :param overlap: Сколько последних id просматривать повторно при дочитывании.
+        :param reconcile_interval: Период полной перестройки фильтра, секунды (0 — не перестраивать).
+        """
+        self.db = db
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.overlap = overlap
+        self.reconcile_interval = reconcile_interval
+        self._filter = BloomFilter(capacity, error_rate)
+        self._last_id = 0
+        self._recent_ids = set()  # загруженные id в окне overlap
+        self._refreshed_at = 0.0
+        self._rebuilt_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "filter_positives": 0, "revoked": 0, "refreshes": 0, "rebuilds": 0,
+                       "late_rows": 0}
+
+    def _load(self, rows):
+        for row_id, jti in rows:
+            if row_id in self._recent_ids:
+                continue
+            self._filter.add(jti)
+            self._recent_ids.add(row_id)
+            if row_id > self._last_id:
+                self._last_id = row_id
+            else:
+                # Запись закоммичена позже записи с большим id
+                self._stats["late_rows"] += 1
+        floor = self._last_id - self.overlap
+        self._recent_ids = {row_id for row_id in self._recent_ids if row_id > floor}
+
+    def _reset(self, rows):
+        self._filter = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+        self._last_id = 0
+        self._recent_ids = set()
+        self._load(rows)
+        self._refreshed_at = self._rebuilt_at = time.monotonic()
+        self._stats["rebuilds"] += 1
+        logging.info(f"Фильтр отозванных токенов перестроен: {len(rows)} записей")
+
+    def _refresh_due(self, now, force):
+        return force or now - self._refreshed_at >= self.refresh_interval
+
+    def _rebuild_due(self, now):
+        return self._filter.count > self._filter.capacity or (
+            self.reconcile_interval > 0 and now - self._rebuilt_at >= self.reconcile_interval)
+
+    def rebuild(self):
+        """
+        Перестраивает фильтр по всем неистёкшим записям таблицы.
+        """
+        self.db.purge_revoked_tokens()
+        rows = self.db.get_revoked_tokens_since(0)
+        with self._lock:
+            self._reset(rows)
+
+    def refresh(self, force=False):
+        """
+        Дочитывает записи, добавленные после последнего обновления, и
+        перестраивает фильтр, если он переполнен или пора сверить его с таблицей.
+        """
+        now = time.monotonic()
+        if not self._refresh_due(now, force):
+            return
+        # Обновляет один поток, остальные продолжают работать со старым фильтром
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if not self._refresh_due(now, force):
+                return
+            self._refreshed_at = now
+            rows = self.db.get_revoked_tokens_since(max(self._last_id - self.overlap, 0))
+            self._load(rows)
+            self._stats["refreshes"] += 1
+            rebuild = self._rebuild_due(now)
+        finally:
+            self._lock.release()
+        if rebuild:
+            self.rebuild()
+
+    def revoke(self, jti, expires_at):
+        """
+        Отзывает токен: пишет в таблицу и сразу добавляет в локальный фильтр.
+        :param jti: Идентификатор токена.
+        :param expires_at: Время истечения токена (datetime), после него запись можно удалить.
+        :return: True при успехе.
+        """
+        if not self.db.revoke_token(jti, expires_at):
+            return False
+        with self._lock:
+            self._filter.add(jti)
+        return True
+
+    def might_be_revoked(self, jti):
+        self.refresh()
+        return jti in self._filter
+
+    def is_revoked(self, jti):
+        """
+        Проверяет, отозван ли токен. К базе обращается только при срабатывании фильтра.
+        """
+        self._stats["checks"] += 1
+        if not self.might_be_revoked(jti):
+            return False
+        self._stats["filter_positives"] += 1
+        revoked = self.db.is_token_revoked(jti)
+        if revoked:
+            self._stats["revoked"] += 1
+        return revoked
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["entries"] = self._filter.count
+        stats["capacity"] = self._filter.capacity
+        stats["filter_bytes"] = len(self._filter._array)
+        return stats
+
+
+class AsyncRevocationList(RevocationList):
+    """
+    RevocationList для asgi.py поверх AsyncDatabase: тот же фильтр и то же
+    окно дочитывания, но методы, обращающиеся к базе, — корутины. Всё
+    выполняется в одном цикле событий, поэтому вместо блокировки потоков
+    одновременное дочитывание исключает флаг.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refreshing = False
+
+    async def rebuild(self):
+        await self.db.purge_revoked_tokens()
+        self._reset(await self.db.get_revoked_tokens_since(0))
+
+    async def refresh(self, force=False):
+        now = time.monotonic()
+        if self._refreshing or not self._refresh_due(now, force):
+            return
+        self._refreshing = True
+        try:
+            self._refreshed_at = now
+            self._load(await self.db.get_revoked_tokens_since(max(self._last_id - self.overlap, 0)))
+            self._stats["refreshes"] += 1
+            rebuild = self._rebuild_due(now)
+        finally:
+            self._refreshing = False
+        if rebuild:
+            await self.rebuild()
+
+    async def revoke(self, jti, expires_at):
+        if not await self.db.revoke_token(jti, expires_at):
+            return False
+        self._filter.add(jti)
+        return True
+
+    async def might_be_revoked(self, jti):
+        await self.refresh()
+        return jti in self._filter
+
+    async def is_revoked(self, jti):
+        self._stats["checks"] += 1
+        if not await self.might_be_revoked(jti):
+            return False
+        self._stats["filter_positives"] += 1
+        revoked = await self.db.is_token_revoked(jti)
+        if revoked:
+            self._stats["revoked"] += 1
+        return revoked
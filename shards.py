@@ -0,0 +1,180 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from pool import ConnectionPool
+from storage import MemoryBackend, MySQLBackend, SQLiteBackend
+
+
+class Shard:
+    """
+    База-шард: персонажи, инвентарь и экипировка пользователей своих корзин.
+    Пользователи, токены и справочник предметов остаются на основной базе,
+    поэтому внешние ключи на них в сессиях шарда не проверяются.
+    """
+    def __init__(self, name, backend, pool_size):
+        self.name = name
+        self.backend = backend
+        if backend.max_connections:
+            pool_size = min(pool_size, backend.max_connections)
+        self.pool = ConnectionPool(pool_size, timeout=config.DB_POOL_TIMEOUT,
+                                   ping_interval=config.DB_POOL_PING_INTERVAL, connect=backend.connect)
+
+    def close(self):
+        self.pool.close_all()
+        self.backend.close()
+
+    def __repr__(self):
+        return f"Shard({self.name})"
+
+
+class ShardMap:
+    """
+    Карта шардов: user_id и ID персонажа -> шард.
+
+    Пользователи раскладываются по buckets виртуальным корзинам
+    (user_id % buckets), корзины — по шардам: по кругу или по явной карте
+    overrides. ID персонажа выдаётся так, что его остаток от деления на
+    buckets равен корзине владельца: шард находится по самому ID, без
+    справочника, а при переносе корзины на другой шард персонажи переезжают
+    вместе с пользователем.
+    """
+    def __init__(self, shards, buckets=1024, overrides=None):
+        """
+        :param shards: Список Shard.
+        :param buckets: Число корзин; после начала работы не меняется — от него зависят ID.
+        :param overrides: Словарь корзина -> имя шарда для перенесённых корзин.
+        """
+        if not shards:
+            raise ValueError("Нужен хотя бы один шард")
+        self.shards = shards
+        self.buckets = buckets
+        by_name = {shard.name: shard for shard in shards}
+        self._bucket_shards = [shards[bucket % len(shards)] for bucket in range(buckets)]
+        for bucket, name in (overrides or {}).items():
+            if name not in by_name:
+                raise ValueError(f"Корзина {bucket} указывает на неизвестный шард {name}")
+            self._bucket_shards[int(bucket)] = by_name[name]
+        # Параллельные запросы к шардам (scatter-gather)
+        self._executor = None
+        if len(shards) > 1:
+            self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="shard-gather")
+        self._stats = {"scatters": 0, "scatter_shards": 0}
+        self._stats_lock = threading.Lock()
+
+    def for_user(self, user_id):
+        return self._bucket_shards[user_id % self.buckets]
+
+    def for_character(self, character_id):
+        return self._bucket_shards[character_id % self.buckets]
+
+    def group_characters(self, character_ids):
+        """
+        Раскладывает ID персонажей по шардам.
+        :return: Словарь шард -> список ID в исходном порядке.
+        """
+        groups = {}
+        for character_id in character_ids:
+            groups.setdefault(self.for_character(character_id), []).append(character_id)
+        return groups
+
+    def next_character_id(self, cursor, backend, user_id):
+        """
+        Выделяет ID нового персонажа пользователя в текущей транзакции шарда:
+        порядковый номер в корзине * buckets + корзина. Счётчик корзины
+        хранится на шарде (id_sequences) и переезжает вместе с корзиной;
+        его строка заблокирована до конца транзакции.
+        :param cursor: Курсор шарда пользователя.
+        """
+        bucket = user_id % self.buckets
+        cursor.execute(
+            "INSERT INTO id_sequences (bucket, last_value) VALUES (%s, 1) "
+            f"{backend.on_conflict(('bucket',))} last_value = last_value + 1",
+            (bucket,)
+        )
+        cursor.execute("SELECT last_value FROM id_sequences WHERE bucket = %s", (bucket,))
+        return cursor.fetchone()[0] * self.buckets + bucket
+
+    def scatter(self, groups, func):
+        """
+        Выполняет func(shard, keys) для каждого шарда из groups: один шард —
+        в текущем потоке, несколько — параллельно. Ошибка любого шарда
+        пробрасывается.
+        :param groups: Словарь шард -> ключи (см. group_characters).
+        :return: Список результатов в порядке groups.
+        """
+        with self._stats_lock:
+            self._stats["scatters"] += 1
+            self._stats["scatter_shards"] += len(groups)
+        if len(groups) <= 1 or self._executor is None:
+            return [func(shard, keys) for shard, keys in groups.items()]
+        futures = [self._executor.submit(func, shard, keys) for shard, keys in groups.items()]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["shards"] = len(self.shards)
+        stats["buckets"] = self.buckets
+        return stats
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+
+def create_shard_backends(addresses, kind):
+    """
+    Создаёт хранилища шардов по списку адресов.
+    Для mysql адрес — "host[:port][/database]" (остальные параметры — как у
+    основного сервера), для sqlite — путь к файлу, для memory — просто имя.
+    :return: Список пар (имя шарда, хранилище).
+    """
+    backends = []
+    for address in addresses:
+        if kind == "mysql":
+            connect_args = config.db_connect_args()
+            location, _, database = address.partition("/")
+            host, _, port = location.partition(":")
+            connect_args["host"] = host
+            if port:
+                connect_args["port"] = int(port)
+            if database:
+                connect_args["database"] = database
+            backend = MySQLBackend(connect_args, foreign_keys=False)
+        elif kind == "sqlite":
+            backend = SQLiteBackend(address, foreign_keys=False)
+        elif kind == "memory":
+            backend = MemoryBackend(foreign_keys=False)
+        else:
+            raise ValueError(f"Неизвестное хранилище базы данных: {kind}")
+        backends.append((address, backend))
+    return backends
+
+
+def load_overrides(path):
+    """
+    Читает карту перенесённых корзин: JSON {"корзина": "имя шарда"}.
+    """
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)
+
+
+def create_shard_map(addresses, kind, pool_size=None):
+    """
+    Создаёт карту шардов по настройкам config.
+    :return: ShardMap или None, если список шардов пуст.
+    """
+    if not addresses:
+        return None
+    shards = [Shard(name, backend, pool_size or config.DB_POOL_SIZE)
+              for name, backend in create_shard_backends(addresses, kind)]
+    shard_map = ShardMap(shards, buckets=config.SHARD_BUCKETS, overrides=load_overrides(config.SHARD_MAP_FILE))
+    logging.info(f"Шарды персонажей: {', '.join(shard.name for shard in shards)} ({shard_map.buckets} корзин)")
+    return shard_map
@@ -0,0 +1,226 @@
+import re
+import sqlite3
+import uuid
+from datetime import datetime
+from functools import lru_cache
+
+import mysql.connector
+
+import config
+
+# Ошибки драйверов, которые Database перехватывает как ошибки базы данных
+DatabaseError = (mysql.connector.Error, sqlite3.Error)
+# Соединение после такой ошибки нельзя возвращать в пул
+DisconnectError = (mysql.connector.OperationalError, mysql.connector.InterfaceError,
+                   sqlite3.InterfaceError, sqlite3.ProgrammingError)
+# Нарушение уникального ключа или внешнего ключа
+IntegrityError = (mysql.connector.IntegrityError, sqlite3.IntegrityError)
+
+# Код ошибки MySQL ER_DUP_ENTRY
+_MYSQL_DUPLICATE_ENTRY = 1062
+
+# Время храним как в MySQL DATETIME: "YYYY-MM-DD HH:MM:SS[.ffffff]", сравнимо с datetime('now')
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+
+def is_duplicate_key(err):
+    """
+    Проверяет, что ошибка — нарушение уникального ключа (а не, например, внешнего).
+    """
+    if isinstance(err, mysql.connector.Error):
+        return err.errno == _MYSQL_DUPLICATE_ENTRY
+    return isinstance(err, sqlite3.IntegrityError) and "UNIQUE constraint failed" in str(err)
+
+
+class MySQLBackend:
+    """
+    Сервер MySQL через mysql.connector. SQL в Database написан на его диалекте.
+    """
+    name = "mysql"
+    # Диалект DDL для миграций
+    dialect = "mysql"
+    # Ограничение на число одновременных соединений (None — только размер пула)
+    max_connections = None
+
+    def __init__(self, connect_args=None, foreign_keys=True):
+        """
+        :param foreign_keys: False — не проверять внешние ключи в сессии
+            (шарды: пользователи и предметы живут на основной базе).
+        """
+        self.connect_args = connect_args or config.db_connect_args()
+        self.foreign_keys = foreign_keys
+
+    def connect(self):
+        connection = mysql.connector.connect(**self.connect_args)
+        if not self.foreign_keys:
+            cursor = connection.cursor()
+            cursor.execute("SET SESSION foreign_key_checks = 0")
+            cursor.close()
+        return connection
+
+    def on_conflict(self, key_columns):
+        """
+        Начало части upsert'а после VALUES; дальше идут присваивания "col = expr".
+        """
+        return "ON DUPLICATE KEY UPDATE"
+
+    def inserted(self, column):
+        """
+        Значение колонки из вставляемой строки внутри части upsert'а.
+        """
+        return f"VALUES({column})"
+
+    def close(self):
+        pass
+
+
+# Замены, переводящие запросы Database с диалекта MySQL на SQLite
+_SQLITE_REWRITES = (
+    (re.compile(r"\s+FOR (UPDATE|SHARE)\b"), ""),
+    (re.compile(r"\bUTC_TIMESTAMP\(\)"), "datetime('now')"),
+    (re.compile(r"\bAS SIGNED\)"), "AS INTEGER)"),
+    (re.compile(r"%s"), "?"),
+)
+_LOCKING_READ = re.compile(r"\bFOR UPDATE\b")
+
+
+@lru_cache(maxsize=1024)
+def _translate(query):
+    for pattern, replacement in _SQLITE_REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class SQLiteCursor:
+    """
+    Курсор sqlite3, принимающий запросы Database в диалекте MySQL.
+
+    SELECT ... FOR UPDATE вне транзакции открывает её через BEGIN IMMEDIATE:
+    блокировка записи берётся сразу, как блокировка строки в InnoDB, и
+    параллельная транзакция ждёт её (busy_timeout), а не падает при записи.
+    """
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        if _LOCKING_READ.search(query) and not self._cursor.connection.in_transaction:
+            self._cursor.execute("BEGIN IMMEDIATE")
+        self._cursor.execute(_translate(query), params)
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._cursor.executemany(_translate(query), seq_of_params)
+        return self
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SQLiteConnection:
+    """
+    Соединение sqlite3 с интерфейсом, который ждут Database и ConnectionPool.
+    """
+    __slots__ = ("_connection",)
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, buffered=True):
+        # Курсор sqlite3 и так читает строки по мере fetch*, buffered не нужен
+        return SQLiteCursor(self._connection.cursor())
+
+    def ping(self, reconnect=False):
+        self._connection.execute("SELECT 1")
+
+    def is_connected(self):
+        try:
+            self.ping()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class SQLiteBackend:
+    """
+    Встроенная база в файле (журнал WAL: читатели не блокируют писателя).
+    Схему создают миграции (migrations.py).
+    """
+    name = "sqlite"
+    dialect = "sqlite"
+    max_connections = None
+
+    def __init__(self, path=None, busy_timeout=None, foreign_keys=True):
+        self.path = path or config.SQLITE_PATH
+        self.busy_timeout = config.SQLITE_BUSY_TIMEOUT if busy_timeout is None else busy_timeout
+        self.foreign_keys = foreign_keys
+
+    def _open(self):
+        return sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False)
+
+    def _setup(self, connection):
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+
+    def connect(self):
+        connection = self._open()
+        connection.execute(f"PRAGMA foreign_keys = {'ON' if self.foreign_keys else 'OFF'}")
+        self._setup(connection)
+        return SQLiteConnection(connection)
+
+    def on_conflict(self, key_columns):
+        return f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET"
+
+    def inserted(self, column):
+        return f"excluded.{column}"
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(SQLiteBackend):
+    """
+    База SQLite в памяти процесса; данные живут, пока открыт объект.
+    Соединение одно (max_connections = 1): общая память SQLite не поддерживает
+    параллельную запись, поэтому запросы выполняются по очереди.
+    """
+    name = "memory"
+    max_connections = 1
+
+    def __init__(self, busy_timeout=None, foreign_keys=True):
+        super().__init__(f"file:memory-{uuid.uuid4().hex}?mode=memory&cache=shared", busy_timeout, foreign_keys)
+        # Держим базу открытой, пока соединения пула пересоздаются
+        self._keeper = self._open()
+
+    def _open(self):
+        return sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False, uri=True)
+
+    def _setup(self, connection):
+        pass
+
+    def close(self):
+        self._keeper.close()
+
+
+def create_backend(kind):
+    """
+    Создаёт хранилище по имени: "mysql", "sqlite" (файл) или "memory".
+    """
+    if kind == "mysql":
+        return MySQLBackend()
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Неизвестное хранилище базы данных: {kind}")
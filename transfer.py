@@ -0,0 +1,658 @@
+"""
+Потоковый импорт и экспорт пользователей, предметов, персонажей и инвентаря.
+
+    python transfer.py export characters characters.jsonl
+    python transfer.py import users users.csv --hash-workers 8
+    python transfer.py import inventory inventory.jsonl --resume
+
+Формат — JSONL или CSV (по расширению или --format), "-" — stdin/stdout.
+Память не зависит от объёма: записи читаются и пишутся пачками, импорт
+идёт многострочными upsert'ами с commit раз в --commit-rows записей.
+После каждого commit позиция во входном файле сохраняется в
+<файл>.progress, и --resume продолжает с неё. Строки ищутся по ключам
+(username, id, пара character_id/item_id), поэтому повторная запись
+пачки, прерванной между commit и сохранением позиции, ничего не портит.
+
+Пользователи принимаются с готовым password_hash или с password —
+тогда пароли хэшируются пулом процессов (--hash-workers), пока пишется
+предыдущая пачка. У предметов и персонажей id обязателен: на них
+ссылаются персонажи и инвентарь из того же набора файлов. Загружать
+нужно по порядку: users, items, characters, inventory; записи со
+ссылками на несуществующие строки пропускаются с предупреждением.
+
+При шардировании (config.DB_SHARDS) персонажи и инвентарь пишутся на
+шарды, ID персонажа должен указывать на корзину владельца (id % корзин
+= user_id % корзин). Импорт идёт мимо Database: справочник предметов
+работающих серверов обновится через CATALOG_TTL или после перезапуска.
+"""
+import argparse
+import csv
+import functools
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+import config
+import fastjson
+from models import CHARACTER_COLUMNS, STAT_NAMES, validate_character_name
+from shards import create_shard_map
+from storage import DatabaseError, create_backend
+
+ENTITIES = ("users", "items", "characters", "inventory")
+
+# Поля записей и их типы; password — только для импорта
+FIELDS = {
+    "users": {"id": int, "username": str, "password_hash": str, "password": str},
+    "items": dict({"id": int, "name": str, "description": str, "type": str, "weight": float, "value": int},
+                  **{stat: int for stat in STAT_NAMES}),
+    "characters": {column: str if column in ("name", "class", "race") else int
+                   for column in CHARACTER_COLUMNS.split(", ")},
+    "inventory": {"character_id": int, "item_id": int, "quantity": int},
+}
+
+# Значения по умолчанию — как у Database.create_character и add_item
+DEFAULTS = {
+    "items": {"description": "", "weight": 0, "value": 0},
+    "characters": {"class": "", "race": "", "level": 1, "health": 100, "mana": 50, "strength": 10,
+                   "agility": 10, "intelligence": 10, "xp": 0, "gold": 0},
+    "inventory": {"quantity": 1},
+}
+
+REQUIRED = {
+    "users": ("username",),
+    "items": ("id", "name", "type"),
+    "characters": ("id", "user_id", "name"),
+    "inventory": ("character_id", "item_id"),
+}
+
+ITEM_COLUMNS = ("id", "name", "description", "type", "weight", "value")
+
+EXPORTS = {
+    "users": (("id", "username", "password_hash"), "SELECT id, username, password_hash FROM users ORDER BY id"),
+    "items": (ITEM_COLUMNS + STAT_NAMES,
+              f"SELECT {', '.join('items.' + column for column in ITEM_COLUMNS)}, "
+              f"{', '.join('item_stats.' + stat for stat in STAT_NAMES)} "
+              "FROM items LEFT JOIN item_stats ON item_stats.item_id = items.id ORDER BY items.id"),
+    "characters": (tuple(CHARACTER_COLUMNS.split(", ")), f"SELECT {CHARACTER_COLUMNS} FROM characters ORDER BY id"),
+    "inventory": (("character_id", "item_id", "quantity"),
+                  "SELECT character_id, item_id, quantity FROM inventory ORDER BY character_id, item_id"),
+}
+
+# Таблицы, которые при шардировании живут на шардах
+SHARDED_ENTITIES = ("characters", "inventory")
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def convert(entity, record):
+    """
+    Приводит запись из файла к типам полей сущности; неизвестные поля
+    отбрасываются, пустые строки CSV и null — отсутствующее значение.
+    :return: Словарь поле -> значение.
+    :raises ValueError: Если запись не объект, значение не приводится или нет обязательного поля.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    values = {}
+    for field, kind in FIELDS[entity].items():
+        value = record.get(field)
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            raise ValueError(f"{field}: недопустимое значение {value!r}")
+        if kind is int:
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError(f"{field}: ожидается целое, получено {value!r}")
+            value = int(value)
+        elif kind is float:
+            value = float(value)
+        elif not isinstance(value, str):
+            raise ValueError(f"{field}: ожидается строка, получено {value!r}")
+        values[field] = value
+    missing = [field for field in REQUIRED[entity] if field not in values]
+    if missing:
+        raise ValueError(f"нет обязательных полей: {', '.join(missing)}")
+    if entity == "users" and "password_hash" not in values and "password" not in values:
+        raise ValueError("нужен password_hash или password")
+    if entity == "characters" and not validate_character_name(values["name"]):
+        raise ValueError(f"невалидное имя персонажа {values['name']!r}")
+    if entity == "inventory" and values.get("quantity", 1) <= 0:
+        raise ValueError("quantity должно быть положительным")
+    for field, default in DEFAULTS.get(entity, {}).items():
+        values.setdefault(field, default)
+    return values
+
+
+class _Lines:
+    """
+    Строки бинарного файла с учётом смещения после последней отданной строки.
+    """
+    def __init__(self, source, offset=0, line=0):
+        self.source = source
+        self.offset = offset
+        self.line = line
+
+    def __iter__(self):
+        for raw in self.source:
+            self.offset += len(raw)
+            self.line += 1
+            yield raw.decode("utf-8")
+
+
+def read_records(source, fmt, offset=0, line=0):
+    """
+    Читает записи из бинарного файла, начиная с offset (после commit).
+    :return: Итератор (номер строки, смещение после записи, запись).
+    """
+    if fmt == "jsonl":
+        if offset:
+            source.seek(offset)
+        lines = _Lines(source, offset, line)
+        for text in lines:
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as err:
+                record = ValueError(f"некорректный JSON: {err}")
+            yield lines.line, lines.offset, record
+        return
+    # CSV: заголовок читается всегда, затем — с сохранённого смещения
+    if offset:
+        source.seek(0)
+    lines = _Lines(source)
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    if offset:
+        source.seek(offset)
+        lines.offset, lines.line = offset, line
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != len(header):
+            record = ValueError(f"ожидалось {len(header)} колонок, получено {len(row)}")
+        else:
+            record = dict(zip(header, row))
+        yield lines.line, lines.offset, record
+
+
+def write_records(output, fmt, columns, rows):
+    """
+    Пишет строки курсора (кортежи в порядке columns) в JSONL или CSV.
+    :return: Число записанных строк.
+    """
+    count = 0
+    if fmt == "jsonl":
+        for row in rows:
+            output.write(fastjson.dumps(dict(zip(columns, row))) + b"\n")
+            count += 1
+        return count
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        count += 1
+    text.detach()
+    return count
+
+
+class Progress:
+    """
+    Позиция импорта во входном файле; сохраняется после каждого commit.
+    """
+    def __init__(self, path, entity):
+        self.path = path
+        self.entity = entity
+        self.offset = 0
+        self.line = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as source:
+            state = json.load(source)
+        if state.get("entity") != self.entity:
+            raise ValueError(f"{self.path} относится к импорту {state.get('entity')}, а не {self.entity}")
+        self.offset, self.line = state["offset"], state["line"]
+        self.imported, self.rejected = state["imported"], state["rejected"]
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as target:
+            json.dump({"entity": self.entity, "offset": self.offset, "line": self.line,
+                       "imported": self.imported, "rejected": self.rejected}, target)
+        os.replace(temporary, self.path)
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        logging.warning(f"Строка {line} пропущена: {reason}")
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _placeholders(count, width):
+    row = f"({', '.join(['%s'] * width)})"
+    return ", ".join([row] * count)
+
+
+def _in(values):
+    return f"({', '.join(['%s'] * len(values))})"
+
+
+class Importer:
+    """
+    Пишет пачки записей в основную базу и шарды. Соединения (по одному на
+    базу) удерживаются всё время импорта, транзакции закрывает commit().
+    """
+    def __init__(self, backend, shard_map=None):
+        self.backend = backend
+        self.shards = shard_map
+        self.connection = backend.connect()
+        self.cursor = self.connection.cursor()
+        self._shard_connections = {}  # имя шарда -> (соединение, курсор, шард)
+
+    def _shard_cursor(self, shard):
+        entry = self._shard_connections.get(shard.name)
+        if entry is None:
+            connection = shard.pool.acquire()
+            entry = self._shard_connections[shard.name] = (connection, connection.cursor(), shard)
+        return entry[1]
+
+    def _connections(self):
+        return [self.connection] + [entry[0] for entry in self._shard_connections.values()]
+
+    def commit(self):
+        # Сначала шарды: при сбое между commit'ами повтор пачки перезапишет те же ключи
+        for connection in reversed(self._connections()):
+            connection.commit()
+
+    def rollback(self):
+        for connection in self._connections():
+            try:
+                connection.rollback()
+            except DatabaseError as err:
+                logging.error(f"Ошибка при откате импорта: {err}")
+
+    def close(self):
+        for connection, cursor, shard in self._shard_connections.values():
+            cursor.close()
+            shard.pool.release(connection)
+        self._shard_connections = {}
+        self.cursor.close()
+        self.connection.close()
+
+    def _upsert(self, cursor, table, columns, key, rows, extra=(), assignments=None):
+        """
+        Многострочный upsert: строки с одинаковым ключом схлопываются
+        (побеждает последняя — SQLite не меняет строку дважды за запрос).
+        :param extra: Дополнительные присваивания при конфликте.
+        :param assignments: Присваивания вместо "колонка = значение из файла".
+        """
+        unique = {}
+        for row in rows:
+            unique[tuple(row[columns.index(column)] for column in key)] = row
+        if not unique:
+            return
+        if assignments is None:
+            assignments = [f"{column} = {self.backend.inserted(column)}" for column in columns if column not in key]
+        assignments = list(assignments) + list(extra)
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES {_placeholders(len(unique), len(columns))} "
+            f"{self.backend.on_conflict(key)} {', '.join(assignments)}",
+            tuple(value for row in unique.values() for value in row)
+        )
+
+    def _existing(self, cursor, table, column, values):
+        values = sorted(set(values))
+        if not values:
+            return set()
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN {_in(values)}", tuple(values))
+        return {row[0] for row in cursor.fetchall()}
+
+    def _by_shard(self, records, character_id):
+        """
+        Раскладывает записи по курсорам: шарда персонажа или основной базы.
+        :param character_id: Функция запись -> ID персонажа.
+        """
+        if self.shards is None:
+            return [(self.cursor, None, records)]
+        groups = {}
+        for record in records:
+            groups.setdefault(self.shards.for_character(character_id(record)), []).append(record)
+        return [(self._shard_cursor(shard), shard, group) for shard, group in groups.items()]
+
+    def write(self, entity, records, reject):
+        """
+        Записывает пачку записей сущности (без commit).
+        :param records: Список (номер строки, значения) — уже проверенные convert.
+        :param reject: Функция reject(номер строки, причина) для пропущенных записей.
+        :return: Число записанных строк.
+        """
+        return getattr(self, f"_write_{entity}")(records, reject)
+
+    def _write_users(self, records, reject):
+        # Upsert идёт по username, поэтому явный id, уже принадлежащий другому
+        # пользователю (в базе или раньше в пачке), отклоняется заранее
+        holders = {}  # id -> username
+        owners = {}  # username -> id
+        explicit = [values for _, values in records if "id" in values]
+        if explicit:
+            ids = sorted({values["id"] for values in explicit})
+            names = sorted({values["username"] for values in explicit})
+            self.cursor.execute(f"SELECT id, username FROM users WHERE id IN {_in(ids)} OR username IN {_in(names)}",
+                                tuple(ids) + tuple(names))
+            for user_id, username in self.cursor.fetchall():
+                holders[user_id] = username
+                owners[username] = user_id
+        accepted = []
+        for line, values in records:
+            if "id" in values:
+                holder = holders.get(values["id"], values["username"])
+                owner = owners.get(values["username"], values["id"])
+                if holder != values["username"]:
+                    reject(line, f"ID {values['id']} уже занят пользователем {holder}")
+                    continue
+                if owner != values["id"]:
+                    reject(line, f"пользователь {values['username']} уже есть с ID {owner}")
+                    continue
+                holders[values["id"]] = values["username"]
+                owners[values["username"]] = values["id"]
+            accepted.append(values)
+        for with_id in (True, False):
+            columns = ("id", "username", "password_hash") if with_id else ("username", "password_hash")
+            rows = [tuple(values[column] for column in columns)
+                    for values in accepted if ("id" in values) == with_id]
+            if rows:
+                self._upsert(self.cursor, "users", columns, ("username",), rows)
+        return len(accepted)
+
+    def _write_items(self, records, reject):
+        self._upsert(self.cursor, "items", ITEM_COLUMNS, ("id",),
+                     [tuple(values[column] for column in ITEM_COLUMNS) for _, values in records])
+        stats = [(values["id"],) + tuple(values.get(stat) or 0 for stat in STAT_NAMES)
+                 for _, values in records if any(stat in values for stat in STAT_NAMES)]
+        if stats:
+            self._upsert(self.cursor, "item_stats", ("item_id",) + STAT_NAMES, ("item_id",), stats)
+        return len(records)
+
+    def _write_characters(self, records, reject):
+        columns = tuple(CHARACTER_COLUMNS.split(", "))
+        users = self._existing(self.cursor, "users", "id", [values["user_id"] for _, values in records])
+        # Владелец имени: реестр при шардировании, иначе сама таблица персонажей
+        names = sorted({values["name"] for _, values in records})
+        if self.shards is not None:
+            self.cursor.execute(f"SELECT name, character_id FROM character_names WHERE name IN {_in(names)}",
+                                tuple(names))
+        else:
+            self.cursor.execute(f"SELECT name, id FROM characters WHERE name IN {_in(names)}", tuple(names))
+        owners = dict(self.cursor.fetchall())
+        accepted = []
+        for line, values in records:
+            if values["user_id"] not in users:
+                reject(line, f"нет пользователя {values['user_id']}")
+            elif self.shards is not None and values["id"] % self.shards.buckets != values["user_id"] % self.shards.buckets:
+                reject(line, f"ID персонажа {values['id']} не указывает на корзину пользователя {values['user_id']}")
+            elif owners.setdefault(values["name"], values["id"]) != values["id"]:
+                reject(line, f"имя {values['name']} уже занято")
+            else:
+                accepted.append(values)
+        if not accepted:
+            return 0
+        if self.shards is not None:
+            self._upsert(self.cursor, "character_names", ("name", "character_id"), ("name",),
+                         [(values["name"], values["id"]) for values in accepted])
+        for cursor, shard, group in self._by_shard(accepted, lambda values: values["id"]):
+            self._upsert(cursor, "characters", columns, ("id",),
+                         [tuple(values[column] for column in columns) for values in group],
+                         extra=("version = version + 1",))
+            if shard is not None:
+                self._advance_sequences(cursor, [values["id"] for values in group])
+        return len(accepted)
+
+    def _advance_sequences(self, cursor, character_ids):
+        # Счётчики корзин не должны выдать ID, уже занятые импортом
+        buckets = self.shards.buckets
+        last = {}
+        for character_id in character_ids:
+            bucket = character_id % buckets
+            last[bucket] = max(last.get(bucket, 0), character_id // buckets)
+        greatest = "GREATEST" if self.backend.dialect == "mysql" else "MAX"
+        self._upsert(cursor, "id_sequences", ("bucket", "last_value"), ("bucket",), sorted(last.items()),
+                     assignments=[f"last_value = {greatest}(last_value, {self.backend.inserted('last_value')})"])
+
+    def _write_inventory(self, records, reject):
+        items = self._existing(self.cursor, "items", "id", [values["item_id"] for _, values in records])
+        accepted = []
+        for line, values in records:
+            if values["item_id"] not in items:
+                reject(line, f"нет предмета {values['item_id']}")
+            else:
+                accepted.append((line, values))
+        written = 0
+        for cursor, _, group in self._by_shard(accepted, lambda record: record[1]["character_id"]):
+            characters = self._existing(cursor, "characters", "id", [values["character_id"] for _, values in group])
+            rows = []
+            for line, values in group:
+                if values["character_id"] not in characters:
+                    reject(line, f"нет персонажа {values['character_id']}")
+                else:
+                    rows.append((values["character_id"], values["item_id"], values["quantity"]))
+            if not rows:
+                continue
+            self._upsert(cursor, "inventory", ("character_id", "item_id", "quantity"), ("character_id", "item_id"), rows)
+            touched = sorted({row[0] for row in rows})
+            cursor.execute(f"UPDATE characters SET version = version + 1 WHERE id IN {_in(touched)}", tuple(touched))
+            written += len(rows)
+        return written
+
+
+def _batches(records, entity, batch_size, progress):
+    """
+    Проверяет записи и собирает пачки.
+    :return: Итератор (список (номер строки, значения), смещение, номер строки после пачки).
+    """
+    batch = []
+    offset, line = progress.offset, progress.line
+    for line, offset, record in records:
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            batch.append((line, convert(entity, record)))
+        except ValueError as err:
+            progress.reject(line, err)
+        if len(batch) >= batch_size:
+            yield batch, offset, line
+            batch = []
+    if batch or offset != progress.offset:
+        yield batch, offset, line
+
+
+def _hash_passwords(batches, workers):
+    """
+    Заменяет password на password_hash. Пачка хэшируется в пуле процессов,
+    пока пишется предыдущая; workers = 0 — в текущем процессе.
+    """
+    hash_password = functools.partial(generate_password_hash, method=config.HASH_METHOD,
+                                      salt_length=config.HASH_SALT_LENGTH)
+
+    def finish(batch, todo, hashes):
+        for values, password_hash in zip(todo, hashes):
+            values["password_hash"] = password_hash
+            del values["password"]
+        return batch
+
+    def plain(batch):
+        return [values for _, values in batch[0] if "password_hash" not in values]
+
+    if workers == 0:
+        for batch in batches:
+            todo = plain(batch)
+            finish(batch, todo, [hash_password(values["password"]) for values in todo])
+            yield batch
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = None
+        for batch in batches:
+            todo = plain(batch)
+            hashes = executor.map(hash_password, [values["password"] for values in todo],
+                                  chunksize=max(1, len(todo) // (workers * 4)))
+            if pending is not None:
+                yield finish(*pending)
+            pending = (batch, todo, hashes)
+        if pending is not None:
+            yield finish(*pending)
+
+
+def run_import(entity, path, fmt, batch_size=500, commit_rows=20000, hash_workers=None, resume=False):
+    """
+    Загружает записи сущности из файла.
+    :return: Progress с итоговыми счётчиками.
+    """
+    progress = Progress(f"{path}.progress", entity)
+    if path != "-" and os.path.exists(progress.path):
+        if not resume:
+            raise ValueError(f"Найден {progress.path} прерванного импорта: добавьте --resume или удалите файл")
+        progress.load()
+        logging.info(f"Продолжение импорта {entity} со строки {progress.line + 1}")
+    elif resume and path == "-":
+        raise ValueError("--resume недоступен для stdin")
+
+    backend = create_backend(config.DB_BACKEND)
+    shard_map = create_shard_map(config.DB_SHARDS, config.DB_BACKEND, pool_size=1)
+    importer = Importer(backend, shard_map)
+    source = sys.stdin.buffer if path == "-" else open(path, "rb")
+    try:
+        batches = _batches(read_records(source, fmt, progress.offset, progress.line), entity, batch_size, progress)
+        if entity == "users":
+            batches = _hash_passwords(batches, os.cpu_count() if hash_workers is None else hash_workers)
+        uncommitted = 0
+        for batch, offset, line in batches:
+            if batch:
+                progress.imported += importer.write(entity, batch, progress.reject)
+            uncommitted += len(batch)
+            progress.offset, progress.line = offset, line
+            if uncommitted >= commit_rows:
+                importer.commit()
+                if path != "-":
+                    progress.save()
+                uncommitted = 0
+        importer.commit()
+        progress.remove()
+        return progress
+    except BaseException:
+        importer.rollback()
+        raise
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        importer.close()
+        if shard_map is not None:
+            shard_map.close()
+        backend.close()
+
+
+def _stream(connection, query, batch_size):
+    # Небуферизованный курсор: строки приходят с сервера по batch_size за раз
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def run_export(entity, path, fmt, batch_size=1000):
+    """
+    Выгружает сущность в файл; персонажи и инвентарь — со всех шардов по очереди.
+    :return: Число выгруженных записей.
+    """
+    columns, query = EXPORTS[entity]
+    backend = create_backend(config.DB_BACKEND)
+    shard_map = None
+    if entity in SHARDED_ENTITIES:
+        shard_map = create_shard_map(config.DB_SHARDS, config.DB_BACKEND, pool_size=1)
+    connection = backend.connect() if shard_map is None else None
+    output = sys.stdout.buffer if path == "-" else open(path, "wb")
+    try:
+        if shard_map is None:
+            rows = _stream(connection, query, batch_size)
+        else:
+            rows = (row for shard in shard_map.shards for row in _stream_shard(shard, query, batch_size))
+        return write_records(output, fmt, columns, rows)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+        else:
+            output.flush()
+        if connection is not None:
+            connection.rollback()
+            connection.close()
+        if shard_map is not None:
+            shard_map.close()
+        backend.close()
+
+
+def _stream_shard(shard, query, batch_size):
+    connection = shard.pool.acquire()
+    try:
+        yield from _stream(connection, query, batch_size)
+        connection.rollback()
+    finally:
+        shard.pool.release(connection)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый импорт и экспорт данных (JSONL, CSV)")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("entity", choices=ENTITIES)
+    parser.add_argument("path", help='Файл .jsonl или .csv; "-" — stdin/stdout')
+    parser.add_argument("--format", choices=("jsonl", "csv"), help="По умолчанию — по расширению файла")
+    parser.add_argument("--batch-size", type=int, default=500, help="Записей в одном многострочном запросе")
+    parser.add_argument("--commit-rows", type=int, default=20000, help="Записей в одной транзакции импорта")
+    parser.add_argument("--hash-workers", type=int, default=None,
+                        help="Процессов для хэширования паролей (по умолчанию — число ядер, 0 — без пула)")
+    parser.add_argument("--resume", action="store_true", help="Продолжить прерванный импорт")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    fmt = detect_format(args.path, args.format)
+    started = time.monotonic()
+    try:
+        if args.command == "export":
+            count = run_export(args.entity, args.path, fmt, args.batch_size)
+            logging.info(f"Exported {count} {args.entity} in {time.monotonic() - started:.1f}s")
+        else:
+            progress = run_import(args.entity, args.path, fmt, args.batch_size, args.commit_rows,
+                                  args.hash_workers, args.resume)
+            logging.info(f"Imported {progress.imported} {args.entity}, rejected {progress.rejected} "
+                         f"in {time.monotonic() - started:.1f}s")
+    except KeyboardInterrupt:
+        hint = "; продолжить: --resume" if args.command == "import" and args.path != "-" else ""
+        parser.exit(130, f"Прервано{hint}\n")
+    except (ValueError, OSError) as err:
+        parser.exit(2, f"{err}\n")
+    except DatabaseError as err:
+        parser.exit(1, f"Ошибка базы данных: {err}\n")
+
+
+if __name__ == "__main__":
+    main()
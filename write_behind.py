@@ -0,0 +1,136 @@
+import atexit
+import logging
+import threading
+import time
+
+
+class WriteBehindBuffer:
+    """
+    Отложенная запись приращений характеристик персонажей.
+
+    Приращения (xp, gold, health, ...) складываются в памяти по персонажу и
+    сбрасываются в базу пачкой: раз в interval секунд или сразу, когда
+    накопилось max_pending персонажей. Тысячи мелких UPDATE превращаются
+    в один многострочный UPDATE на пачку.
+
+    Несброшенные приращения теряются при аварийном завершении процесса;
+    при штатной остановке (close или выход интерпретатора) они записываются.
+    """
+    def __init__(self, flush_func, interval=1.0, max_pending=1000):
+        """
+        :param flush_func: Функция flush_func(deltas) — записывает словарь
+            character_id -> {поле: приращение}; при ошибке бросает исключение.
+            Если записана только часть (например, упал один шард), возвращает
+            словарь незаписанных приращений — они остаются в буфере.
+        :param interval: Период сброса, секунды.
+        :param max_pending: Сколько персонажей накопить до внеочередного сброса.
+        """
+        self._flush_func = flush_func
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}  # character_id -> {поле: приращение}
+        self._lock = threading.Lock()
+        # Сброс выполняет только один поток за раз
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._stats = {"added": 0, "flushes": 0, "flushed_rows": 0, "failures": 0, "flush_time": 0.0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, character_id, deltas):
+        """
+        Добавляет приращения персонажу; нулевые игнорируются.
+        """
+        with self._lock:
+            entry = self._pending.setdefault(character_id, {})
+            for field, delta in deltas.items():
+                if delta:
+                    entry[field] = entry.get(field, 0) + delta
+            self._stats["added"] += 1
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def take(self, character_id):
+        """
+        Забирает несброшенные приращения персонажа (для синхронной записи).
+        :return: Словарь {поле: приращение}, возможно пустой.
+        """
+        with self._lock:
+            return self._pending.pop(character_id, None) or {}
+
+    def hold(self):
+        """
+        Блокировка сброса: пока она взята, фоновая пачка не пишется.
+        Используется синхронной записью, чтобы не обогнать уже забранную пачку.
+        """
+        return self._flush_lock
+
+    def restore(self, deltas):
+        """
+        Возвращает в буфер приращения, которые не удалось записать,
+        складывая их с пришедшими за это время.
+        :param deltas: Словарь character_id -> {поле: приращение}.
+        """
+        with self._lock:
+            for character_id, fields in deltas.items():
+                entry = self._pending.setdefault(character_id, {})
+                for field, delta in fields.items():
+                    entry[field] = entry.get(field, 0) + delta
+
+    def flush(self):
+        """
+        Записывает всё накопленное.
+        :return: True, если запись прошла успешно или писать было нечего.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = {character_id: fields for character_id, fields in self._pending.items() if fields}
+                self._pending = {}
+            if not batch:
+                return True
+            started = time.perf_counter()
+            try:
+                failed = self._flush_func(batch)
+            except Exception as err:
+                self.restore(batch)
+                self._stats["failures"] += 1
+                logging.error(f"Отложенная запись {len(batch)} персонажей не удалась, повторим позже: {err}")
+                return False
+            self._stats["flushes"] += 1
+            self._stats["flushed_rows"] += len(batch) - len(failed or ())
+            self._stats["flush_time"] += time.perf_counter() - started
+            if failed:
+                self.restore(failed)
+                self._stats["failures"] += 1
+                logging.error(f"Отложенная запись {len(failed)} из {len(batch)} персонажей не удалась, повторим позже")
+                return False
+            return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Останавливает фоновый сброс и записывает остаток.
+        """
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        if not self.flush():
+            with self._lock:
+                lost = len(self._pending)
+            logging.error(f"При остановке не записаны приращения {lost} персонажей")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        return stats